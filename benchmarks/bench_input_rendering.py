@@ -0,0 +1,89 @@
+"""
+Compares rendering RADDOSE-3D input text with RadDoseInput.write against the
+previous yaml.dump based implementation of RadDose3D._create_input_txt_file.
+
+    $ poetry run python benchmarks/bench_input_rendering.py --inputs 5000
+"""
+
+import argparse
+import time
+from io import StringIO
+
+import yaml
+
+from py_raddose_3d.schemas.input import Beam, Crystal, RadDoseInput, Wedge
+
+
+def legacy_render(rad_dose_input: RadDoseInput) -> str:
+    """
+    The yaml round-trip previously used by RadDose3D._create_input_txt_file
+    """
+    yaml_input = yaml.dump(
+        rad_dose_input.model_dump(exclude_none=True), sort_keys=False
+    ).splitlines()
+    buffer = StringIO()
+    for line in yaml_input:
+        if line.lower() != "wedge:":
+            buffer.write(line.replace(":", "").replace("- Wedge", "Wedge") + "\n")
+        else:
+            buffer.write("# wedge" + "\n")
+    return buffer.getvalue()
+
+
+def make_inputs(n: int) -> list[RadDoseInput]:
+    crystal = Crystal(
+        Type="Cuboid",
+        Dimensions=(100, 80, 60),
+        PixelsPerMicron=0.5,
+        AbsCoefCalc="RD3D",
+        UnitCell=(78.02, 78.02, 78.02),
+        NumMonomers=24,
+        NumResidues=51,
+        ProteinHeavyAtoms=("Zn", 0.333, "S", 6),
+        SolventHeavyConc=("P", 425),
+        SolventFraction=0.64,
+    )
+    inputs = []
+    for i in range(n):
+        beam = Beam(
+            Type="Gaussian",
+            Flux=1e11 * (1 + i % 50),
+            FWHM=(20, 70),
+            Energy=12.1,
+            Collimation=("Rectangular", 100, 100),
+        )
+        wedges = [
+            Wedge(Wedge=(0, 90), ExposureTime=1 + i % 20, AngularResolution=1),
+            Wedge(Wedge=(90, 180), ExposureTime=1 + i % 20, AngularResolution=1),
+        ]
+        inputs.append(RadDoseInput(crystal=crystal, beam=beam, wedge=wedges))
+    return inputs
+
+
+def time_renderer(renderer, inputs: list[RadDoseInput]) -> float:
+    start = time.perf_counter()
+    for rad_dose_input in inputs:
+        renderer(rad_dose_input)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--inputs", type=int, default=5000)
+    args = parser.parse_args()
+
+    inputs = make_inputs(args.inputs)
+    legacy = time_renderer(legacy_render, inputs)
+    direct = time_renderer(RadDoseInput.to_raddose_text, inputs)
+    print(f"{args.inputs} inputs")
+    print(
+        f"yaml round-trip : {legacy:.3f}s ({1e6 * legacy / args.inputs:.1f} us/input)"
+    )
+    print(
+        f"direct writer   : {direct:.3f}s ({1e6 * direct / args.inputs:.1f} us/input)"
+    )
+    print(f"speed-up        : {legacy / direct:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
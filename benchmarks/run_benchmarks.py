@@ -0,0 +1,533 @@
+"""
+Benchmark suite of the wrapper. The "fast" tier covers schema construction and
+validation, input rendering, stdout scanning, Summary and DoseState parsing,
+the overhead of launching a run and batch surrogate model predictions, and
+checks the import time of the wrapper against a budget, using the stand-in
+java of the tests, tests/fake_java.py, in place of raddose3d.jar so that no
+Java is needed. The "jar" tier runs the real raddose3d.jar, and is skipped when java
+or the jar is not available.
+
+Results are saved to benchmarks/results/<version>.json and compared with the
+results of the previous version found there, or with --baseline:
+
+    $ poetry run python benchmarks/run_benchmarks.py
+    $ poetry run python benchmarks/run_benchmarks.py --tier fast --quick
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+from importlib import metadata
+from os import listdir, makedirs, path
+from typing import Callable
+
+import pandas as pd
+
+import py_raddose_3d
+from py_raddose_3d.dose_state import load_dose_state
+from py_raddose_3d.dose_stats import DoseStatistics
+from py_raddose_3d.jvm import JVMOptions
+from py_raddose_3d.progress import StdoutParser
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.schemas.input import Beam, Crystal, RadDoseInput, Wedge
+from py_raddose_3d.summary import Summary
+from py_raddose_3d.surrogate import SurrogateModel, feature_matrix
+
+BENCHMARK_DIRECTORY = path.dirname(path.abspath(__file__))
+RESULTS_DIRECTORY = path.join(BENCHMARK_DIRECTORY, "results")
+FAKE_JAVA = path.join(path.dirname(BENCHMARK_DIRECTORY), "tests", "fake_java.py")
+# Makes the stand-in write outputs of realistic size, see tests/fake_java.py
+FULL_OUTPUTS = "-Dfake_java.outputs=full"
+
+# Budget of "import py_raddose_3d.raddose3d" in a fresh interpreter, which must
+# also not import any of HEAVY_MODULES
+IMPORT_TIME_BUDGET_S = 0.5
+HEAVY_MODULES = ("pandas", "numpy")
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import py_raddose_3d.raddose3d
+elapsed = time.perf_counter() - start
+heavy = [m for m in sys.argv[1:] if m in sys.modules]
+print(elapsed, *heavy)
+"""
+
+
+class StandInRadDose3D(RadDose3D):
+    """
+    RadDose3D running the stand-in tests/fake_java.py instead of raddose3d.jar
+    """
+
+    def _command(self) -> list[str]:
+        return [
+            sys.executable,
+            FAKE_JAVA,
+            FULL_OUTPUTS,
+            "-jar",
+            self.raddose_3d_path,
+            "-i",
+            self.input_text_file_path,
+            "-p",
+            self.prefix,
+        ]
+
+
+def crystal_kwargs(**overrides) -> dict:
+    kwargs = dict(
+        Type="Cuboid",
+        Dimensions=(100, 80, 60),
+        PixelsPerMicron=0.5,
+        AbsCoefCalc="RD3D",
+        UnitCell=(78.02, 78.02, 78.02),
+        NumMonomers=24,
+        NumResidues=51,
+        ProteinHeavyAtoms=("Zn", 0.333, "S", 6),
+        SolventHeavyConc=("P", 425),
+        SolventFraction=0.64,
+    )
+    kwargs.update(overrides)
+    return kwargs
+
+
+def beam_kwargs() -> dict:
+    return dict(
+        Type="Gaussian",
+        Flux=2e12,
+        FWHM=(20, 70),
+        Energy=12.1,
+        Collimation=("Rectangular", 100, 100),
+    )
+
+
+def wedge_kwargs(start: float = 0, stop: float = 360) -> dict:
+    return dict(Wedge=(start, stop), ExposureTime=50, AngularResolution=2)
+
+
+def measure(func: Callable[[], object], repeat: int, number: int = 1) -> dict:
+    """
+    Times number calls of func, repeat times, and returns the per-call times
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def bench_import_time(work_directory: str, quick: bool) -> dict:
+    """
+    Time to import the wrapper in a fresh interpreter, as a command line tool
+    or a serverless function does on every invocation
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = path.pathsep.join(
+        [path.dirname(BENCHMARK_DIRECTORY)]
+        + env.get("PYTHONPATH", "").split(path.pathsep)
+    )
+    times = []
+    heavy_modules: set[str] = set()
+    for _ in range(3 if quick else 10):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT, *HEAVY_MODULES],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=env,
+            cwd=work_directory,
+        ).stdout.split()
+        times.append(float(output[0]))
+        heavy_modules.update(output[1:])
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "repeat": len(times),
+        "number": 1,
+        "budget_s": IMPORT_TIME_BUDGET_S,
+        "heavy_modules": sorted(heavy_modules),
+    }
+
+
+def check_import_budget(results: dict) -> bool:
+    """
+    Whether the import_time benchmark, if run, is within its budget
+    """
+    result = results["benchmarks"].get("import_time")
+    if result is None:
+        return True
+    within = True
+    if result["median_s"] > result["budget_s"]:
+        print(
+            f"Import time {result['median_s']:.3f} s exceeds the budget of "
+            f"{result['budget_s']} s"
+        )
+        within = False
+    if result["heavy_modules"]:
+        print(f"Importing the wrapper imports {', '.join(result['heavy_modules'])}")
+        within = False
+    return within
+
+
+def bench_schema_construction(work_directory: str, quick: bool) -> dict:
+    def build() -> None:
+        Crystal(**crystal_kwargs())
+        Beam(**beam_kwargs())
+        Wedge(**wedge_kwargs())
+
+    return measure(build, repeat=5, number=100 if quick else 1000)
+
+
+def bench_input_validation(work_directory: str, quick: bool) -> dict:
+    crystal = Crystal(**crystal_kwargs())
+    beam = Beam(**beam_kwargs())
+    wedges = [Wedge(**wedge_kwargs(0, 90)), Wedge(**wedge_kwargs(90, 180))]
+    return measure(
+        lambda: RadDoseInput(crystal=crystal, beam=beam, wedge=wedges),
+        repeat=5,
+        number=100 if quick else 1000,
+    )
+
+
+def bench_input_rendering(work_directory: str, quick: bool) -> dict:
+    rad_dose_input = RadDoseInput(
+        crystal=Crystal(**crystal_kwargs()),
+        beam=Beam(**beam_kwargs()),
+        wedge=[Wedge(**wedge_kwargs(0, 90)), Wedge(**wedge_kwargs(90, 180))],
+    )
+    return measure(
+        rad_dose_input.to_raddose_text, repeat=5, number=100 if quick else 1000
+    )
+
+
+def bench_stdout_scanning(work_directory: str, quick: bool) -> dict:
+    lines = []
+    for wedge in range(1, 11):
+        lines.append(f"Wedge {wedge}:")
+        lines += [f"Exposing angle {a / 10:.2f} deg" for a in range(0, 3600, 2)]
+    lines += ["* WARNING *", "Angular resolution too big"]
+    stdout = "\n".join(lines).encode()
+
+    return measure(
+        lambda: StdoutParser("benchmark").feed_all(stdout), repeat=3 if quick else 10
+    )
+
+
+def _stand_in_outputs(
+    work_directory: str, pixels_per_micron: float, wedges: int = 10
+) -> StandInRadDose3D:
+    sample = StandInRadDose3D(
+        sample_id=f"outputs_{pixels_per_micron}",
+        crystal=Crystal(**crystal_kwargs(PixelsPerMicron=pixels_per_micron)),
+        beam=Beam(**beam_kwargs()),
+        wedge=[Wedge(**wedge_kwargs(36 * i, 36 * (i + 1))) for i in range(wedges)],
+        output_directory=work_directory,
+    )
+    if not path.isfile(sample.prefix + "DoseState.csv"):
+        sample.run()
+    return sample
+
+
+def bench_summary_parsing(work_directory: str, quick: bool) -> dict:
+    sample = _stand_in_outputs(work_directory, 0.5)
+    return measure(sample._read_summary, repeat=5, number=20 if quick else 200)
+
+
+def bench_summary_parsing_light(work_directory: str, quick: bool) -> dict:
+    sample = _stand_in_outputs(work_directory, 0.5)
+    sample.as_frame = False
+    return measure(sample._read_summary, repeat=5, number=20 if quick else 200)
+
+
+def bench_dose_state_parsing(work_directory: str, quick: bool) -> dict:
+    # 100x80x60 um at 1 pixel per micron: 480,000 voxels
+    sample = _stand_in_outputs(work_directory, 0.5 if quick else 1.0)
+    csv_path = sample.prefix + "DoseState.csv"
+    result = measure(
+        lambda: load_dose_state(csv_path, sidecar=False), repeat=3 if quick else 5
+    )
+    result["rows"] = sum(1 for _ in open(csv_path))
+    return result
+
+
+def bench_dose_statistics(work_directory: str, quick: bool) -> dict:
+    sample = _stand_in_outputs(work_directory, 0.5 if quick else 1.0)
+    csv_path = sample.prefix + "DoseState.csv"
+    return measure(
+        lambda: DoseStatistics().update_from_csv(csv_path), repeat=3 if quick else 5
+    )
+
+
+def bench_launch_overhead(work_directory: str, quick: bool) -> dict:
+    """
+    A complete run of a tiny crystal with the stand-in, which does no work:
+    directory and input file creation, process launch, stdout streaming and
+    Summary parsing
+    """
+    crystal = Crystal(**crystal_kwargs(Dimensions=(10, 10, 10), PixelsPerMicron=0.5))
+    beam = Beam(**beam_kwargs())
+    wedge = Wedge(**wedge_kwargs(0, 10))
+    counter = iter(range(10**6))
+
+    def run() -> None:
+        StandInRadDose3D(
+            sample_id=f"launch_{next(counter)}",
+            crystal=crystal,
+            beam=beam,
+            wedge=wedge,
+            output_directory=work_directory,
+        ).run()
+
+    return measure(run, repeat=3 if quick else 10)
+
+
+def bench_surrogate_prediction(work_directory: str, quick: bool) -> dict:
+    """
+    Batch prediction of a SurrogateModel fitted to synthetic runs, whose dose
+    is a power law of flux, exposure time, beam and crystal size
+    """
+    rng = random.Random(0)
+    inputs = []
+    model = SurrogateModel(min_records=50)
+    for _ in range(200):
+        flux = 10 ** rng.uniform(11, 13)
+        exposure_time = rng.uniform(1, 100)
+        fwhm = rng.uniform(10, 80)
+        size = rng.uniform(20, 200)
+        rad_dose_input = RadDoseInput(
+            crystal=Crystal(**crystal_kwargs(Dimensions=(size, size, size))),
+            beam=Beam(**dict(beam_kwargs(), Flux=flux, FWHM=(fwhm, fwhm))),
+            wedge=Wedge(**dict(wedge_kwargs(0, 90), ExposureTime=exposure_time)),
+        )
+        dose = 1e-11 * flux * exposure_time / fwhm**1.5 * size**0.3
+        model.record(
+            rad_dose_input,
+            Summary({"Average DWD": [dose], "Max Dose": [3 * dose]}),
+            refit=False,
+        )
+        inputs.append(rad_dose_input)
+    model.fit()
+
+    features, _ = feature_matrix(inputs)
+    rows = 10_000 if quick else 100_000
+    batch = features[[i % len(features) for i in range(rows)]]
+    result = measure(lambda: model.predict(batch), repeat=5)
+    result["rows"] = rows
+    result["rows_per_s"] = rows / result["median_s"]
+    return result
+
+
+def bench_jar_run(work_directory: str, quick: bool) -> dict:
+    crystal = Crystal(**crystal_kwargs(PixelsPerMicron=0.2 if quick else 0.5))
+    beam = Beam(**beam_kwargs())
+    wedge = Wedge(**wedge_kwargs(0, 90))
+    counter = iter(range(10**6))
+
+    def run() -> None:
+        RadDose3D(
+            sample_id=f"jar_{next(counter)}",
+            crystal=crystal,
+            beam=beam,
+            wedge=wedge,
+            output_directory=work_directory,
+        ).run()
+
+    return measure(run, repeat=1 if quick else 3)
+
+
+def bench_jar_startup_cds(work_directory: str, quick: bool) -> dict:
+    """
+    Runs of a tiny crystal with a class data sharing archive, created by an
+    untimed first run. The metrics of the runs report the saving over the
+    startup of that first run
+    """
+    crystal = Crystal(**crystal_kwargs(Dimensions=(10, 10, 10), PixelsPerMicron=0.5))
+    beam = Beam(**beam_kwargs())
+    wedge = Wedge(**wedge_kwargs(0, 10))
+    jvm_options = JVMOptions(
+        class_data_sharing=True, archive_directory=path.join(work_directory, "cds")
+    )
+    counter = iter(range(10**6))
+    savings = []
+
+    def run() -> None:
+        summary = RadDose3D(
+            sample_id=f"cds_{next(counter)}",
+            crystal=crystal,
+            beam=beam,
+            wedge=wedge,
+            output_directory=work_directory,
+            jvm_options=jvm_options,
+        ).run()
+        savings.append(summary.attrs["metrics"]["startup_saving_s"])
+
+    run()
+    savings.clear()
+    result = measure(run, repeat=3 if quick else 10)
+    measured = [saving for saving in savings if saving is not None]
+    result["startup_saving_s"] = statistics.median(measured) if measured else None
+    return result
+
+
+BENCHMARKS = {
+    "fast": {
+        "import_time": bench_import_time,
+        "schema_construction": bench_schema_construction,
+        "input_validation": bench_input_validation,
+        "input_rendering": bench_input_rendering,
+        "stdout_scanning": bench_stdout_scanning,
+        "summary_parsing": bench_summary_parsing,
+        "summary_parsing_light": bench_summary_parsing_light,
+        "dose_state_parsing": bench_dose_state_parsing,
+        "dose_statistics": bench_dose_statistics,
+        "launch_overhead": bench_launch_overhead,
+        "surrogate_prediction": bench_surrogate_prediction,
+    },
+    "jar": {
+        "jar_run": bench_jar_run,
+        "jar_startup_cds": bench_jar_startup_cds,
+    },
+}
+
+
+def jar_available() -> bool:
+    jar = path.join(path.dirname(py_raddose_3d.__file__), "raddose3d.jar")
+    return shutil.which("java") is not None and path.isfile(jar)
+
+
+def package_version() -> str:
+    try:
+        return metadata.version("py-raddose-3d")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARK_DIRECTORY,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(version: str) -> str | None:
+    """
+    The most recently saved results of another version
+    """
+    if not path.isdir(RESULTS_DIRECTORY):
+        return None
+    candidates = [
+        path.join(RESULTS_DIRECTORY, name)
+        for name in listdir(RESULTS_DIRECTORY)
+        if name.endswith(".json") and name != f"{version}.json"
+    ]
+    return max(candidates, key=path.getmtime, default=None)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> pd.DataFrame:
+    rows = []
+    for name, result in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        before = baseline["benchmarks"][name]["median_s"]
+        ratio = result["median_s"] / before
+        rows.append(
+            {
+                "benchmark": name,
+                "baseline_s": before,
+                "current_s": result["median_s"],
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tier", choices=["fast", "jar", "all"], default="all")
+    parser.add_argument("--quick", action="store_true", help="fewer, smaller runs")
+    parser.add_argument("--version", default=None, help="label of the results")
+    parser.add_argument("--baseline", default=None, help="results file to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slow-down reported as a regression",
+    )
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+    # The wrapper's INFO messages are not shown, as in an application that does
+    # not configure logging
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.simplefilter("ignore", RuntimeWarning)
+
+    tiers = ["fast", "jar"] if args.tier == "all" else [args.tier]
+    if "jar" in tiers and not jar_available():
+        print("java or raddose3d.jar not available, skipping the jar tier")
+        tiers.remove("jar")
+
+    version = args.version or package_version()
+    results = {
+        "version": version,
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory() as work_directory:
+        for tier in tiers:
+            for name, benchmark in BENCHMARKS[tier].items():
+                result = benchmark(work_directory, args.quick)
+                result["tier"] = tier
+                results["benchmarks"][name] = result
+                print(f"{name:<22} {1e3 * result['median_s']:>12.4f} ms")
+
+    baseline_path = args.baseline or previous_results(version)
+    if baseline_path is not None:
+        with open(baseline_path) as fp:
+            baseline = json.load(fp)
+        print(f"\nCompared with {baseline['version']} ({baseline_path}):")
+        comparison = compare(results, baseline, args.threshold)
+        print(comparison.to_string(index=False))
+        if comparison["regression"].any():
+            print("\nRegressions found")
+
+    if not args.no_save:
+        makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        results_path = path.join(RESULTS_DIRECTORY, f"{version}.json")
+        with open(results_path, "w") as fp:
+            json.dump(results, fp, indent=2)
+        print(f"\nResults saved to {results_path}")
+
+    if not check_import_budget(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
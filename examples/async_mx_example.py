@@ -5,10 +5,17 @@ can be executed asynchronously
 """
 
 import asyncio
+import logging
 
 from py_raddose_3d.raddose3d import RadDose3D
 from py_raddose_3d.schemas.input import Beam, Crystal, Wedge
 
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    datefmt="%d-%m-%Y %H:%M:%S",
+)
+
 crystal = Crystal(
     Type="Cuboid",
     Dimensions=(100, 100, 100),
@@ -4,11 +4,18 @@ experiment where a crystal of insulin is exposed to a Gaussian profile X-ray bea
 seconds with a 90 degrees rotation (example taken from the the main RADDOSE-3D repository)
 """
 
+import logging
 from os import path
 
 from py_raddose_3d.raddose3d import RadDose3D
 from py_raddose_3d.schemas.input import Beam, Crystal, Wedge
 
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    datefmt="%d-%m-%Y %H:%M:%S",
+)
+
 crystal = Crystal(
     GoniometerAxis=90,
     Type="Cuboid",
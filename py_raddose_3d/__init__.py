@@ -0,0 +1,5 @@
+import logging
+
+# The package logs to module loggers under "py_raddose_3d" and leaves the logging
+# configuration to the application, e.g. logging.basicConfig(level=logging.INFO)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
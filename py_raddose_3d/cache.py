@@ -0,0 +1,406 @@
+import hashlib
+import json
+import logging
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from glob import escape, glob
+from os import listdir, makedirs, path, replace, stat, utime
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+from .schemas.input import RadDoseInput
+
+if TYPE_CHECKING:
+    from .schemas.assets import AssetResolver
+
+logger = logging.getLogger(__name__)
+
+_jar_fingerprints: dict[tuple[str, int, int], bytes] = {}
+
+
+def file_digest(file_path: str) -> bytes:
+    """
+    Returns the sha256 digest of the contents of a file
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the file
+
+    Returns
+    -------
+    bytes
+        The digest, or a marker if the file does not exist
+    """
+    if not path.isfile(file_path):
+        return b"missing:" + file_path.encode("utf-8")
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def jar_fingerprint(raddose_3d_path: str) -> bytes:
+    """
+    Returns a fingerprint of the RADDOSE-3D jar, memoised on the path,
+    modification time and size of the jar so that it is only hashed once
+
+    Parameters
+    ----------
+    raddose_3d_path : str
+        Path of the raddose3d.jar file
+
+    Returns
+    -------
+    bytes
+        The fingerprint of the jar
+    """
+    try:
+        jar_stat = stat(raddose_3d_path)
+    except OSError:
+        return b"no-jar"
+    memo_key = (raddose_3d_path, jar_stat.st_mtime_ns, jar_stat.st_size)
+    if memo_key not in _jar_fingerprints:
+        _jar_fingerprints[memo_key] = file_digest(raddose_3d_path)
+    return _jar_fingerprints[memo_key]
+
+
+def referenced_files(rad_dose_input: RadDoseInput) -> list[str]:
+    """
+    Returns the files an input refers to, whose contents affect the result
+
+    Parameters
+    ----------
+    rad_dose_input : RadDoseInput
+        The raddose input pydantic model
+
+    Returns
+    -------
+    list[str]
+        The paths of the SeqFile, ModelFile, CIF and beam File, when set
+    """
+    crystal = rad_dose_input.crystal
+    candidates = [
+        crystal.SeqFile,
+        crystal.ModelFile,
+        crystal.CIF,
+        rad_dose_input.beam.File,
+    ]
+    return [file for file in candidates if file is not None]
+
+
+def canonical_input(rad_dose_input: RadDoseInput) -> str:
+    """
+    Serializes an input canonically: keys are sorted, fields that are None are
+    left out and a single wedge is equivalent to a list of one wedge
+
+    Parameters
+    ----------
+    rad_dose_input : RadDoseInput
+        The raddose input pydantic model
+
+    Returns
+    -------
+    str
+        A JSON representation of the input
+    """
+    wedges = rad_dose_input.wedge
+    if not isinstance(wedges, list):
+        wedges = [wedges]
+    canonical = {
+        "crystal": rad_dose_input.crystal.model_dump(exclude_none=True),
+        "beam": rad_dose_input.beam.model_dump(exclude_none=True),
+        "wedge": [wedge.model_dump(exclude_none=True) for wedge in wedges],
+    }
+    return json.dumps(canonical, sort_keys=True)
+
+
+def input_key(
+    rad_dose_input: RadDoseInput,
+    raddose_3d_path: str,
+    assets: "AssetResolver | None" = None,
+) -> str:
+    """
+    Computes the content address of a RADDOSE-3D run: a hash of the canonical
+    serialization of the input, the jar and every file referenced by the input
+
+    Parameters
+    ----------
+    rad_dose_input : RadDoseInput
+        The raddose input pydantic model
+    raddose_3d_path : str
+        Path of the raddose3d.jar file
+    assets : AssetResolver | None, optional
+        If given, the referenced files and a mirrored Pdb are replaced by their
+        digests in the asset cache before serializing the input, so that the
+        key depends on their contents and not on their paths, by default None
+
+    Returns
+    -------
+    str
+        A hex digest identifying the run
+    """
+    files = referenced_files(rad_dose_input)
+    if assets is not None:
+        rad_dose_input = assets.content_addressed(rad_dose_input)
+        files = []
+    digest = hashlib.sha256()
+    digest.update(canonical_input(rad_dose_input).encode("utf-8"))
+    digest.update(jar_fingerprint(raddose_3d_path))
+    for file in files:
+        digest.update(file_digest(file))
+    return digest.hexdigest()
+
+
+def collect_outputs(prefix: str) -> dict[str, bytes]:
+    """
+    Reads the output files RADDOSE-3D wrote for a prefix
+
+    Parameters
+    ----------
+    prefix : str
+        The output prefix of the run
+
+    Returns
+    -------
+    dict[str, bytes]
+        The contents of each output, keyed by the file name without the prefix
+    """
+    outputs = {}
+    for file_path in glob(escape(prefix) + "*"):
+        if path.isfile(file_path):
+            with open(file_path, "rb") as fp:
+                outputs[file_path[len(prefix) :]] = fp.read()
+    return outputs
+
+
+def restore_outputs(prefix: str, outputs: dict[str, bytes]) -> None:
+    """
+    Writes cached outputs back to disk under a prefix
+
+    Parameters
+    ----------
+    prefix : str
+        The output prefix of the run
+    outputs : dict[str, bytes]
+        The contents of each output, keyed by the file name without the prefix
+    """
+    for suffix, contents in outputs.items():
+        with open(prefix + suffix, "wb") as fp:
+            fp.write(contents)
+
+
+class ResultCache(ABC):
+    """
+    Base class of the RADDOSE-3D result caches. An entry maps an input key
+    (see input_key) to the output files of the run
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> dict[str, bytes] | None:
+        """
+        Returns the outputs stored under key, or None on a miss
+        """
+
+    @abstractmethod
+    def put(self, key: str, outputs: dict[str, bytes]) -> None:
+        """
+        Stores outputs under key, evicting entries as required
+        """
+
+
+class MemoryCache(ResultCache):
+    """
+    An in-process least-recently-used cache
+    """
+
+    def __init__(
+        self,
+        max_entries: int | None = 128,
+        max_bytes: int | None = None,
+        max_age: float | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        max_entries : int | None, optional
+            Maximum number of entries, by default 128
+        max_bytes : int | None, optional
+            Maximum total size of the stored outputs in bytes, by default None
+        max_age : float | None, optional
+            Maximum age of an entry in seconds, by default None
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries: OrderedDict[str, tuple[float, int, dict[str, bytes]]] = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> dict[str, bytes] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, size, outputs = entry
+            if self.max_age is not None and time.time() - created > self.max_age:
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return outputs
+
+    def put(self, key: str, outputs: dict[str, bytes]) -> None:
+        size = sum(len(contents) for contents in outputs.values())
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (time.time(), size, outputs)
+            self._bytes += size
+            while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+
+class DiskCache(ResultCache):
+    """
+    An on-disk cache, one directory per entry. Entries are written to a
+    temporary directory and renamed into place, so concurrent processes can
+    share the same cache directory. The modification time of an entry is
+    refreshed on every hit and is used for least-recently-used eviction
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int | None = None,
+        max_age: float | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        directory : str
+            The cache directory. It is created if it does not exist
+        max_bytes : int | None, optional
+            Maximum total size of the cache in bytes, by default None
+        max_age : float | None, optional
+            Maximum time in seconds since an entry was last used,
+            by default None
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        makedirs(directory, exist_ok=True)
+
+    def _entry_directory(self, key: str) -> str:
+        return path.join(self.directory, key)
+
+    def get(self, key: str) -> dict[str, bytes] | None:
+        entry_directory = self._entry_directory(key)
+        manifest_path = path.join(entry_directory, "manifest.json")
+        try:
+            if (
+                self.max_age is not None
+                and time.time() - stat(entry_directory).st_mtime > self.max_age
+            ):
+                shutil.rmtree(entry_directory, ignore_errors=True)
+                return None
+            with open(manifest_path) as fp:
+                suffixes = json.load(fp)
+            outputs = {}
+            for i, suffix in enumerate(suffixes):
+                with open(path.join(entry_directory, str(i)), "rb") as fp:
+                    outputs[suffix] = fp.read()
+        except (OSError, ValueError):
+            return None
+        utime(entry_directory)
+        return outputs
+
+    def put(self, key: str, outputs: dict[str, bytes]) -> None:
+        temporary_directory = path.join(self.directory, f".tmp-{uuid4().hex}")
+        makedirs(temporary_directory)
+        suffixes = list(outputs)
+        for i, suffix in enumerate(suffixes):
+            with open(path.join(temporary_directory, str(i)), "wb") as fp:
+                fp.write(outputs[suffix])
+        with open(path.join(temporary_directory, "manifest.json"), "w") as fp:
+            json.dump(suffixes, fp)
+
+        entry_directory = self._entry_directory(key)
+        shutil.rmtree(entry_directory, ignore_errors=True)
+        try:
+            replace(temporary_directory, entry_directory)
+        except OSError:
+            # Another process stored the same entry concurrently
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes entries older than max_age, then the least recently used
+        entries until the cache is smaller than max_bytes
+        """
+        if self.max_bytes is None and self.max_age is None:
+            return
+
+        entries = []
+        for name in listdir(self.directory):
+            entry_directory = path.join(self.directory, name)
+            if name.startswith(".tmp-") or not path.isdir(entry_directory):
+                continue
+            try:
+                last_used = stat(entry_directory).st_mtime
+                size = sum(
+                    stat(path.join(entry_directory, file)).st_size
+                    for file in listdir(entry_directory)
+                )
+            except OSError:
+                continue
+            entries.append((last_used, size, entry_directory))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for last_used, size, entry_directory in entries:
+            expired = self.max_age is not None and now - last_used > self.max_age
+            oversized = self.max_bytes is not None and total > self.max_bytes
+            if not (expired or oversized):
+                continue
+            shutil.rmtree(entry_directory, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted cached result {path.basename(entry_directory)}")
+
+
+class TieredCache(ResultCache):
+    """
+    Chains caches from fastest to slowest, e.g. a MemoryCache in front of a
+    DiskCache. Hits in a slower cache are copied into the faster ones
+    """
+
+    def __init__(self, *caches: ResultCache) -> None:
+        self.caches = caches
+
+    def get(self, key: str) -> dict[str, bytes] | None:
+        for i, cache in enumerate(self.caches):
+            outputs = cache.get(key)
+            if outputs is not None:
+                for faster_cache in self.caches[:i]:
+                    faster_cache.put(key, outputs)
+                return outputs
+        return None
+
+    def put(self, key: str, outputs: dict[str, bytes]) -> None:
+        for cache in self.caches:
+            cache.put(key, outputs)
@@ -0,0 +1,268 @@
+import json
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from os import makedirs, path
+from typing import TYPE_CHECKING
+
+from .schemas.input import RadDoseInput
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# RADDOSE-3D defaults assumed when the corresponding fields are not set
+DEFAULT_PIXELS_PER_MICRON = 0.5
+DEFAULT_ANGULAR_RESOLUTION = 2.0
+
+RUNTIME_FEATURES = (
+    "constant",
+    "voxels",
+    "voxel_steps",
+    "spectrum_voxel_steps",
+    "photons",
+)
+MEMORY_FEATURES = ("constant", "voxels", "photons")
+
+# Rough coefficients used until enough runs have been recorded on this machine
+DEFAULT_RUNTIME_COEFFICIENTS = (1.0, 1e-6, 2e-7, 4e-6, 1e-6)
+DEFAULT_MEMORY_COEFFICIENTS = (150.0, 2e-4, 1e-6)
+
+
+def _floats(value: str | float | None) -> list[float]:
+    if value is None:
+        return []
+    if isinstance(value, (int, float)):
+        return [float(value)]
+    return [float(item) for item in str(value).split()]
+
+
+def crystal_volume(rad_dose_input: RadDoseInput) -> float:
+    """
+    The crystal volume in cubic micrometers, from its Type and Dimensions. The
+    bounding box is used for polyhedra, whose shape comes from the ModelFile
+    """
+    crystal = rad_dose_input.crystal
+    dimensions = _floats(crystal.Dimensions)
+    crystal_type = crystal.Type.lower()
+    if crystal_type == "spherical":
+        return math.pi / 6 * dimensions[0] ** 3
+    if crystal_type == "cylinder":
+        diameter, height = (dimensions + dimensions)[:2]
+        return math.pi / 4 * diameter**2 * height
+    return math.prod((dimensions * 3)[:3])
+
+
+def cost_features(rad_dose_input: RadDoseInput) -> dict[str, float]:
+    """
+    The quantities the cost of a RADDOSE-3D run is driven by
+
+    Parameters
+    ----------
+    rad_dose_input : RadDoseInput
+        The raddose input pydantic model
+
+    Returns
+    -------
+    dict[str, float]
+        The number of voxels, voxels times angular steps (with a separate term
+        when an energy spectrum is simulated) and Monte Carlo photons
+    """
+    crystal = rad_dose_input.crystal
+    pixels_per_micron = crystal.PixelsPerMicron or DEFAULT_PIXELS_PER_MICRON
+    voxels = crystal_volume(rad_dose_input) * pixels_per_micron**3
+
+    wedges = rad_dose_input.wedge
+    if not isinstance(wedges, list):
+        wedges = [wedges]
+    steps = 0.0
+    for wedge in wedges:
+        start, stop = _floats(wedge.Wedge)[:2]
+        resolution = wedge.AngularResolution or DEFAULT_ANGULAR_RESOLUTION
+        steps += max(1.0, abs(stop - start) / resolution)
+
+    photons = 0.0
+    if (crystal.Subprogram or "").lower() == "montecarlo":
+        photons = float(crystal.Runs or 1) * float(crystal.SimPhotons or 0)
+
+    spectrum = bool(rad_dose_input.beam.EnergyFWHM)
+    return {
+        "constant": 1.0,
+        "voxels": voxels,
+        "voxel_steps": 0.0 if spectrum else voxels * steps,
+        "spectrum_voxel_steps": voxels * steps if spectrum else 0.0,
+        "photons": photons,
+    }
+
+
+@dataclass(frozen=True)
+class CostEstimate:
+    """
+    Predicted runtime and peak memory of a RADDOSE-3D run
+    """
+
+    runtime_s: float
+    memory_mb: float
+
+    def timeout(self, safety_factor: float = 3.0, minimum: float = 60.0) -> float:
+        """
+        A timeout in seconds leaving room for the uncertainty of the estimate
+        """
+        return max(minimum, self.runtime_s * safety_factor)
+
+    def heap_mb(self, headroom: float = 1.5, minimum: int = 256) -> int:
+        """
+        A JVM maximum heap size in MB for the run
+        """
+        return max(minimum, int(math.ceil(self.memory_mb * headroom)))
+
+
+def _fit(rows: "np.ndarray", targets: "np.ndarray", defaults: tuple) -> list[float]:
+    """
+    Least squares fit with non-negative coefficients: features whose
+    coefficient comes out negative are dropped, i.e. get a coefficient of 0,
+    and the fit is repeated. Features that never vary in the recorded runs keep
+    their default
+    """
+    import numpy as np
+
+    coefficients = np.array(defaults, dtype=np.float64)
+    active = [i for i in range(rows.shape[1]) if i == 0 or np.ptp(rows[:, i]) > 0]
+    fixed = [i for i in range(rows.shape[1]) if i not in active]
+    residual_targets = targets - rows[:, fixed] @ coefficients[fixed]
+    coefficients[active] = 0.0
+    while active:
+        solution, *_ = np.linalg.lstsq(rows[:, active], residual_targets, rcond=None)
+        if (solution >= 0).all():
+            coefficients[active] = solution
+            break
+        active = [i for i, c in zip(active, solution) if c > 0]
+    return coefficients.tolist()
+
+
+class CostModel:
+    """
+    Predicts the runtime and peak memory of RADDOSE-3D runs from their inputs
+    with linear models in the features of cost_features.
+
+    Measured runs are recorded to a JSON lines file and the models are refitted
+    from them, so predictions become specific to the local machine. Until
+    min_records runs have been recorded, rough default coefficients are used.
+    """
+
+    def __init__(self, history_path: str | None = None, min_records: int = 10) -> None:
+        """
+        Parameters
+        ----------
+        history_path : str | None, optional
+            File the measured runs are appended to and read from. If None,
+            measurements are only kept in memory, by default None
+        min_records : int, optional
+            Number of recorded runs needed before the models are fitted,
+            by default 10
+        """
+        if history_path is not None:
+            history_path = path.expanduser(history_path)
+        self.history_path = history_path
+        self.min_records = min_records
+        self.runtime_coefficients = list(DEFAULT_RUNTIME_COEFFICIENTS)
+        self.memory_coefficients = list(DEFAULT_MEMORY_COEFFICIENTS)
+        self._records: list[dict] = []
+        self._lock = threading.Lock()
+
+        if history_path is not None and path.isfile(history_path):
+            with open(history_path) as fp:
+                for line in fp:
+                    if line.strip():
+                        self._records.append(json.loads(line))
+            self.fit()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def record(
+        self,
+        rad_dose_input: RadDoseInput,
+        runtime_s: float,
+        memory_mb: float | None = None,
+    ) -> None:
+        """
+        Records a measured run and refits the models
+
+        Parameters
+        ----------
+        rad_dose_input : RadDoseInput
+            The input of the run
+        runtime_s : float
+            Measured wall time in seconds
+        memory_mb : float | None, optional
+            Measured peak memory of the java process in MB, by default None
+        """
+        record = {
+            "features": cost_features(rad_dose_input),
+            "runtime_s": runtime_s,
+            "memory_mb": memory_mb,
+        }
+        with self._lock:
+            self._records.append(record)
+            if self.history_path is not None:
+                makedirs(path.dirname(path.abspath(self.history_path)), exist_ok=True)
+                with open(self.history_path, "a") as fp:
+                    fp.write(json.dumps(record) + "\n")
+            self.fit()
+
+    def fit(self) -> None:
+        """
+        Refits the runtime and memory models from the recorded runs
+        """
+        import numpy as np
+
+        runtime_records = self._records
+        if len(runtime_records) >= self.min_records:
+            rows = np.array(
+                [[r["features"][f] for f in RUNTIME_FEATURES] for r in runtime_records]
+            )
+            targets = np.array([r["runtime_s"] for r in runtime_records])
+            self.runtime_coefficients = _fit(
+                rows, targets, DEFAULT_RUNTIME_COEFFICIENTS
+            )
+
+        memory_records = [r for r in self._records if r["memory_mb"] is not None]
+        if len(memory_records) >= self.min_records:
+            rows = np.array(
+                [[r["features"][f] for f in MEMORY_FEATURES] for r in memory_records]
+            )
+            targets = np.array([r["memory_mb"] for r in memory_records])
+            self.memory_coefficients = _fit(rows, targets, DEFAULT_MEMORY_COEFFICIENTS)
+        logger.debug(
+            f"Cost model fitted on {len(runtime_records)} runs: "
+            f"runtime {self.runtime_coefficients}, memory {self.memory_coefficients}"
+        )
+
+    def estimate(self, rad_dose_input: RadDoseInput) -> CostEstimate:
+        """
+        Predicts the runtime and peak memory of a run
+
+        Parameters
+        ----------
+        rad_dose_input : RadDoseInput
+            The input of the run
+
+        Returns
+        -------
+        CostEstimate
+            The predicted runtime and memory
+        """
+        features = cost_features(rad_dose_input)
+        runtime = sum(
+            c * features[f] for c, f in zip(self.runtime_coefficients, RUNTIME_FEATURES)
+        )
+        memory = sum(
+            c * features[f] for c, f in zip(self.memory_coefficients, MEMORY_FEATURES)
+        )
+        return CostEstimate(runtime_s=runtime, memory_mb=memory)
+
+
+default_cost_model = CostModel()
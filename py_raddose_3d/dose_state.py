@@ -0,0 +1,238 @@
+import json
+from dataclasses import dataclass
+from os import makedirs, path, replace, stat
+
+import numpy as np
+import pandas as pd
+
+DOSE_STATE_COLUMNS = ["x", "y", "z", "MGy"]
+
+
+@dataclass(frozen=True)
+class DoseGrid:
+    """
+    The dose of every voxel of a RADDOSE-3D run as a dense 3-D array.
+    dose[i, j, k] is the dose in MGy at (x[i], y[j], z[k]); voxels of the
+    bounding box that are not part of the crystal hold NaN
+    """
+
+    dose: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    z: np.ndarray
+
+    def to_sparse(self) -> "SparseDoseGrid":
+        indices = np.argwhere(~np.isnan(self.dose)).astype(np.int32)
+        return SparseDoseGrid(
+            indices=indices,
+            dose=np.asarray(self.dose[tuple(indices.T)], dtype=np.float32),
+            x=self.x,
+            y=self.y,
+            z=self.z,
+        )
+
+
+@dataclass(frozen=True)
+class SparseDoseGrid:
+    """
+    The dose of the crystal voxels of a RADDOSE-3D run in coordinate format.
+    dose[n] is the dose in MGy at (x[i], y[j], z[k]) with i, j, k = indices[n]
+    """
+
+    indices: np.ndarray
+    dose: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    z: np.ndarray
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return len(self.x), len(self.y), len(self.z)
+
+    def to_dense(self) -> DoseGrid:
+        dose = np.full(self.shape, np.nan, dtype=np.float32)
+        dose[tuple(self.indices.T)] = self.dose
+        return DoseGrid(dose=dose, x=self.x, y=self.y, z=self.z)
+
+
+def sidecar_directory(csv_path: str) -> str:
+    """
+    The directory holding the binary sidecar of a DoseState.csv file
+    """
+    return csv_path + ".npy.d"
+
+
+def _fingerprint(csv_path: str) -> dict:
+    csv_stat = stat(csv_path)
+    return {"size": csv_stat.st_size, "mtime_ns": csv_stat.st_mtime_ns}
+
+
+def _parse_csv(csv_path: str, chunksize: int) -> SparseDoseGrid:
+    """
+    Parses a DoseState.csv file in chunks, keeping only the coordinate and
+    dose columns
+    """
+    coordinates = []
+    doses = []
+    reader = pd.read_csv(
+        csv_path,
+        header=None,
+        names=DOSE_STATE_COLUMNS,
+        usecols=[0, 1, 2, 3],
+        dtype={"x": np.float64, "y": np.float64, "z": np.float64, "MGy": np.float32},
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        coordinates.append(chunk[["x", "y", "z"]].to_numpy())
+        doses.append(chunk["MGy"].to_numpy())
+
+    if coordinates:
+        xyz = np.concatenate(coordinates)
+        dose = np.concatenate(doses)
+    else:
+        xyz = np.empty((0, 3))
+        dose = np.empty(0, dtype=np.float32)
+
+    # Coordinates are written as text, round them so that the same grid
+    # position always maps to the same axis value
+    axes = []
+    indices = np.empty(xyz.shape, dtype=np.int32)
+    for axis in range(3):
+        values, inverse = np.unique(np.round(xyz[:, axis], 6), return_inverse=True)
+        axes.append(values)
+        indices[:, axis] = inverse.ravel()
+
+    return SparseDoseGrid(indices=indices, dose=dose, x=axes[0], y=axes[1], z=axes[2])
+
+
+def _save_array(file_path: str, array: np.ndarray) -> None:
+    temporary_path = file_path + ".tmp"
+    with open(temporary_path, "wb") as fp:
+        np.save(fp, array)
+    replace(temporary_path, file_path)
+
+
+def write_sidecar(csv_path: str, grid: SparseDoseGrid, dense: bool) -> None:
+    """
+    Writes the binary sidecar of a DoseState.csv file
+
+    Parameters
+    ----------
+    csv_path : str
+        Path of the DoseState.csv file
+    grid : SparseDoseGrid
+        The parsed dose state
+    dense : bool
+        Also write the dense 3-D array, so that it can be memory-mapped
+    """
+    directory = sidecar_directory(csv_path)
+    makedirs(directory, exist_ok=True)
+    _save_array(path.join(directory, "indices.npy"), grid.indices)
+    _save_array(path.join(directory, "dose.npy"), grid.dose)
+    for name in ("x", "y", "z"):
+        _save_array(path.join(directory, f"{name}.npy"), getattr(grid, name))
+    if dense:
+        _save_array(path.join(directory, "dense.npy"), grid.to_dense().dose)
+
+    # The metadata is written last: a sidecar without it is ignored
+    temporary_path = path.join(directory, "metadata.json.tmp")
+    with open(temporary_path, "w") as fp:
+        json.dump({"source": _fingerprint(csv_path), "dense": dense}, fp)
+    replace(temporary_path, path.join(directory, "metadata.json"))
+
+
+def _read_sidecar(csv_path: str, sparse: bool) -> DoseGrid | SparseDoseGrid | None:
+    directory = sidecar_directory(csv_path)
+    try:
+        with open(path.join(directory, "metadata.json")) as fp:
+            metadata = json.load(fp)
+        if metadata["source"] != _fingerprint(csv_path):
+            return None
+        if not sparse and not metadata["dense"]:
+            return None
+
+        axes = {name: np.load(path.join(directory, f"{name}.npy")) for name in "xyz"}
+        if sparse:
+            return SparseDoseGrid(
+                indices=np.load(path.join(directory, "indices.npy"), mmap_mode="r"),
+                dose=np.load(path.join(directory, "dose.npy"), mmap_mode="r"),
+                **axes,
+            )
+        return DoseGrid(
+            dose=np.load(path.join(directory, "dense.npy"), mmap_mode="r"), **axes
+        )
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_dose_state(file_path: str, grid: SparseDoseGrid) -> None:
+    """
+    Saves a dose state in a compressed binary .npz file, a compact replacement
+    for DoseState.csv that load_dose_state reads
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the .npz file
+    grid : SparseDoseGrid
+        The dose state
+    """
+    temporary_path = file_path + ".tmp"
+    with open(temporary_path, "wb") as fp:
+        np.savez_compressed(
+            fp, indices=grid.indices, dose=grid.dose, x=grid.x, y=grid.y, z=grid.z
+        )
+    replace(temporary_path, file_path)
+
+
+def _read_npz(file_path: str) -> SparseDoseGrid:
+    with np.load(file_path) as arrays:
+        return SparseDoseGrid(**{name: arrays[name] for name in arrays.files})
+
+
+def load_dose_state(
+    csv_path: str,
+    sparse: bool = False,
+    sidecar: bool = True,
+    chunksize: int = 1_000_000,
+) -> DoseGrid | SparseDoseGrid:
+    """
+    Loads a RADDOSE-3D DoseState.csv file as NumPy arrays.
+
+    The CSV is parsed once and a binary sidecar is written next to it
+    (<csv_path>.npy.d). Later loads memory-map the sidecar instead of parsing
+    the CSV, as long as the CSV has not changed since. A gzipped CSV, or a
+    .npz file written by save_dose_state, can be loaded too.
+
+    Parameters
+    ----------
+    csv_path : str
+        Path of the DoseState.csv file
+    sparse : bool, optional
+        Return the dose of the crystal voxels only, which is much smaller than
+        the dense grid when most of the bounding box is empty, by default False
+    sidecar : bool, optional
+        Read and write the binary sidecar, by default True
+    chunksize : int, optional
+        Number of CSV rows parsed at a time, by default 1,000,000
+
+    Returns
+    -------
+    DoseGrid | SparseDoseGrid
+        The dose state, as a dense grid unless sparse=True
+    """
+    if csv_path.endswith(".npz"):
+        parsed = _read_npz(csv_path)
+        return parsed if sparse else parsed.to_dense()
+    if sidecar:
+        grid = _read_sidecar(csv_path, sparse)
+        if grid is not None:
+            return grid
+
+    parsed = _parse_csv(csv_path, chunksize)
+    if sidecar:
+        write_sidecar(csv_path, parsed, dense=not sparse)
+        grid = _read_sidecar(csv_path, sparse)
+        if grid is not None:
+            return grid
+    return parsed if sparse else parsed.to_dense()
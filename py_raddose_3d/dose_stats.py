@@ -0,0 +1,236 @@
+import math
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """
+    A mergeable sketch answering quantile queries with a bounded relative error,
+    using logarithmically spaced buckets (as in DDSketch). Memory grows with the
+    logarithm of the range of the values, not with their number
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        """
+        Parameters
+        ----------
+        relative_accuracy : float, optional
+            Maximum relative error of the returned quantiles, by default 0.01
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Adds non-negative values to the sketch
+        """
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+        keys, counts = np.unique(
+            np.ceil(np.log(positive) / self._log_gamma).astype(np.int64),
+            return_counts=True,
+        )
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self._buckets[key] = self._buckets.get(key, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        Adds the values of another sketch with the same relative accuracy
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracies")
+        for key, count in other._buckets.items():
+            self._buckets[key] = self._buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the q-quantile, 0 <= q <= 1, or NaN if the sketch is empty
+        """
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if seen > rank:
+                return 2 * self._gamma**key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+
+class DoseStatistics:
+    """
+    Constant-memory statistics of the voxel doses of one or more RADDOSE-3D
+    runs: count, maximum, mean, a histogram, percentiles and the average dose
+    above thresholds. Doses are added in chunks, and statistics of separate
+    runs can be merged.
+    """
+
+    def __init__(
+        self,
+        bin_width: float = 0.1,
+        bins: Sequence[float] | None = None,
+        thresholds: Sequence[float] = (0.0,),
+        percentiles: Sequence[float] = (50, 90, 95, 99),
+        relative_accuracy: float = 0.01,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        bin_width : float, optional
+            Width in MGy of the histogram bins, which start at 0 and are added
+            as larger doses are seen. Ignored if bins is given, by default 0.1
+        bins : Sequence[float] | None, optional
+            Fixed, increasing histogram bin edges in MGy. Doses outside the
+            edges are not counted in the histogram, by default None
+        thresholds : Sequence[float], optional
+            Average doses are reported over the voxels with a dose above each
+            threshold. The default of 0 gives the average dose over the exposed
+            region, by default (0.0,)
+        percentiles : Sequence[float], optional
+            Percentiles reported by to_dict, by default (50, 90, 95, 99)
+        relative_accuracy : float, optional
+            Relative accuracy of the percentiles, by default 0.01
+        """
+        self.bin_width = bin_width
+        self.bins = None if bins is None else np.asarray(bins, dtype=np.float64)
+        self.thresholds = tuple(thresholds)
+        self.percentiles = tuple(percentiles)
+        self.sketch = QuantileSketch(relative_accuracy)
+
+        self.count = 0
+        self.total = 0.0
+        self.max = -math.inf
+        self._counts = np.zeros(
+            0 if self.bins is None else len(self.bins) - 1, dtype=np.int64
+        )
+        self._threshold_sums = np.zeros(len(self.thresholds))
+        self._threshold_counts = np.zeros(len(self.thresholds), dtype=np.int64)
+
+    def update(self, dose: np.ndarray) -> None:
+        """
+        Adds voxel doses in MGy. NaNs (voxels outside the crystal) are ignored
+        """
+        dose = np.asarray(dose, dtype=np.float64).ravel()
+        dose = dose[~np.isnan(dose)]
+        if len(dose) == 0:
+            return
+
+        self.count += len(dose)
+        self.total += float(dose.sum())
+        self.max = max(self.max, float(dose.max()))
+        self.sketch.update(dose)
+
+        if self.bins is None:
+            indices = np.floor(dose / self.bin_width).astype(np.int64)
+            counts = np.bincount(np.clip(indices, 0, None))
+            if len(counts) > len(self._counts):
+                self._counts = np.pad(
+                    self._counts, (0, len(counts) - len(self._counts))
+                )
+            self._counts[: len(counts)] += counts
+        else:
+            self._counts += np.histogram(dose, bins=self.bins)[0]
+
+        for i, threshold in enumerate(self.thresholds):
+            above = dose[dose > threshold]
+            self._threshold_sums[i] += above.sum()
+            self._threshold_counts[i] += len(above)
+
+    def update_from_csv(self, csv_path: str, chunksize: int = 1_000_000) -> None:
+        """
+        Adds the doses of a DoseState.csv file, reading only the dose column
+        chunksize rows at a time
+        """
+        reader = pd.read_csv(
+            csv_path,
+            header=None,
+            usecols=[3],
+            dtype={3: np.float64},
+            chunksize=chunksize,
+        )
+        for chunk in reader:
+            self.update(chunk[3].to_numpy())
+
+    def merge(self, other: "DoseStatistics") -> None:
+        """
+        Adds the statistics of another DoseStatistics with the same settings
+        """
+        if (
+            self.bin_width != other.bin_width
+            or self.thresholds != other.thresholds
+            or (self.bins is None) != (other.bins is None)
+            or (self.bins is not None and not np.array_equal(self.bins, other.bins))
+        ):
+            raise ValueError("Cannot merge DoseStatistics with different settings")
+
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        if len(other._counts) > len(self._counts):
+            self._counts = np.pad(
+                self._counts, (0, len(other._counts) - len(self._counts))
+            )
+        self._counts[: len(other._counts)] += other._counts
+        self._threshold_sums += other._threshold_sums
+        self._threshold_counts += other._threshold_counts
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    def histogram(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the bin counts and the bin edges in MGy
+        """
+        if self.bins is not None:
+            return self._counts.copy(), self.bins.copy()
+        edges = np.arange(len(self._counts) + 1) * self.bin_width
+        return self._counts.copy(), edges
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns the q-th percentile of the dose, 0 <= q <= 100
+        """
+        return self.sketch.quantile(q / 100)
+
+    def threshold_average(self, threshold: float) -> float:
+        """
+        Returns the average dose over the voxels with a dose above threshold,
+        which must be one of the thresholds given to the constructor
+        """
+        i = self.thresholds.index(threshold)
+        if self._threshold_counts[i] == 0:
+            return math.nan
+        return float(self._threshold_sums[i] / self._threshold_counts[i])
+
+    def to_dict(self) -> dict:
+        """
+        Returns the statistics as a dictionary
+        """
+        counts, edges = self.histogram()
+        return {
+            "count": self.count,
+            "max": self.max if self.count else math.nan,
+            "mean": self.mean,
+            "percentiles": {q: self.percentile(q) for q in self.percentiles},
+            "threshold_averages": {
+                threshold: self.threshold_average(threshold)
+                for threshold in self.thresholds
+            },
+            "histogram": {"counts": counts.tolist(), "edges": edges.tolist()},
+        }
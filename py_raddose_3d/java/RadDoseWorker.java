@@ -0,0 +1,142 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.jar.JarFile;
+
+/**
+ * Long-lived RADDOSE-3D worker used by py_raddose_3d.worker_pool.
+ *
+ * Launched with the RADDOSE-3D jar on the classpath, it resolves the jar's
+ * Main-Class once and then serves requests read line by line from stdin:
+ *
+ *   PING                      -> PONG
+ *   RUN\t[input]\t[prefix]    -> DONE [status] [stdout bytes] [stderr bytes]
+ *                                followed by the raw stdout and stderr bytes
+ *   QUIT                      -> exits
+ *
+ * The job's own stdout and stderr are captured so that the protocol stream
+ * is never mixed with RADDOSE-3D output. The status is 0 on success, the
+ * status passed to System.exit by the job, or 1 if it threw an exception.
+ * System.exit is trapped on JVMs that still allow a SecurityManager; on
+ * others it ends the worker, which py_raddose_3d.worker_pool then replaces.
+ */
+public class RadDoseWorker {
+    /** Thrown in place of exiting the JVM when a job calls System.exit */
+    static final class ExitTrappedException extends SecurityException {
+        final int status;
+
+        ExitTrappedException(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    /** Turns System.exit calls into ExitTrappedException while armed */
+    @SuppressWarnings("removal")
+    static final class ExitGuard extends SecurityManager {
+        volatile boolean armed;
+
+        @Override
+        public void checkExit(int status) {
+            if (armed) {
+                throw new ExitTrappedException(status);
+            }
+        }
+
+        @Override
+        public void checkPermission(Permission permission) {
+        }
+
+        @Override
+        public void checkPermission(Permission permission, Object context) {
+        }
+    }
+
+    @SuppressWarnings("removal")
+    private static ExitGuard installExitGuard() {
+        ExitGuard guard = new ExitGuard();
+        try {
+            System.setSecurityManager(guard);
+            return guard;
+        } catch (UnsupportedOperationException | SecurityException e) {
+            return null;
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        String mainClassName;
+        try (JarFile jar = new JarFile(args[0])) {
+            mainClassName = jar.getManifest().getMainAttributes().getValue("Main-Class");
+        }
+        Method entryPoint = Class.forName(mainClassName).getMethod("main", String[].class);
+
+        PrintStream protocol = new PrintStream(
+            new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        PrintStream originalOut = System.out;
+        PrintStream originalErr = System.err;
+        BufferedReader requests = new BufferedReader(
+            new InputStreamReader(System.in, StandardCharsets.UTF_8));
+
+        ExitGuard exitGuard = installExitGuard();
+
+        protocol.println("READY");
+        String line;
+        while ((line = requests.readLine()) != null) {
+            if (line.equals("PING")) {
+                protocol.println("PONG");
+                continue;
+            }
+            if (line.equals("QUIT")) {
+                break;
+            }
+            String[] job = line.split("\t", -1);
+            if (job.length != 3 || !job[0].equals("RUN")) {
+                protocol.println("ERROR unknown request");
+                continue;
+            }
+
+            ByteArrayOutputStream out = new ByteArrayOutputStream();
+            ByteArrayOutputStream err = new ByteArrayOutputStream();
+            PrintStream jobOut = new PrintStream(out, true, "UTF-8");
+            PrintStream jobErr = new PrintStream(err, true, "UTF-8");
+            int status = 0;
+            System.setOut(jobOut);
+            System.setErr(jobErr);
+            if (exitGuard != null) {
+                exitGuard.armed = true;
+            }
+            try {
+                entryPoint.invoke(null, (Object) new String[] {"-i", job[1], "-p", job[2]});
+            } catch (InvocationTargetException e) {
+                if (e.getCause() instanceof ExitTrappedException) {
+                    status = ((ExitTrappedException) e.getCause()).status;
+                } else {
+                    status = 1;
+                    e.getCause().printStackTrace(jobErr);
+                }
+            } finally {
+                if (exitGuard != null) {
+                    exitGuard.armed = false;
+                }
+                System.setOut(originalOut);
+                System.setErr(originalErr);
+                jobOut.flush();
+                jobErr.flush();
+            }
+
+            byte[] stdout = out.toByteArray();
+            byte[] stderr = err.toByteArray();
+            protocol.println("DONE " + status + " " + stdout.length + " " + stderr.length);
+            protocol.write(stdout);
+            protocol.write(stderr);
+            protocol.flush();
+        }
+    }
+}
@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+from functools import cached_property
+
+from .cache import canonical_input
+from .schemas.input import Beam, Crystal, RadDoseInput, Wedge
+
+
+@dataclass(frozen=True, eq=False)
+class RadDoseJob:
+    """
+    An immutable description of a RADDOSE-3D run. Unlike RadDose3D, creating a
+    job does not touch the filesystem, and jobs are hashable and picklable so
+    that they can be deduplicated, used as dictionary keys and sent to worker
+    processes cheaply. Build a runnable RadDose3D with RadDose3D.from_job.
+
+    Two jobs are equal when they have the same sample id, output directory and
+    canonical input (see py_raddose_3d.cache.canonical_input).
+    """
+
+    sample_id: str
+    crystal: Crystal
+    beam: Beam
+    wedge: Wedge | tuple[Wedge, ...]
+    output_directory: str | None = None
+
+    def __post_init__(self) -> None:
+        if isinstance(self.wedge, list):
+            object.__setattr__(self, "wedge", tuple(self.wedge))
+
+    @property
+    def wedges(self) -> Wedge | list[Wedge]:
+        """
+        The wedge(s) in the form RadDose3D and RadDoseInput expect
+        """
+        return list(self.wedge) if isinstance(self.wedge, tuple) else self.wedge
+
+    def to_input(self) -> RadDoseInput:
+        return RadDoseInput(crystal=self.crystal, beam=self.beam, wedge=self.wedges)
+
+    @cached_property
+    def canonical_input(self) -> str:
+        return canonical_input(self.to_input())
+
+    def _identity(self) -> tuple[str, str | None, str]:
+        return self.sample_id, self.output_directory, self.canonical_input
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, RadDoseJob):
+            return NotImplemented
+        return self._identity() == other._identity()
+
+    def __hash__(self) -> int:
+        return hash(self._identity())
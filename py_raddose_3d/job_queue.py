@@ -0,0 +1,483 @@
+import hashlib
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from os import getpid
+from typing import Iterator
+
+import pandas as pd
+
+from .cache import canonical_input
+from .raddose3d import RadDose3D
+from .schemas.input import RadDoseInput
+from .summary import Summary
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT NOT NULL UNIQUE,
+    sample_id TEXT NOT NULL,
+    output_directory TEXT,
+    input TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, id);
+"""
+
+
+@dataclass(frozen=True)
+class QueuedJob:
+    """
+    A job claimed from a JobQueue
+    """
+
+    id: int
+    sample_id: str
+    input: RadDoseInput
+    output_directory: str | None
+    attempts: int
+    lease_owner: str
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{getpid()}"
+
+
+class JobQueue:
+    """
+    A persistent queue of RADDOSE-3D jobs in a SQLite database, shared by any
+    number of producers and worker processes.
+
+    Workers claim a job with a lease, which they renew while the job runs. If a
+    worker dies, its job becomes claimable again once the lease expires, or
+    immediately by a worker restarted with the same worker id. Completed jobs
+    keep their summary and are never run again; a job that fails max_attempts
+    times is marked failed with its last error.
+
+    Workers on several hosts can share a database on a network filesystem if it
+    supports POSIX locks reliably; use journal_mode="DELETE" there, since the
+    default write-ahead log needs shared memory on a single host. Leases
+    compare wall-clock times, so the hosts' clocks must be synchronised.
+    """
+
+    def __init__(
+        self,
+        database_path: str,
+        lease_seconds: float = 600.0,
+        max_attempts: int = 3,
+        journal_mode: str = "WAL",
+        busy_timeout: float = 60.0,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        database_path : str
+            Path of the SQLite database, created if it does not exist
+        lease_seconds : float, optional
+            Duration of a claim, renewed by heartbeats, by default 600
+        max_attempts : int, optional
+            Number of times a job is attempted before it is marked failed,
+            by default 3
+        journal_mode : str, optional
+            SQLite journal mode, by default "WAL"
+        busy_timeout : float, optional
+            Seconds to wait for a lock held by another process, by default 60
+        """
+        self.database_path = database_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.busy_timeout = busy_timeout
+
+        with self._connect() as connection:
+            connection.execute(f"PRAGMA journal_mode={journal_mode}")
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(
+            self.database_path, timeout=self.busy_timeout, isolation_level=None
+        )
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        A write transaction, which takes the database lock immediately so that
+        two workers cannot claim the same job
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def enqueue(
+        self,
+        rad_dose_input: RadDoseInput,
+        sample_id: str,
+        output_directory: str | None = None,
+        priority: float = 0.0,
+    ) -> int:
+        """
+        Adds a job to the queue. Enqueuing the same sample id, output directory
+        and input again returns the existing job instead of adding a new one
+
+        Parameters
+        ----------
+        rad_dose_input : RadDoseInput
+            The input of the run
+        sample_id : str
+            Sample id
+        output_directory : str | None, optional
+            Output directory of the worker. If output_directory=None, the
+            worker's current working directory is used, by default None
+        priority : float, optional
+            Jobs with a lower priority value are claimed first, by default 0
+
+        Returns
+        -------
+        int
+            The job id
+        """
+        job_key = hashlib.sha256(
+            "\0".join(
+                [sample_id, output_directory or "", canonical_input(rad_dose_input)]
+            ).encode()
+        ).hexdigest()
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO jobs (job_key, sample_id, output_directory, "
+                "input, priority, status, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_key,
+                    sample_id,
+                    output_directory,
+                    rad_dose_input.model_dump_json(exclude_none=True),
+                    priority,
+                    QUEUED,
+                    time.time(),
+                ),
+            )
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE job_key = ?", (job_key,)
+            ).fetchone()
+        return row["id"]
+
+    def claim(self, worker_id: str) -> QueuedJob | None:
+        """
+        Claims the next job: a queued job, a job whose lease has expired, or a
+        job still leased to worker_id by a previous incarnation of the worker.
+        Jobs whose input cannot be decoded are marked failed and skipped
+
+        Parameters
+        ----------
+        worker_id : str
+            An id unique to the worker, stable across restarts to resume its
+            jobs immediately
+
+        Returns
+        -------
+        QueuedJob | None
+            The claimed job, or None if there is nothing to do
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = 'lease expired', finished = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, self.max_attempts),
+            )
+            while True:
+                row = connection.execute(
+                    "SELECT * FROM jobs WHERE status = ? OR (status = ? AND "
+                    "attempts < ? AND (lease_expires < ? OR lease_owner = ?)) "
+                    "ORDER BY priority, id LIMIT 1",
+                    (QUEUED, RUNNING, self.max_attempts, now, worker_id),
+                ).fetchone()
+                if row is None:
+                    return None
+                try:
+                    rad_dose_input = RadDoseInput.model_validate_json(row["input"])
+                except ValueError as e:
+                    # An input no worker can decode would otherwise be claimed,
+                    # crash its worker and stay running until its lease expired
+                    logger.warning(
+                        f"Job {row['id']} ({row['sample_id']}) has an invalid "
+                        f"input: {e}"
+                    )
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished = ?, "
+                        "lease_owner = NULL, lease_expires = NULL WHERE id = ?",
+                        (FAILED, f"{type(e).__name__}: {e}", now, row["id"]),
+                    )
+                    continue
+                break
+            if row["status"] == RUNNING:
+                logger.info(
+                    f"Resuming job {row['id']} ({row['sample_id']}) "
+                    f"abandoned by {row['lease_owner']}"
+                )
+            connection.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, started = ?, error = NULL WHERE id = ?",
+                (RUNNING, worker_id, now + self.lease_seconds, now, row["id"]),
+            )
+        return QueuedJob(
+            id=row["id"],
+            sample_id=row["sample_id"],
+            input=rad_dose_input,
+            output_directory=row["output_directory"],
+            attempts=row["attempts"] + 1,
+            lease_owner=worker_id,
+        )
+
+    def heartbeat(self, job: QueuedJob) -> bool:
+        """
+        Renews the lease of a running job
+
+        Returns
+        -------
+        bool
+            False if the job is no longer leased to its worker
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (time.time() + self.lease_seconds, job.id, RUNNING, job.lease_owner),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job: QueuedJob, summary: "pd.DataFrame | Summary") -> bool:
+        """
+        Records the summary of a job that ran successfully, a DataFrame or a
+        Summary
+
+        Returns
+        -------
+        bool
+            False if the job was no longer leased to its worker, in which case
+            the result is discarded
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, summary = ?, finished = ?, "
+                "lease_expires = NULL WHERE id = ? AND status = ? AND lease_owner = ?",
+                (
+                    DONE,
+                    json.dumps(summary.to_dict(orient="list")),
+                    time.time(),
+                    job.id,
+                    RUNNING,
+                    job.lease_owner,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job: QueuedJob, error: str) -> bool:
+        """
+        Records the failure of a job, which is queued again unless it has been
+        attempted max_attempts times
+
+        Returns
+        -------
+        bool
+            False if the job was no longer leased to its worker
+        """
+        status = FAILED if job.attempts >= self.max_attempts else QUEUED
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ?, "
+                "lease_owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (status, error, time.time(), job.id, RUNNING, job.lease_owner),
+            )
+        return cursor.rowcount == 1
+
+    def status(self, job_id: int) -> str | None:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else row["status"]
+
+    def error(self, job_id: int) -> str | None:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else row["error"]
+
+    def result(self, job_id: int) -> pd.DataFrame | None:
+        """
+        The summary of a completed job, or None if it has not completed
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT summary FROM jobs WHERE id = ? AND status = ?", (job_id, DONE)
+            ).fetchone()
+        if row is None:
+            return None
+        return pd.DataFrame(json.loads(row["summary"]))
+
+    def counts(self) -> dict[str, int]:
+        """
+        Number of jobs in each status
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+            ).fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def retry_failed(self) -> int:
+        """
+        Queues failed jobs again, resetting their attempts
+
+        Returns
+        -------
+        int
+            Number of jobs queued
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, attempts = 0 WHERE status = ?",
+                (QUEUED, FAILED),
+            )
+        return cursor.rowcount
+
+
+class QueueWorker:
+    """
+    Runs jobs from a JobQueue one at a time, renewing the lease of the running
+    job in a background thread. Start one worker per process; each needs a
+    unique worker_id.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        worker_id: str | None = None,
+        poll_interval: float = 5.0,
+        **kwargs,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        queue : JobQueue
+            The queue
+        worker_id : str | None, optional
+            An id unique to this worker. Pass the same id when restarting a
+            worker to resume its running job immediately. If worker_id=None,
+            the host name and process id are used, by default None
+        poll_interval : float, optional
+            Seconds to wait before polling an empty queue again, by default 5
+        **kwargs
+            Passed on to every RadDose3D instance, e.g. pool or cache
+        """
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.kwargs = kwargs
+
+    def _keep_leased(self, job: QueuedJob, stop: threading.Event) -> None:
+        while not stop.wait(self.queue.lease_seconds / 3):
+            if not self.queue.heartbeat(job):
+                logger.warning(f"Lost the lease of job {job.id} ({job.sample_id})")
+                return
+
+    def run_one(self) -> bool:
+        """
+        Claims and runs one job
+
+        Returns
+        -------
+        bool
+            False if the queue had no job to claim
+        """
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return False
+
+        logger.info(f"Worker {self.worker_id} running job {job.id} ({job.sample_id})")
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._keep_leased, args=(job, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            sample = RadDose3D(
+                sample_id=job.sample_id,
+                crystal=job.input.crystal,
+                beam=job.input.beam,
+                wedge=job.input.wedge,
+                output_directory=job.output_directory,
+                lazy=True,
+                **self.kwargs,
+            )
+            self.queue.complete(job, sample.run())
+        except Exception as e:
+            logger.warning(f"Job {job.id} ({job.sample_id}) failed: {e}")
+            self.queue.fail(job, f"{type(e).__name__}: {e}")
+        finally:
+            stop.set()
+            heartbeat.join()
+        return True
+
+    def run(self, max_jobs: int | None = None, stop_when_empty: bool = False) -> int:
+        """
+        Runs jobs until max_jobs have run, or the queue is empty if
+        stop_when_empty, or forever
+
+        Parameters
+        ----------
+        max_jobs : int | None, optional
+            Maximum number of jobs to run, by default None
+        stop_when_empty : bool, optional
+            Return when there is no job to claim instead of polling,
+            by default False
+
+        Returns
+        -------
+        int
+            Number of jobs run
+        """
+        count = 0
+        while max_jobs is None or count < max_jobs:
+            if self.run_one():
+                count += 1
+            elif stop_when_empty:
+                break
+            else:
+                time.sleep(self.poll_interval)
+        return count
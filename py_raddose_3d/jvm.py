@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import shutil
+from dataclasses import dataclass
+from os import makedirs, path, remove, replace, stat
+from uuid import uuid4
+
+from .cache import jar_fingerprint
+from .metrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIRECTORY = path.join("~", ".cache", "py_raddose_3d", "cds")
+
+# Class data sharing modes of a launch: the run dumps a new archive at exit, or
+# maps an existing one
+DUMP = "dump"
+SHARED = "shared"
+
+
+@dataclass(frozen=True)
+class JVMOptions:
+    """
+    How the java processes running RADDOSE-3D are launched.
+
+    With class_data_sharing, the first run of a jar dumps the classes it loaded
+    to an AppCDS archive at exit (-XX:ArchiveClassesAtExit, JDK 13 or later),
+    and later runs map the archive instead of loading and verifying the classes
+    again, which shortens JVM startup. Archives are kept per jar and java
+    executable in archive_directory. The time from launch to the first line of
+    output of the run that created the archive is kept with it, so that runs
+    using the archive report their startup saving in RunMetrics.
+    """
+
+    java: str = "java"
+    heap_mb: int | None = None
+    auto_heap: bool = False
+    initial_heap_mb: int | None = None
+    flags: tuple[str, ...] = ()
+    class_data_sharing: bool = False
+    archive_directory: str = DEFAULT_ARCHIVE_DIRECTORY
+
+    def jvm_arguments(self, heap_mb: int | None = None) -> list[str]:
+        """
+        The heap and extra options of the JVM
+
+        Parameters
+        ----------
+        heap_mb : int | None, optional
+            Maximum heap in MB, used when self.heap_mb is None. If both are
+            None, the JVM default applies, by default None
+
+        Returns
+        -------
+        list[str]
+            The options
+        """
+        arguments = []
+        heap_mb = self.heap_mb or heap_mb
+        if heap_mb is not None:
+            arguments.append(f"-Xmx{int(heap_mb)}m")
+        if self.initial_heap_mb is not None:
+            arguments.append(f"-Xms{int(self.initial_heap_mb)}m")
+        arguments += list(self.flags)
+        return arguments
+
+    def archive_path(self, raddose_3d_path: str) -> str:
+        """
+        The class data sharing archive of a jar for this java executable. An
+        archive only works with the JVM that created it, so the key includes
+        the resolved java executable and its modification time
+        """
+        java = path.realpath(shutil.which(self.java) or self.java)
+        try:
+            java_version = f"{java}:{stat(java).st_mtime_ns}"
+        except OSError:
+            java_version = java
+        digest = hashlib.sha256(jar_fingerprint(raddose_3d_path))
+        digest.update(java_version.encode("utf-8"))
+        name = path.splitext(path.basename(raddose_3d_path))[0]
+        return path.join(
+            path.expanduser(self.archive_directory),
+            f"{name}-{digest.hexdigest()[:16]}.jsa",
+        )
+
+    def launch(self, raddose_3d_path: str, heap_mb: int | None = None) -> "JVMLaunch":
+        """
+        The java command running a jar, up to and including "-jar <jar>"
+
+        Parameters
+        ----------
+        raddose_3d_path : str
+            Path of the raddose3d.jar file
+        heap_mb : int | None, optional
+            Maximum heap in MB, see jvm_arguments, by default None
+
+        Returns
+        -------
+        JVMLaunch
+            The command, and the class data sharing state to complete once the
+            process has exited
+        """
+        command = [self.java] + self.jvm_arguments(heap_mb)
+        if not self.class_data_sharing:
+            return JVMLaunch(command + ["-jar", raddose_3d_path])
+
+        archive = self.archive_path(raddose_3d_path)
+        # Older JVMs ignore the archive options rather than fail
+        command.append("-XX:+IgnoreUnrecognizedVMOptions")
+        if path.isfile(archive):
+            command += [f"-XX:SharedArchiveFile={archive}", "-Xshare:auto"]
+            return JVMLaunch(command + ["-jar", raddose_3d_path], SHARED, archive, None)
+        makedirs(path.dirname(archive), exist_ok=True)
+        dump = f"{archive}.{uuid4().hex}.tmp"
+        command.append(f"-XX:ArchiveClassesAtExit={dump}")
+        return JVMLaunch(command + ["-jar", raddose_3d_path], DUMP, archive, dump)
+
+
+@dataclass
+class JVMLaunch:
+    """
+    A java command built by JVMOptions.launch
+    """
+
+    command: list[str]
+    class_data_sharing: str | None = None
+    archive: str | None = None
+    dump: str | None = None
+
+    @property
+    def _stats_path(self) -> str:
+        return self.archive + ".json"
+
+    def finish(self, succeeded: bool, metrics: RunMetrics) -> None:
+        """
+        Publishes the archive dumped by a successful run, and records the class
+        data sharing mode and startup saving in the metrics of the run
+
+        Parameters
+        ----------
+        succeeded : bool
+            Whether the java process exited successfully
+        metrics : RunMetrics
+            The metrics of the run
+        """
+        if self.class_data_sharing is None:
+            return
+        metrics.class_data_sharing = self.class_data_sharing
+        first_output = metrics.phases.get("first_output")
+
+        if self.class_data_sharing == SHARED:
+            try:
+                with open(self._stats_path) as fp:
+                    cold = json.load(fp)["first_output_s"]
+            except (OSError, ValueError, KeyError):
+                return
+            if first_output is not None and cold is not None:
+                metrics.startup_saving_s = cold - first_output
+            return
+
+        if not (succeeded and path.isfile(self.dump)):
+            if path.isfile(self.dump):
+                remove(self.dump)
+            return
+        # Several first runs may race to create the archive; the last one wins
+        # and processes that have mapped an earlier one are unaffected
+        stats_tmp = f"{self.dump}.json"
+        with open(stats_tmp, "w") as fp:
+            json.dump({"first_output_s": first_output}, fp)
+        replace(stats_tmp, self._stats_path)
+        replace(self.dump, self.archive)
+        logger.info(f"Created the class data sharing archive {self.archive}")
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Phases recorded by RadDose3D.run. first_output, the time from spawning java
+# to its first line of output, is included in compute; merge only happens for
+# sharded Monte Carlo runs and output_store for runs with an OutputPolicy
+PHASES = (
+    "cache_lookup",
+    "model_build",
+    "asset_stage",
+    "input_render",
+    "spawn",
+    "first_output",
+    "compute",
+    "merge",
+    "output_parse",
+    "cache_store",
+    "output_store",
+)
+
+
+@dataclass
+class RunMetrics:
+    """
+    Timings and resource usage of one RadDose3D run.
+
+    phases maps phase names (see PHASES) to seconds; phases that did not happen,
+    e.g. spawn for runs on a JVMWorkerPool, are absent. peak_rss_mb and the CPU
+    times are those of the java process; they are None when they could not be
+    measured, e.g. for pooled runs, whose JVM is shared. class_data_sharing and
+    startup_saving_s are set for runs with JVMOptions.class_data_sharing, see
+    py_raddose_3d.jvm.
+    """
+
+    sample_id: str
+    mode: str = "process"
+    status: str = "ok"
+    phases: dict[str, float] = field(default_factory=dict)
+    total_s: float = 0.0
+    peak_rss_mb: float | None = None
+    cpu_user_s: float | None = None
+    cpu_system_s: float | None = None
+    class_data_sharing: str | None = None
+    startup_saving_s: float | None = None
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Times the enclosed block, adding to the phase if it was timed before
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def finish(self) -> None:
+        self.total_s = time.perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        metrics = asdict(self)
+        del metrics["_start"]
+        return metrics
+
+
+MetricsHook = Callable[[RunMetrics], None]
+
+_hooks: list[MetricsHook] = []
+
+
+def add_metrics_hook(hook: MetricsHook) -> None:
+    """
+    Registers a function called with the RunMetrics of every RadDose3D run
+    """
+    _hooks.append(hook)
+
+
+def remove_metrics_hook(hook: MetricsHook) -> None:
+    _hooks.remove(hook)
+
+
+def emit_metrics(metrics: RunMetrics, hook: MetricsHook | None = None) -> None:
+    """
+    Calls the registered hooks and hook with metrics. Exceptions raised by the
+    hooks are logged, so that metrics collection never fails a run
+    """
+    hooks = list(_hooks) if hook is None else [*_hooks, hook]
+    for callback in hooks:
+        try:
+            callback(metrics)
+        except Exception as e:
+            logger.warning(f"Metrics hook {callback!r} failed: {e}")
+
+
+def wait_with_rusage(process: subprocess.Popen, metrics: RunMetrics) -> None:
+    """
+    Waits for a child process and records its peak RSS and CPU time with
+    os.wait4, where available.
+
+    The child is reaped while holding the lock Popen.wait itself holds, and
+    process.returncode is set before the lock is released, so that Popen.poll,
+    send_signal and kill in other threads, e.g. of a Supervisor, see the
+    process as exited instead of signalling its reused pid. That lock is a
+    private attribute of CPython's Popen; where it is missing, the process is
+    reaped by Popen.wait and its resource usage is not recorded
+
+    Parameters
+    ----------
+    process : subprocess.Popen
+        The child process
+    metrics : RunMetrics
+        The metrics of the run
+    """
+    waitpid_lock = getattr(process, "_waitpid_lock", None)
+    if not hasattr(os, "wait4") or waitpid_lock is None:
+        process.wait()
+        return
+    with waitpid_lock:
+        if process.returncode is not None:
+            # Already reaped by Popen.poll, without its resource usage
+            return
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 / 2**20 if sys.platform == "darwin" else 1 / 2**10
+    metrics.peak_rss_mb = rusage.ru_maxrss * scale
+    metrics.cpu_user_s = rusage.ru_utime
+    metrics.cpu_system_s = rusage.ru_stime
+
+
+def _read_proc(pid: int) -> tuple[float, float, float] | None:
+    """
+    Peak RSS in MB and user and system CPU time in seconds of a running process,
+    from /proc on Linux
+    """
+    try:
+        with open(f"/proc/{pid}/status") as fp:
+            peak_rss_kb = next(
+                int(line.split()[1]) for line in fp if line.startswith("VmHWM:")
+            )
+        with open(f"/proc/{pid}/stat") as fp:
+            # Fields after the command name, which may contain spaces
+            fields = fp.read().rsplit(")", 1)[1].split()
+    except (OSError, StopIteration, IndexError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return peak_rss_kb / 2**10, int(fields[11]) / ticks, int(fields[12]) / ticks
+
+
+async def sample_process(
+    process: asyncio.subprocess.Process, metrics: RunMetrics, interval: float = 0.25
+) -> None:
+    """
+    Records the peak RSS and CPU time of an asyncio child process by sampling
+    /proc until it exits. asyncio reaps its children itself, so os.wait4 cannot
+    be used; the values are those of the last sample, which may miss the
+    final moments of the run. Nothing is recorded on other platforms
+    """
+    while process.returncode is None:
+        sample = _read_proc(process.pid)
+        if sample is None:
+            return
+        metrics.peak_rss_mb, metrics.cpu_user_s, metrics.cpu_system_s = sample
+        await asyncio.sleep(interval)
+
+
+def _labels(**labels: str) -> str:
+    pairs = []
+    for name, value in labels.items():
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class PrometheusExporter:
+    """
+    A metrics hook aggregating RunMetrics into Prometheus metrics, rendered in
+    the text exposition format, e.g. for the node_exporter textfile collector:
+
+        exporter = PrometheusExporter()
+        add_metrics_hook(exporter)
+        ...
+        exporter.write("/var/lib/node_exporter/raddose3d.prom")
+    """
+
+    def __init__(
+        self,
+        buckets: tuple[float, ...] = (1, 5, 15, 60, 300, 900, 3600),
+    ) -> None:
+        """
+        Parameters
+        ----------
+        buckets : tuple[float, ...], optional
+            Upper bounds of the run duration histogram in seconds,
+            by default (1, 5, 15, 60, 300, 900, 3600)
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._runs: dict[tuple[str, str], int] = {}
+        self._phase_sums: dict[str, float] = {}
+        self._phase_counts: dict[str, int] = {}
+        self._bucket_counts = [0] * len(self.buckets)
+        self._duration_sum = 0.0
+        self._duration_count = 0
+        self._cpu = {"user": 0.0, "system": 0.0}
+        self._peak_rss_mb = 0.0
+
+    def __call__(self, metrics: RunMetrics) -> None:
+        with self._lock:
+            key = (metrics.mode, metrics.status)
+            self._runs[key] = self._runs.get(key, 0) + 1
+            for name, seconds in metrics.phases.items():
+                self._phase_sums[name] = self._phase_sums.get(name, 0.0) + seconds
+                self._phase_counts[name] = self._phase_counts.get(name, 0) + 1
+            for i, bound in enumerate(self.buckets):
+                if metrics.total_s <= bound:
+                    self._bucket_counts[i] += 1
+            self._duration_sum += metrics.total_s
+            self._duration_count += 1
+            if metrics.cpu_user_s is not None:
+                self._cpu["user"] += metrics.cpu_user_s
+                self._cpu["system"] += metrics.cpu_system_s
+            if metrics.peak_rss_mb is not None:
+                self._peak_rss_mb = max(self._peak_rss_mb, metrics.peak_rss_mb)
+
+    def render(self) -> str:
+        """
+        The aggregated metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = [
+                "# HELP raddose3d_runs_total RadDose3D runs",
+                "# TYPE raddose3d_runs_total counter",
+            ]
+            for (mode, status), count in sorted(self._runs.items()):
+                lines.append(
+                    f"raddose3d_runs_total{_labels(mode=mode, status=status)} {count}"
+                )
+
+            lines += [
+                "# HELP raddose3d_phase_seconds Time spent in each phase of a run",
+                "# TYPE raddose3d_phase_seconds summary",
+            ]
+            for name in sorted(self._phase_sums):
+                labels = _labels(phase=name)
+                lines.append(
+                    f"raddose3d_phase_seconds_sum{labels} {self._phase_sums[name]}"
+                )
+                lines.append(
+                    f"raddose3d_phase_seconds_count{labels} {self._phase_counts[name]}"
+                )
+
+            lines += [
+                "# HELP raddose3d_run_seconds Wall time of a run",
+                "# TYPE raddose3d_run_seconds histogram",
+            ]
+            for bound, count in zip(self.buckets, self._bucket_counts):
+                lines.append(
+                    f"raddose3d_run_seconds_bucket{_labels(le=str(bound))} {count}"
+                )
+            lines.append(
+                f'raddose3d_run_seconds_bucket{{le="+Inf"}} {self._duration_count}'
+            )
+            lines.append(f"raddose3d_run_seconds_sum {self._duration_sum}")
+            lines.append(f"raddose3d_run_seconds_count {self._duration_count}")
+
+            lines += [
+                "# HELP raddose3d_child_cpu_seconds_total CPU time of java processes",
+                "# TYPE raddose3d_child_cpu_seconds_total counter",
+            ]
+            for cpu_mode, seconds in self._cpu.items():
+                labels = _labels(cpu_mode=cpu_mode)
+                lines.append(f"raddose3d_child_cpu_seconds_total{labels} {seconds}")
+
+            lines += [
+                "# HELP raddose3d_child_peak_rss_bytes Largest peak RSS of a java "
+                "process",
+                "# TYPE raddose3d_child_peak_rss_bytes gauge",
+                f"raddose3d_child_peak_rss_bytes {int(self._peak_rss_mb * 2**20)}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path: str) -> None:
+        """
+        Writes the rendered metrics atomically, so that a collector never reads
+        a partial file
+        """
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            fp.write(self.render())
+        os.replace(tmp_path, file_path)
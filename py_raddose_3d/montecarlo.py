@@ -0,0 +1,148 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from .schemas.crystal import Crystal
+
+# Summary columns that identify a row rather than measure something
+KEY_COLUMNS = ("Wedge Number",)
+
+
+def is_monte_carlo(crystal: Crystal) -> bool:
+    return (crystal.Subprogram or "").lower() == "montecarlo"
+
+
+def shard_weight(crystal: Crystal) -> int:
+    """
+    The statistical weight of a Monte Carlo run: its number of simulated photons
+    """
+    return (crystal.Runs or 1) * (crystal.SimPhotons or 1)
+
+
+def _split(total: int, parts: int) -> list[int]:
+    return [total // parts + (k < total % parts) for k in range(parts)]
+
+
+def split_monte_carlo(crystal: Crystal, shards: int) -> list[Crystal]:
+    """
+    Splits the photon budget of a Monte Carlo crystal into independent shards.
+    Runs are distributed over the shards when there are enough of them,
+    otherwise SimPhotons is divided between the shards
+
+    Parameters
+    ----------
+    crystal : Crystal
+        A Crystal Pydantic model with Subprogram="montecarlo"
+    shards : int
+        The requested number of shards
+
+    Returns
+    -------
+    list[Crystal]
+        One crystal per shard, or [crystal] if it cannot be split
+    """
+    runs = crystal.Runs or 1
+    if runs >= shards:
+        return [
+            crystal.model_copy(update={"Runs": shard_runs})
+            for shard_runs in _split(runs, shards)
+        ]
+    if crystal.SimPhotons is None:
+        if runs == 1:
+            return [crystal]
+        return [crystal.model_copy(update={"Runs": 1}) for _ in range(runs)]
+    shards = min(shards, crystal.SimPhotons)
+    return [
+        crystal.model_copy(update={"SimPhotons": photons})
+        for photons in _split(crystal.SimPhotons, shards)
+    ]
+
+
+def merge_summaries(
+    summaries: list[pd.DataFrame], weights: list[float]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Combines the Summary DataFrames of independent Monte Carlo shards into their
+    weighted mean, and estimates its standard error from the spread between
+    shards. A shard's variance is taken to be inversely proportional to its
+    weight, so that with equal weights the standard error is the standard
+    deviation of the shards divided by the square root of their number
+
+    Parameters
+    ----------
+    summaries : list[pd.DataFrame]
+        The summaries of the shards
+    weights : list[float]
+        The weight of each shard, see shard_weight
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.DataFrame]
+        The merged summary and the standard error of each of its values
+    """
+    w = np.asarray(weights, dtype=np.float64)
+    total = w.sum()
+    merged = summaries[0].copy()
+    standard_error = summaries[0].copy()
+    for column in summaries[0].columns:
+        if column in KEY_COLUMNS or not pd.api.types.is_numeric_dtype(
+            summaries[0][column]
+        ):
+            continue
+        values = np.stack(
+            [summary[column].to_numpy(np.float64) for summary in summaries]
+        )
+        mean = (w[:, None] * values).sum(axis=0) / total
+        if len(summaries) > 1:
+            spread = (w[:, None] * (values - mean) ** 2).sum(axis=0)
+            error = np.sqrt(spread / ((len(summaries) - 1) * total))
+        else:
+            error = np.full_like(mean, math.nan)
+        merged[column] = mean
+        standard_error[column] = error
+    return merged, standard_error
+
+
+def merge_dose_states(
+    csv_paths: list[str],
+    weights: list[float],
+    output_path: str,
+    chunksize: int = 1_000_000,
+) -> None:
+    """
+    Writes the weighted mean of the DoseState.csv outputs of Monte Carlo shards.
+    The shards share the crystal geometry, so their voxels are listed in the
+    same order; the coordinates are copied from the first shard
+
+    Parameters
+    ----------
+    csv_paths : list[str]
+        Paths of the DoseState.csv of the shards
+    weights : list[float]
+        The weight of each shard, see shard_weight
+    output_path : str
+        Path of the merged DoseState.csv
+    chunksize : int, optional
+        Number of rows processed at a time, by default 1,000,000
+
+    Raises
+    ------
+    ValueError
+        If the shards do not have the same voxels
+    """
+    total = float(sum(weights))
+    readers = [pd.read_csv(p, header=None, chunksize=chunksize) for p in csv_paths]
+    with open(output_path, "w") as fp:
+        for chunks in zip(*readers, strict=True):
+            coordinates = chunks[0].iloc[:, :3]
+            for chunk in chunks[1:]:
+                if len(chunk) != len(coordinates) or not np.array_equal(
+                    chunk.iloc[:, :3].to_numpy(), coordinates.to_numpy()
+                ):
+                    raise ValueError("The shards' DoseState voxels do not match")
+            values = (
+                sum(w * chunk.iloc[:, 3:] for w, chunk in zip(weights, chunks)) / total
+            )
+            merged = pd.concat([coordinates, values], axis=1)
+            merged.to_csv(fp, header=False, index=False)
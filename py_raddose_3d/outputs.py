@@ -0,0 +1,158 @@
+import gzip
+import logging
+import shutil
+import tempfile
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from glob import escape, glob
+from os import makedirs, path, remove, stat
+
+logger = logging.getLogger(__name__)
+
+# Outputs the wrapper reads itself, which are always kept as they are
+ALWAYS_KEPT = ("Summary.csv", "SummaryStandardError.csv")
+
+DOSE_STATE = "DoseState.csv"
+DOSE_STATE_FORMATS = ("csv", "npz")
+
+
+@dataclass(frozen=True)
+class OutputPolicy:
+    """
+    Which RADDOSE-3D outputs a run keeps in its sample directory, and in which
+    form.
+
+    Output names are the file names without the "<sample_id>-" prefix, e.g.
+    "Summary.txt" or "DoseState.csv"; keep and compress hold fnmatch patterns of
+    them. With a scratch_directory, e.g. a local disk or /dev/shm, RADDOSE-3D
+    writes its outputs there and only the kept ones are moved to the sample
+    directory when the run completes, so that shared storage only receives the
+    final files.
+    """
+
+    keep: tuple[str, ...] | None = None
+    compress: tuple[str, ...] = ()
+    dose_state_format: str = "csv"
+    scratch_directory: str | None = None
+    cleanup_scratch: bool = True
+
+    def __post_init__(self) -> None:
+        if self.dose_state_format not in DOSE_STATE_FORMATS:
+            raise ValueError(
+                f"Unsupported dose_state_format {self.dose_state_format!r}, "
+                f"use one of {DOSE_STATE_FORMATS}"
+            )
+
+    def keeps(self, name: str) -> bool:
+        if name in ALWAYS_KEPT or self.keep is None:
+            return True
+        return any(fnmatch(name, pattern) for pattern in self.keep)
+
+    def compresses(self, name: str) -> bool:
+        if name in ALWAYS_KEPT:
+            return False
+        return any(fnmatch(name, pattern) for pattern in self.compress)
+
+    def scratch_prefix(self, sample_id: str) -> str | None:
+        """
+        Creates a new scratch directory for a run and returns its output prefix,
+        or None without a scratch_directory
+        """
+        if self.scratch_directory is None:
+            return None
+        scratch_directory = path.expanduser(self.scratch_directory)
+        makedirs(scratch_directory, exist_ok=True)
+        run_directory = tempfile.mkdtemp(prefix=f"{sample_id}-", dir=scratch_directory)
+        return path.join(run_directory, f"{sample_id}-")
+
+
+def _compress(source: str, destination: str) -> None:
+    with open(source, "rb") as src, gzip.open(destination + ".tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    shutil.move(destination + ".tmp", destination)
+
+
+def _stat_key(file_path: str) -> tuple[int, int]:
+    file_stat = stat(file_path)
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def output_snapshot(prefix: str) -> dict[str, tuple[int, int]]:
+    """
+    The modification time and size of each file under a prefix, keyed by its
+    name without the prefix, see apply_output_policy
+    """
+    snapshot = {}
+    for file_path in glob(escape(prefix) + "*"):
+        if path.isfile(file_path):
+            snapshot[file_path[len(prefix) :]] = _stat_key(file_path)
+    return snapshot
+
+
+def apply_output_policy(
+    policy: OutputPolicy,
+    source_prefix: str,
+    destination_prefix: str,
+    previous: dict[str, tuple[int, int]] | None = None,
+) -> list[str]:
+    """
+    Moves the outputs of a run from source_prefix to destination_prefix, which
+    may be the same, dropping, compressing and converting them as the policy
+    says
+
+    Parameters
+    ----------
+    policy : OutputPolicy
+        The output policy
+    source_prefix : str
+        Prefix of the outputs written by RADDOSE-3D
+    destination_prefix : str
+        Prefix of the outputs to keep
+    previous : dict[str, tuple[int, int]] | None, optional
+        The output_snapshot of source_prefix taken before the run. Files it
+        lists that the run left unchanged, e.g. outputs of an earlier run
+        already processed, are left alone, by default None
+
+    Returns
+    -------
+    list[str]
+        The names of the outputs kept, as written to destination_prefix
+    """
+    previous = previous or {}
+    # Listed up front, as the outputs written below may replace earlier ones
+    written = sorted(
+        name
+        for name, key in output_snapshot(source_prefix).items()
+        if previous.get(name) != key
+    )
+    kept = []
+    for name in written:
+        source = source_prefix + name
+        if not policy.keeps(name):
+            remove(source)
+            continue
+
+        if name == DOSE_STATE and policy.dose_state_format == "npz":
+            from .dose_state import load_dose_state, save_dose_state
+
+            name = "DoseState.npz"
+            save_dose_state(
+                destination_prefix + name,
+                load_dose_state(source, sparse=True, sidecar=False),
+            )
+            remove(source)
+        elif policy.compresses(name):
+            name += ".gz"
+            _compress(source, destination_prefix + name)
+            remove(source)
+        elif source != destination_prefix + name:
+            shutil.move(source, destination_prefix + name)
+        kept.append(name)
+    return kept
+
+
+def remove_scratch(scratch_prefix: str) -> None:
+    """
+    Removes the scratch directory of a run, see OutputPolicy.scratch_prefix
+    """
+    shutil.rmtree(path.dirname(scratch_prefix), ignore_errors=True)
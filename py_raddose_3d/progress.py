@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import re
+import time
+import warnings
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """
+    A line of RADDOSE-3D output together with the progress parsed so far
+    """
+
+    sample_id: str
+    line: str
+    line_number: int
+    elapsed: float
+    wedge: int | None = None
+    angle: float | None = None
+    warning: str | None = None
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+class StdoutParser:
+    """
+    Incremental parser of RADDOSE-3D stdout. Lines are fed one at a time while
+    the process runs: each is logged, scanned for warnings, which are raised as
+    RuntimeWarnings as soon as they appear, and turned into a ProgressEvent for
+    the callback. Only the last max_lines lines are kept in memory.
+
+    The wedge and angle patterns are class attributes so that they can be
+    adapted to the output of other RADDOSE-3D versions.
+    """
+
+    warning_list = ["warning", "angular resolution too big", "* warning *"]
+    wedge_pattern = re.compile(r"\bwedge\s*(?:number\s*)?#?\s*(\d+)", re.IGNORECASE)
+    angle_pattern = re.compile(
+        r"\bangle\b\D{0,20}?(-?\d+(?:\.\d+)?)\s*(?:deg|°)?", re.IGNORECASE
+    )
+
+    def __init__(
+        self,
+        sample_id: str,
+        callback: ProgressCallback | None = None,
+        max_lines: int = 1000,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        sample_id : str
+            Sample id, included in every event
+        callback : ProgressCallback | None, optional
+            Called with a ProgressEvent for every line. If the callback raises,
+            the run is stopped and the exception propagates, by default None
+        max_lines : int, optional
+            Number of lines of output kept in memory, by default 1000
+        """
+        self.sample_id = sample_id
+        self.callback = callback
+        self.lines: deque[str] = deque(maxlen=max_lines)
+        self.warnings: list[str] = []
+        self.wedge: int | None = None
+        self.angle: float | None = None
+        self.line_number = 0
+        self._start = time.monotonic()
+        self._warning_on_next_line = False
+
+    @property
+    def log(self) -> str:
+        """
+        The last max_lines lines of output
+        """
+        return "\n".join(self.lines)
+
+    def _warn(self, message: str) -> None:
+        self.warnings.append(message)
+        warnings.warn(message, RuntimeWarning)
+
+    def feed(self, line: str | bytes) -> ProgressEvent:
+        """
+        Parses one line of output
+
+        Parameters
+        ----------
+        line : str | bytes
+            A line of RADDOSE-3D stdout
+
+        Returns
+        -------
+        ProgressEvent
+            The event passed to the callback
+        """
+        if isinstance(line, bytes):
+            line = str(line, encoding="utf-8", errors="replace")
+        line = line.rstrip("\r\n")
+        self.line_number += 1
+        self.lines.append(line)
+        logger.info(line)
+
+        warning = None
+        if self._warning_on_next_line:
+            # "* WARNING *" banners carry the message on the following line
+            self._warning_on_next_line = False
+            warning = line
+        elif any(pattern in line.lower() for pattern in self.warning_list):
+            if "* warning *" in line.lower():
+                self._warning_on_next_line = True
+            else:
+                warning = line
+        if warning is not None:
+            self._warn(warning)
+
+        wedge_match = self.wedge_pattern.search(line)
+        if wedge_match is not None:
+            self.wedge = int(wedge_match.group(1))
+        angle_match = self.angle_pattern.search(line)
+        if angle_match is not None:
+            self.angle = float(angle_match.group(1))
+
+        event = ProgressEvent(
+            sample_id=self.sample_id,
+            line=line,
+            line_number=self.line_number,
+            elapsed=time.monotonic() - self._start,
+            wedge=self.wedge,
+            angle=self.angle,
+            warning=warning,
+        )
+        if self.callback is not None:
+            self.callback(event)
+        return event
+
+    def feed_all(self, stdout: bytes) -> None:
+        """
+        Parses a complete stdout, e.g. from a run that was not streamed
+        """
+        for line in str(stdout, encoding="utf-8", errors="replace").splitlines():
+            self.feed(line)
+        self.finish()
+
+    def finish(self) -> None:
+        """
+        Flushes a "* WARNING *" banner that was the last line of output
+        """
+        if self._warning_on_next_line:
+            self._warning_on_next_line = False
+            self._warn(self.lines[-1])
+
+
+class ProgressStream:
+    """
+    Turns progress callbacks into an async iterator:
+
+    >>> stream = ProgressStream()
+    >>> task = asyncio.create_task(sample.run_async(progress_callback=stream))
+    >>> async for event in stream.until(task):
+    ...     print(event.wedge, event.angle, event.elapsed)
+    >>> summary = task.result()
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[ProgressEvent] = asyncio.Queue()
+
+    def __call__(self, event: ProgressEvent) -> None:
+        self._queue.put_nowait(event)
+
+    async def until(self, task: asyncio.Future) -> AsyncIterator[ProgressEvent]:
+        """
+        Yields events until task is done and every queued event has been yielded
+
+        Parameters
+        ----------
+        task : asyncio.Future
+            The task running the sample
+
+        Yields
+        ------
+        ProgressEvent
+            The progress events, in order
+        """
+        while True:
+            if not self._queue.empty():
+                yield self._queue.get_nowait()
+                continue
+            if task.done():
+                return
+            getter = asyncio.ensure_future(self._queue.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
@@ -1,19 +1,41 @@
 import asyncio
 import logging
+import shutil
 import subprocess
-import warnings
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os import getcwd, mkdir, path
+from typing import TYPE_CHECKING
 
-import pandas as pd
-import yaml
-
+from .cache import ResultCache, collect_outputs, input_key, restore_outputs
+from .cost import CostEstimate, CostModel
+from .job import RadDoseJob
+from .jvm import JVMLaunch, JVMOptions
+from .metrics import (
+    MetricsHook,
+    RunMetrics,
+    emit_metrics,
+    sample_process,
+    wait_with_rusage,
+)
+from .outputs import OutputPolicy, apply_output_policy, output_snapshot, remove_scratch
+from .progress import ProgressCallback, StdoutParser
 from .schemas.input import Beam, Crystal, RadDoseInput, Wedge
+from .summary import Summary
+from .supervisor import STDERR, STDOUT, Supervision, Supervisor
+from .sweep import apply_parameters, default_concurrency, expand_grid
+from .worker_pool import JVMWorkerPool, WorkerJobError, WorkerUnavailableError
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s",
-    datefmt="%d-%m-%Y %H:%M:%S",
-)
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from .dose_state import DoseGrid, SparseDoseGrid
+    from .dose_stats import DoseStatistics
+    from .result_store import ResultStore
+    from .schemas.assets import AssetResolver
+
+logger = logging.getLogger(__name__)
 
 
 class RadDose3D:
@@ -28,6 +50,18 @@ class RadDose3D:
         beam: Beam,
         wedge: Wedge | list[Wedge],
         output_directory: str | None = None,
+        pool: JVMWorkerPool | None = None,
+        cache: ResultCache | None = None,
+        lazy: bool = False,
+        cost_model: CostModel | None = None,
+        monte_carlo_shards: int | None = None,
+        metrics_hook: MetricsHook | None = None,
+        as_frame: bool = True,
+        result_store: "ResultStore | None" = None,
+        jvm_options: JVMOptions | None = None,
+        output_policy: OutputPolicy | None = None,
+        assets: "AssetResolver | None" = None,
+        supervisor: Supervisor | None = None,
     ) -> None:
         """
         Parameters
@@ -43,11 +77,80 @@ class RadDose3D:
         output_directory : str | None, optional
             Output directory. If output_directory=None, we use the current working directory,
             by default None.
+        pool : JVMWorkerPool | None, optional
+            A pool of persistent JVM workers, which can be shared between
+            RadDose3D instances. If pool=None, or the pool is unavailable, each run
+            starts its own java process, by default None.
+        cache : ResultCache | None, optional
+            A result cache. If the same input has been run before, its outputs are
+            restored into sample_directory instead of running RADDOSE-3D,
+            by default None.
+        lazy : bool, optional
+            If True, the sample directory and the input text file are only created
+            when the sample is run (or prepare is called), by default False.
+        cost_model : CostModel | None, optional
+            If given, the wall time of every run of RADDOSE-3D is recorded to
+            calibrate the model, by default None.
+        monte_carlo_shards : int | None, optional
+            If the crystal has Subprogram="montecarlo", its Runs (or SimPhotons)
+            are split into this many independent java processes run in
+            parallel, whose Summary and DoseState outputs are merged. The
+            standard error of the merged Summary is returned in
+            summary.attrs["standard_error"]. The metrics hooks only receive
+            the metrics of the whole run, by default None.
+        metrics_hook : MetricsHook | None, optional
+            Called with the RunMetrics of every run, in addition to the hooks
+            registered with py_raddose_3d.metrics.add_metrics_hook,
+            by default None.
+        as_frame : bool, optional
+            If True, run returns the summary as a pandas DataFrame. If False, it
+            returns a py_raddose_3d.summary.Summary, a dictionary of columns read
+            without importing pandas, by default True.
+        result_store : ResultStore | None, optional
+            If given, the summary, input parameters and metrics of every run
+            are appended to it, see py_raddose_3d.result_store,
+            by default None.
+        jvm_options : JVMOptions | None, optional
+            The java executable, heap size, extra JVM flags and class data
+            sharing of the java processes, see py_raddose_3d.jvm. If None, "java"
+            with the JVM defaults, by default None.
+        output_policy : OutputPolicy | None, optional
+            Which outputs are kept in sample_directory and in which form, and
+            an optional local scratch directory the run writes to, see
+            py_raddose_3d.outputs. If None, all outputs are written to
+            sample_directory as RADDOSE-3D produces them, by default None.
+        assets : AssetResolver | None, optional
+            If given, the files the input refers to and a Crystal.Pdb structure
+            from a local PDB mirror are resolved through its content-addressed
+            asset cache, staged in sample_directory and hashed by content for
+            the result cache, see py_raddose_3d.schemas.assets, by default None.
+        supervisor : Supervisor | None, optional
+            Classifies the output of the java process while it runs, killing it
+            on fatal errors, and enforces resource limits, see
+            py_raddose_3d.supervisor. If None, a Supervisor with the default
+            pattern table and no limits, by default None.
         """
         self.sample_id = sample_id
         self.crystal = crystal
         self.beam = beam
         self.wedge = wedge
+        self.pool = pool
+        self.cache = cache
+        self.cost_model = cost_model
+        self.monte_carlo_shards = monte_carlo_shards
+        self.metrics_hook = metrics_hook
+        self.as_frame = as_frame
+        self.result_store = result_store
+        self.jvm_options = jvm_options or JVMOptions()
+        self._jvm_launch: JVMLaunch | None = None
+        self.output_policy = output_policy
+        self._scratch_prefix: str | None = None
+        self._previous_outputs: dict[str, tuple[int, int]] | None = None
+        self.assets = assets
+        self.supervisor = supervisor or Supervisor()
+        self.metrics: RunMetrics | None = None
+        # Monte Carlo shards leave the metrics hooks to the run they belong to
+        self._emits_metrics = True
 
         self.raddose_3d_path = path.join(path.dirname(__file__), "raddose3d.jar")
         if output_directory is None:
@@ -56,17 +159,118 @@ class RadDose3D:
             self.output_directory = output_directory
 
         self.sample_directory = path.join(self.output_directory, self.sample_id)
-        try:
-            mkdir(self.sample_directory)
-        except FileExistsError:
-            logging.info("Folder already exists, overwriting results")
-
         self.prefix = path.join(
             self.sample_directory,
             self.sample_id + "-",
         )
+        self.input_text_file_path = path.join(
+            self.sample_directory, f"{self.sample_id}.txt"
+        )
 
-        self.input_text_file_path = self._create_input_txt_file()
+        self._sample_directory_created = False
+        self._input_txt_file_created = False
+        self._prepare_phases: dict[str, float] = {}
+        if not lazy:
+            self.prepare()
+
+    @classmethod
+    def from_job(cls, job: RadDoseJob, **kwargs) -> "RadDose3D":
+        """
+        Creates a lazy RadDose3D from a job description
+
+        Parameters
+        ----------
+        job : RadDoseJob
+            The job
+        **kwargs
+            Passed on to RadDose3D, e.g. pool or cache
+
+        Returns
+        -------
+        RadDose3D
+            A RadDose3D that creates its files when it is run
+        """
+        kwargs.setdefault("lazy", True)
+        return cls(
+            sample_id=job.sample_id,
+            crystal=job.crystal,
+            beam=job.beam,
+            wedge=job.wedges,
+            output_directory=job.output_directory,
+            **kwargs,
+        )
+
+    @property
+    def job(self) -> RadDoseJob:
+        """
+        An immutable, hashable and picklable description of this sample
+        """
+        return RadDoseJob(
+            sample_id=self.sample_id,
+            crystal=self.crystal,
+            beam=self.beam,
+            wedge=self.wedge,
+            output_directory=self.output_directory,
+        )
+
+    def _create_sample_directory(self) -> None:
+        if self._sample_directory_created:
+            return
+        try:
+            mkdir(self.sample_directory)
+        except FileExistsError:
+            logger.info("Folder already exists, overwriting results")
+        self._sample_directory_created = True
+
+    def prepare(self) -> None:
+        """
+        Creates the sample directory and writes the RADDOSE-3D input text file,
+        if that has not been done yet
+        """
+        self._create_sample_directory()
+        if not self._input_txt_file_created:
+            self._create_input_txt_file()
+            self._input_txt_file_created = True
+
+    @property
+    def _run_prefix(self) -> str:
+        """
+        The prefix RADDOSE-3D writes to: the scratch directory of the current
+        run, if the output policy has one, or self.prefix
+        """
+        return self._scratch_prefix or self.prefix
+
+    def _snapshot_outputs(self) -> None:
+        """
+        Notes the files already under self.prefix, e.g. the outputs of an
+        earlier run, so that the output policy leaves those this run does not
+        rewrite alone
+        """
+        if self.output_policy is not None:
+            self._previous_outputs = output_snapshot(self.prefix)
+
+    def _begin_outputs(self) -> None:
+        if self.output_policy is not None:
+            self._scratch_prefix = self.output_policy.scratch_prefix(self.sample_id)
+
+    def _apply_output_policy(self, metrics: RunMetrics) -> None:
+        """
+        Moves the outputs of a completed run to self.prefix as the output policy
+        says, see py_raddose_3d.outputs.apply_output_policy
+        """
+        if self.output_policy is None:
+            return
+        previous = self._previous_outputs if self._scratch_prefix is None else None
+        with metrics.phase("output_store"):
+            apply_output_policy(
+                self.output_policy, self._run_prefix, self.prefix, previous
+            )
+
+    def _end_outputs(self) -> None:
+        self._previous_outputs = None
+        scratch_prefix, self._scratch_prefix = self._scratch_prefix, None
+        if scratch_prefix is not None and self.output_policy.cleanup_scratch:
+            remove_scratch(scratch_prefix)
 
     def _create_pydantic_model(self) -> RadDoseInput:
         """
@@ -94,116 +298,783 @@ class RadDose3D:
         str
             The path of the RADDOSE-3D input text file
         """
+        start = time.perf_counter()
         rad_dose_input = self._create_pydantic_model()
-        yaml_input: list[str] = yaml.dump(
-            rad_dose_input.model_dump(exclude_none=True), sort_keys=False
-        ).splitlines()
+        built = time.perf_counter()
+        if self.assets is not None:
+            rad_dose_input = self.assets.stage(rad_dose_input, self.sample_directory)
+        staged = time.perf_counter()
 
-        file_path = path.join(self.sample_directory, f"{self.sample_id}.txt")
-        with open(file_path, "w") as fp:
-            for line in yaml_input:
-                if line.lower() != "wedge:":
-                    fp.write(line.replace(":", "").replace("- Wedge", "Wedge") + "\n")
-                else:
-                    fp.write("# wedge" + "\n")
+        with open(self.input_text_file_path, "w") as fp:
+            rad_dose_input.write(fp)
 
-        return file_path
+        self._prepare_phases = {
+            "model_build": built - start,
+            "input_render": time.perf_counter() - staged,
+        }
+        if self.assets is not None:
+            self._prepare_phases["asset_stage"] = staged - built
+        return self.input_text_file_path
 
-    def print_stdout_and_stderr(self, stdout: bytes, stderr: bytes) -> None:
+    def print_stdout_and_stderr(
+        self,
+        stdout: bytes,
+        stderr: bytes,
+        parser: StdoutParser | None = None,
+        returncode: int | None = None,
+    ) -> None:
         """
-        Prints stdout and stderr
+        Checks stderr with self.supervisor, then prints stdout
 
         Parameters
         ----------
         stdout : bytes
             stdout
         stderr : bytes
-            stdout
+            stderr
+        parser : StdoutParser | None, optional
+            The parser stdout is fed to. If stdout and stderr were streamed
+            through the parser and the supervisor while the process ran, pass
+            stdout=b"" and stderr=b"", by default None
+        returncode : int | None, optional
+            The exit status of the run, if known, by default None
 
         Raises
         ------
-        RuntimeError
-            An error if the run is not successful
+        RadDose3DError
+            An error if the run is not successful, see py_raddose_3d.supervisor
 
         Returns
         -------
         None
         """
-        if len(stderr) != 0:
-            logging.info("Something has gone wrong!")
-            raise RuntimeError(str(stderr, encoding="utf-8"))
+        supervision = self.supervisor.supervise(self.sample_id)
+        supervision.feed_all(stderr, STDERR)
+        supervision.feed_all(stdout, STDOUT)
+        supervision.check(returncode)
+        if parser is None:
+            parser = StdoutParser(self.sample_id)
+        parser.feed_all(stdout)
+
+        logger.info(f"Results saved to {self.sample_directory}")
+
+    def _command(self) -> list[str]:
+        """
+        The command used to run RADDOSE-3D in a one-shot java process, with
+        the options of self.jvm_options. With JVMOptions.auto_heap, the maximum
+        heap is derived from the estimated memory of the run
+
+        Returns
+        -------
+        list[str]
+            The command and its arguments
+        """
+        heap_mb = None
+        if self.jvm_options.auto_heap:
+            heap_mb = self.estimate_cost().heap_mb()
+        self._jvm_launch = self.jvm_options.launch(self.raddose_3d_path, heap_mb)
+        return self._jvm_launch.command + [
+            "-i",
+            self.input_text_file_path,
+            "-p",
+            self._run_prefix,
+        ]
+
+    def _finish_launch(self, returncode: int | None, metrics: RunMetrics) -> None:
+        """
+        Completes the class data sharing of the java process that has exited,
+        see py_raddose_3d.jvm.JVMLaunch.finish
+        """
+        launch, self._jvm_launch = self._jvm_launch, None
+        if launch is not None:
+            launch.finish(returncode == 0, metrics)
+
+    def _execute_in_pool(
+        self, metrics: RunMetrics, timeout: float | None = None
+    ) -> tuple[bytes, bytes] | None:
+        """
+        Runs RADDOSE-3D on a worker of self.pool
+
+        Parameters
+        ----------
+        metrics : RunMetrics
+            The metrics of the run
+        timeout : float | None, optional
+            Maximum run time in seconds, by default None
+
+        Returns
+        -------
+        tuple[bytes, bytes] | None
+            stdout and stderr of the run, or None if there is no usable pool
+            and the caller should start a one-shot java process instead
+
+        Raises
+        ------
+        TimeoutError
+            If the run takes longer than timeout or the pool's job_timeout
+        RadDose3DError
+            If RADDOSE-3D fails in the worker, see py_raddose_3d.supervisor
+        """
+        if self.pool is None or not self.pool.available:
+            return None
+        try:
+            with metrics.phase("compute"):
+                result = self.pool.execute(
+                    self.input_text_file_path, self._run_prefix, timeout
+                )
+        except WorkerUnavailableError as e:
+            logger.warning(f"JVM worker pool failed ({e}), starting a java process")
+            return None
+        except WorkerJobError as e:
+            metrics.mode = "pool"
+            self.print_stdout_and_stderr(e.stdout, e.stderr, returncode=e.status)
+            raise
+        except TimeoutError as e:
+            raise TimeoutError(
+                f"RADDOSE-3D run of {self.sample_id} timed out in a JVM worker: {e}"
+            ) from e
+        metrics.mode = "pool"
+        return result
+
+    def cache_key(self) -> str:
+        """
+        The content address of this run, see py_raddose_3d.cache.input_key
+
+        Returns
+        -------
+        str
+            A hex digest identifying the run
+        """
+        return input_key(
+            self._create_pydantic_model(), self.raddose_3d_path, self.assets
+        )
+
+    def _restore_from_cache(self) -> bool:
+        """
+        Restores the outputs of a previous identical run from self.cache
+
+        Returns
+        -------
+        bool
+            True on a cache hit
+        """
+        if self.cache is None:
+            return False
+        outputs = self.cache.get(self.cache_key())
+        if outputs is None:
+            return False
+        restore_outputs(self.prefix, outputs)
+        logger.info(f"Cached results restored to {self.sample_directory}")
+        return True
+
+    def _store_in_cache(self) -> None:
+        if self.cache is not None:
+            self.cache.put(self.cache_key(), collect_outputs(self._run_prefix))
+
+    def estimate_cost(self) -> CostEstimate:
+        """
+        Predicts the runtime and peak JVM memory of the run, see
+        py_raddose_3d.cost.CostModel
+
+        Returns
+        -------
+        CostEstimate
+            The predicted runtime and memory
+        """
+        return self._create_pydantic_model().estimate_cost(self.cost_model)
+
+    def _record_cost(self, start: float, metrics: RunMetrics) -> None:
+        if self.cost_model is not None:
+            self.cost_model.record(
+                self._create_pydantic_model(),
+                time.perf_counter() - start,
+                metrics.peak_rss_mb,
+            )
+
+    def _store_result(self, summary: "pd.DataFrame | Summary") -> None:
+        if self.result_store is None:
+            return
+        try:
+            self.result_store.append(self, summary)
+        except Exception as e:
+            logger.warning(f"Could not store the result of {self.sample_id}: {e}")
+
+    def _read_summary(
+        self, dose_statistics: "DoseStatistics | None" = None
+    ) -> "pd.DataFrame | Summary":
+        results_directory = self._run_prefix + "Summary.csv"
+        if self.as_frame:
+            import pandas as pd
+
+            summary = pd.read_csv(results_directory)
         else:
-            stdout_str = str(stdout, encoding="utf-8")
-            logging.info(stdout_str)
-            warning_list = ["warning", "angular resolution too big", "* warning *"]
+            summary = Summary.read_csv(results_directory)
+        standard_error_path = self._run_prefix + "SummaryStandardError.csv"
+        if path.isfile(standard_error_path):
+            summary.attrs["standard_error"] = Summary.read_csv(
+                standard_error_path
+            ).to_dict()
+        if dose_statistics is not None:
+            dose_statistics.update_from_csv(self._run_prefix + "DoseState.csv")
+            summary.attrs["dose_statistics"] = dose_statistics.to_dict()
+        return summary
 
-            stdout_list = stdout_str.splitlines()
+    def _shards(self) -> list["RadDose3D"] | None:
+        """
+        Splits a Monte Carlo run into independent samples, see
+        py_raddose_3d.montecarlo.split_monte_carlo
 
-            for i, line in enumerate(stdout_list):
-                if any(warning in line.lower() for warning in warning_list):
-                    if "* warning *" in line.lower():
-                        warnings.warn(stdout_list[i + 1], RuntimeWarning)
-                    else:
-                        warnings.warn(line, RuntimeWarning)
+        Returns
+        -------
+        list[RadDose3D] | None
+            The shards, or None if the run is not sharded
+        """
+        if (self.monte_carlo_shards or 1) < 2:
+            return None
+        from .montecarlo import is_monte_carlo, split_monte_carlo
+
+        if not is_monte_carlo(self.crystal):
+            return None
+        crystals = split_monte_carlo(self.crystal, self.monte_carlo_shards)
+        if len(crystals) < 2:
+            return None
+        shards = [
+            RadDose3D(
+                sample_id=f"{self.sample_id}_shard{k:02d}",
+                crystal=crystal,
+                beam=self.beam,
+                wedge=self.wedge,
+                output_directory=path.dirname(self._run_prefix),
+                pool=self.pool,
+                lazy=True,
+                jvm_options=self.jvm_options,
+                assets=self.assets,
+                supervisor=self.supervisor,
+            )
+            for k, crystal in enumerate(crystals)
+        ]
+        for shard in shards:
+            shard._emits_metrics = False
+        return shards
+
+    def _merge_shards(self, shards: list["RadDose3D"]) -> None:
+        """
+        Writes the weighted mean of the shards' Summary and DoseState outputs,
+        and the standard error of the Summary, under this sample's prefix, then
+        removes the sample directories of the shards
+        """
+        from .montecarlo import merge_dose_states, merge_summaries, shard_weight
+
+        weights = [shard_weight(shard.crystal) for shard in shards]
+        summary, standard_error = merge_summaries(
+            [shard._read_summary() for shard in shards], weights
+        )
+        prefix = self._run_prefix
+        summary.to_csv(prefix + "Summary.csv", index=False)
+        standard_error.to_csv(prefix + "SummaryStandardError.csv", index=False)
+
+        dose_states = [shard.prefix + "DoseState.csv" for shard in shards]
+        if all(path.isfile(dose_state) for dose_state in dose_states):
+            merge_dose_states(dose_states, weights, prefix + "DoseState.csv")
+        for shard in shards:
+            shutil.rmtree(shard.sample_directory, ignore_errors=True)
+        logger.info(f"Merged {len(shards)} Monte Carlo shards of {self.sample_id}")
+
+    def load_dose_state(self, sparse: bool = False) -> "DoseGrid | SparseDoseGrid":
+        """
+        Loads the DoseState output of the run as NumPy arrays, see
+        py_raddose_3d.dose_state.load_dose_state. The output may have been
+        compressed or converted by the output policy
+
+        Parameters
+        ----------
+        sparse : bool, optional
+            Return the dose of the crystal voxels only, by default False
 
-            logging.info(f"Results saved to {self.sample_directory}")
+        Returns
+        -------
+        DoseGrid | SparseDoseGrid
+            The dose state, as a dense grid unless sparse=True
+        """
+        from .dose_state import load_dose_state
 
-    def run(self) -> pd.DataFrame:
+        for name in ("DoseState.csv", "DoseState.npz", "DoseState.csv.gz"):
+            if path.isfile(self.prefix + name):
+                return load_dose_state(self.prefix + name, sparse=sparse)
+        raise FileNotFoundError(f"No DoseState output under {self.prefix}")
+
+    def _stream_process(self, parser: StdoutParser, metrics: RunMetrics) -> None:
+        """
+        Runs a one-shot java process, feeding its stdout to parser and both
+        streams to the supervisor line by line, stderr in a background thread.
+        A watchdog thread enforces the supervisor's resource limits
+
+        Parameters
+        ----------
+        parser : StdoutParser
+            The stdout parser
+        metrics : RunMetrics
+            The metrics of the run, which receive the process timings, peak RSS
+            and CPU time
+
+        Raises
+        ------
+        RadDose3DError
+            If the supervisor found a fatal line or an exceeded limit, or the
+            process exited with an error
+        """
+        with metrics.phase("spawn"):
+            process = subprocess.Popen(
+                self._command(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        start = time.perf_counter()
+        supervision = self.supervisor.supervise(self.sample_id, process)
+        supervision.limit(process.pid)
+        stop_watchdog = threading.Event()
+        threads = [
+            threading.Thread(
+                target=supervision.feed_lines,
+                args=(process.stderr, STDERR),
+                daemon=True,
+            )
+        ]
+        if self.supervisor.limits:
+            threads.append(
+                threading.Thread(
+                    target=supervision.watch,
+                    args=(process.pid, stop_watchdog),
+                    daemon=True,
+                )
+            )
+        for thread in threads:
+            thread.start()
+        try:
+            for line in process.stdout:
+                if "first_output" not in metrics.phases:
+                    metrics.add("first_output", time.perf_counter() - start)
+                supervision.feed(line, STDOUT)
+                parser.feed(line)
+            wait_with_rusage(process, metrics)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            stop_watchdog.set()
+            for thread in threads:
+                thread.join()
+            process.stdout.close()
+            process.stderr.close()
+            metrics.add("compute", time.perf_counter() - start)
+            self._finish_launch(process.returncode, metrics)
+        parser.finish()
+        supervision.check(process.returncode)
+
+    async def _stream_process_async(
+        self, parser: StdoutParser, metrics: RunMetrics
+    ) -> None:
+        """
+        Asynchronous version of _stream_process. The java process is killed if
+        the coroutine is cancelled
+
+        Parameters
+        ----------
+        parser : StdoutParser
+            The stdout parser
+        metrics : RunMetrics
+            The metrics of the run, see py_raddose_3d.metrics.sample_process
+        """
+        with metrics.phase("spawn"):
+            process = await asyncio.create_subprocess_exec(
+                *self._command(),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=2**20,
+            )
+        start = time.perf_counter()
+        supervision = self.supervisor.supervise(self.sample_id, process)
+        supervision.limit(process.pid)
+        tasks = [
+            asyncio.ensure_future(sample_process(process, metrics)),
+            asyncio.ensure_future(self._supervise_stderr(process, supervision)),
+        ]
+        if self.supervisor.limits:
+            tasks.append(asyncio.ensure_future(supervision.watch_async(process.pid)))
+        try:
+            async for line in process.stdout:
+                if "first_output" not in metrics.phases:
+                    metrics.add("first_output", time.perf_counter() - start)
+                supervision.feed(line, STDOUT)
+                parser.feed(line)
+            await tasks[1]
+            await process.wait()
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+            metrics.add("compute", time.perf_counter() - start)
+            self._finish_launch(process.returncode, metrics)
+        parser.finish()
+        supervision.check(process.returncode)
+
+    @staticmethod
+    async def _supervise_stderr(
+        process: asyncio.subprocess.Process, supervision: Supervision
+    ) -> None:
+        async for line in process.stderr:
+            supervision.feed(line, STDERR)
+
+    def run(
+        self,
+        progress_callback: ProgressCallback | None = None,
+        dose_statistics: "DoseStatistics | None" = None,
+    ) -> "pd.DataFrame | Summary":
         """
         Executes the raddose3d.jar file and returns a pandas DataFrame
-        with the summary of the run.
+        with the summary of the run (a Summary if as_frame=False).
+
+        Parameters
+        ----------
+        progress_callback : ProgressCallback | None, optional
+            Called with a ProgressEvent for every line of output while the run
+            progresses. If the callback raises, the java process is killed and
+            the exception propagates, by default None
+        dose_statistics : DoseStatistics | None, optional
+            If given, it is updated with the voxel doses of the DoseState output,
+            read in chunks, and its to_dict() is returned in
+            summary.attrs["dose_statistics"], by default None
+
+        The timings and resource usage of the run are returned in
+        summary.attrs["metrics"], kept in self.metrics and passed to the
+        metrics hooks, see py_raddose_3d.metrics
+
+        The run takes no lock on its sample directory: concurrent runs with the
+        same prefix overwrite each other's outputs unless the caller serialises
+        them, e.g. through py_raddose_3d.singleflight.SingleFlight
 
         Returns
         -------
-        pd.DataFrame
+        pd.DataFrame | Summary
             A pandas DataFrame containing the summary of the run
         """
-        process = subprocess.Popen(
-            [
-                "java",
-                "-jar",
-                self.raddose_3d_path,
-                "-i",
-                self.input_text_file_path,
-                "-p",
-                self.prefix,
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        stdout, stderr = process.communicate()
+        self.metrics = RunMetrics(self.sample_id)
+        try:
+            summary = self._run(self.metrics, progress_callback, dose_statistics)
+        except BaseException:
+            self.metrics.status = "error"
+            raise
+        finally:
+            self._end_outputs()
+            self.metrics.finish()
+            if self._emits_metrics:
+                emit_metrics(self.metrics, self.metrics_hook)
+        summary.attrs["metrics"] = self.metrics.to_dict()
+        self._store_result(summary)
+        return summary
 
-        self.print_stdout_and_stderr(stdout, stderr)
+    def _run(
+        self,
+        metrics: RunMetrics,
+        progress_callback: ProgressCallback | None,
+        dose_statistics: "DoseStatistics | None",
+    ) -> "pd.DataFrame | Summary":
+        self._create_sample_directory()
+        self._snapshot_outputs()
+        with metrics.phase("cache_lookup"):
+            restored = self._restore_from_cache()
+        if restored:
+            metrics.mode = "cache"
+            with metrics.phase("output_parse"):
+                summary = self._read_summary(dose_statistics)
+            self._apply_output_policy(metrics)
+            return summary
+        self.prepare()
+        metrics.phases.update(self._prepare_phases)
+        self._begin_outputs()
 
-        results_directory = path.join(
-            self.sample_directory, f"{self.sample_id}-Summary.csv"
-        )
-        return pd.read_csv(results_directory)
+        shards = self._shards()
+        if shards is not None:
+            metrics.mode = "shards"
+            start = time.perf_counter()
+            with metrics.phase("compute"):
+                with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                    list(
+                        executor.map(lambda shard: shard.run(progress_callback), shards)
+                    )
+            return self._finish_shards(metrics, start, shards, dose_statistics)
 
-    async def run_async(self) -> pd.DataFrame:
+        parser = StdoutParser(self.sample_id, progress_callback)
+        start = time.perf_counter()
+        result = self._execute_in_pool(metrics)
+        if result is None:
+            self._stream_process(parser, metrics)
+            result = b"", b""
+        stdout, stderr = result
+        return self._finish(metrics, start, stdout, stderr, parser, dose_statistics)
+
+    async def run_async(
+        self,
+        timeout: float | None = None,
+        progress_callback: ProgressCallback | None = None,
+        dose_statistics: "DoseStatistics | None" = None,
+    ) -> "pd.DataFrame | Summary":
         """
         Executes the raddose3d.jar file asynchronously and returns a pandas
-        DataFrame with the summary of the run.
+        DataFrame with the summary of the run (a Summary if as_frame=False).
+
+        Parameters
+        ----------
+        timeout : float | None, optional
+            Maximum run time in seconds. If the run takes longer, or the awaiting
+            task is cancelled, the java process or the pool worker running it
+            is killed, by default None
+        progress_callback : ProgressCallback | None, optional
+            Called with a ProgressEvent for every line of output while the run
+            progresses, see py_raddose_3d.progress.ProgressStream to consume the
+            events as an async iterator, by default None
+        dose_statistics : DoseStatistics | None, optional
+            If given, it is updated with the voxel doses of the DoseState output,
+            read in chunks, and its to_dict() is returned in
+            summary.attrs["dose_statistics"], by default None
+
+        The timings and resource usage of the run are returned in
+        summary.attrs["metrics"], see run
+
+        Raises
+        ------
+        TimeoutError
+            If the run takes longer than timeout
 
         Returns
         -------
-        pd.DataFrame
+        pd.DataFrame | Summary
             A pandas DataFrame containing the summary of the run
         """
-        cmd = (
-            f"java -jar {self.raddose_3d_path} -i {self.input_text_file_path} "
-            + f"-p {self.prefix}"
-        )
+        self.metrics = RunMetrics(self.sample_id)
+        try:
+            summary = await self._run_async(
+                self.metrics, timeout, progress_callback, dose_statistics
+            )
+        except BaseException:
+            self.metrics.status = "error"
+            raise
+        finally:
+            self._end_outputs()
+            self.metrics.finish()
+            if self._emits_metrics:
+                emit_metrics(self.metrics, self.metrics_hook)
+        summary.attrs["metrics"] = self.metrics.to_dict()
+        self._store_result(summary)
+        return summary
 
-        process = await asyncio.create_subprocess_shell(
-            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
+    async def _run_async(
+        self,
+        metrics: RunMetrics,
+        timeout: float | None,
+        progress_callback: ProgressCallback | None,
+        dose_statistics: "DoseStatistics | None",
+    ) -> "pd.DataFrame | Summary":
+        self._create_sample_directory()
+        self._snapshot_outputs()
+        with metrics.phase("cache_lookup"):
+            restored = self._restore_from_cache()
+        if restored:
+            metrics.mode = "cache"
+            with metrics.phase("output_parse"):
+                summary = self._read_summary(dose_statistics)
+            self._apply_output_policy(metrics)
+            return summary
+        self.prepare()
+        metrics.phases.update(self._prepare_phases)
+        self._begin_outputs()
+
+        shards = self._shards()
+        if shards is not None:
+            metrics.mode = "shards"
+            start = time.perf_counter()
+            with metrics.phase("compute"):
+                async with asyncio.TaskGroup() as tg:
+                    for shard in shards:
+                        tg.create_task(shard.run_async(timeout, progress_callback))
+            return self._finish_shards(metrics, start, shards, dose_statistics)
+
+        parser = StdoutParser(self.sample_id, progress_callback)
+        start = time.perf_counter()
+        result = None
+        if self.pool is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(
+                    None, self._execute_in_pool, metrics, timeout
+                )
+            except asyncio.CancelledError:
+                # The executor thread cannot be interrupted: stop its worker
+                self.pool.cancel(self._run_prefix)
+                raise
+
+        if result is None:
+            try:
+                await asyncio.wait_for(
+                    self._stream_process_async(parser, metrics), timeout
+                )
+            except TimeoutError as e:
+                raise TimeoutError(
+                    f"RADDOSE-3D run of {self.sample_id} exceeded {timeout}s"
+                ) from e
+            result = b"", b""
+        stdout, stderr = result
+        return self._finish(metrics, start, stdout, stderr, parser, dose_statistics)
+
+    def _finish(
+        self,
+        metrics: RunMetrics,
+        start: float,
+        stdout: bytes,
+        stderr: bytes,
+        parser: StdoutParser,
+        dose_statistics: "DoseStatistics | None",
+    ) -> "pd.DataFrame | Summary":
+        """
+        Checks the output of a completed java run, then records its cost,
+        stores it in the cache and reads the summary
+        """
+        with metrics.phase("output_parse"):
+            self.print_stdout_and_stderr(stdout, stderr, parser)
+        self._record_cost(start, metrics)
+        with metrics.phase("cache_store"):
+            self._store_in_cache()
+        with metrics.phase("output_parse"):
+            summary = self._read_summary(dose_statistics)
+        self._apply_output_policy(metrics)
+        return summary
+
+    def _finish_shards(
+        self,
+        metrics: RunMetrics,
+        start: float,
+        shards: list["RadDose3D"],
+        dose_statistics: "DoseStatistics | None",
+    ) -> "pd.DataFrame | Summary":
+        """
+        Merges the outputs of completed Monte Carlo shards, then stores them in
+        the cache and reads the summary. The resource usage of the shards is
+        aggregated: the largest peak RSS and the total CPU time. A single cost
+        sample is recorded for the whole run, with the wall time of the shards
+        """
+        shard_metrics = [shard.metrics for shard in shards]
+        rss = [m.peak_rss_mb for m in shard_metrics if m.peak_rss_mb is not None]
+        if rss:
+            metrics.peak_rss_mb = max(rss)
+        if all(m.cpu_user_s is not None for m in shard_metrics):
+            metrics.cpu_user_s = sum(m.cpu_user_s for m in shard_metrics)
+            metrics.cpu_system_s = sum(m.cpu_system_s for m in shard_metrics)
+        self._record_cost(start, metrics)
+        with metrics.phase("merge"):
+            self._merge_shards(shards)
+        with metrics.phase("cache_store"):
+            self._store_in_cache()
+        with metrics.phase("output_parse"):
+            summary = self._read_summary(dose_statistics)
+        self._apply_output_policy(metrics)
+        return summary
 
-        stdout, stderr = await process.communicate()
+    @classmethod
+    def sweep(
+        cls,
+        crystal: Crystal,
+        beam: Beam,
+        wedge: Wedge | list[Wedge],
+        grid: dict[str, list],
+        sample_id: str = "sweep",
+        output_directory: str | None = None,
+        max_workers: int | None = None,
+        memory_per_job_mb: float = 1024,
+        **kwargs,
+    ) -> "pd.DataFrame":
+        """
+        Runs RADDOSE-3D for every point of a parameter grid and combines the
+        summaries into a single DataFrame
 
-        self.print_stdout_and_stderr(stdout, stderr)
+        Parameters
+        ----------
+        crystal : Crystal
+            A Crystal Pydantic model
+        beam : Beam
+            A Beam pydantic model
+        wedge : Wedge | list[Wedge]
+            A Wedge pydantic model, or a list of Wedges
+        grid : dict[str, list]
+            Values to sweep keyed by parameter name, e.g.
+            {"Beam.Flux": [1e12, 2e12], "Wedge.ExposureTime": [10, 20]}.
+            "Wedge.<field>" changes every wedge, "Wedge[i].<field>" only the i-th
+        sample_id : str, optional
+            Prefix of the sample ids of the runs, which are numbered in grid
+            order, by default "sweep"
+        output_directory : str | None, optional
+            Output directory. If output_directory=None, we use the current
+            working directory, by default None
+        max_workers : int | None, optional
+            Maximum number of concurrent java processes. If max_workers=None,
+            it is derived from the available cores and memory, by default None
+        memory_per_job_mb : float, optional
+            Expected peak memory of one java process in MB, used when
+            max_workers=None, by default 1024
+        **kwargs
+            Passed on to every RadDose3D instance, e.g. pool or cache. Instances
+            are lazy unless lazy=False is given. With a cost_model, the runs
+            predicted to be longest are started first
+
+        Returns
+        -------
+        pd.DataFrame
+            The summaries of all runs, indexed by the swept parameters and the
+            row of each summary
+        """
+        points = expand_grid(grid)
+        kwargs.setdefault("lazy", True)
+        samples = []
+        for i, parameters in enumerate(points):
+            point_crystal, point_beam, point_wedge = apply_parameters(
+                crystal, beam, wedge, parameters
+            )
+            samples.append(
+                cls(
+                    sample_id=f"{sample_id}_{i:04d}",
+                    crystal=point_crystal,
+                    beam=point_beam,
+                    wedge=point_wedge,
+                    output_directory=output_directory,
+                    **kwargs,
+                )
+            )
 
-        results_directory = path.join(
-            self.sample_directory, f"{self.sample_id}-Summary.csv"
+        if max_workers is None:
+            max_workers = default_concurrency(memory_per_job_mb)
+        logger.info(f"Running {len(samples)} samples, {max_workers} at a time")
+
+        # Starting the longest runs first shortens the sweep's total wall time
+        order = list(range(len(samples)))
+        if kwargs.get("cost_model") is not None:
+            costs = [sample.estimate_cost().runtime_s for sample in samples]
+            order.sort(key=lambda i: costs[i], reverse=True)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {i: executor.submit(samples[i].run) for i in order}
+            summaries = [futures[i].result() for i in range(len(samples))]
+
+        import pandas as pd
+
+        return pd.concat(
+            [
+                summary.to_pandas() if isinstance(summary, Summary) else summary
+                for summary in summaries
+            ],
+            keys=[tuple(parameters.values()) for parameters in points],
+            names=list(grid) + ["row"],
         )
-        return pd.read_csv(results_directory)
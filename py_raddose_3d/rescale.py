@@ -0,0 +1,257 @@
+import json
+import logging
+import math
+import threading
+from os import path
+
+import pandas as pd
+
+from .raddose3d import RadDose3D
+from .schemas.input import RadDoseInput
+from .summary import Summary
+
+logger = logging.getLogger(__name__)
+
+# Summary.csv columns are matched on lower-case substrings. Invariant columns
+# are checked first, since e.g. "Dose Inefficiency" also contains "dose"
+INVARIANT_COLUMN_KEYWORDS = (
+    "number",
+    "efficiency",
+    "contrast",
+    "volume",
+    "abs en threshold",
+)
+LINEAR_COLUMN_KEYWORDS = ("dose", "dwd", "energy", "yield", "ad-", "tad")
+
+
+def rescale_key(rad_dose_input: RadDoseInput) -> str:
+    """
+    Serializes an input without Beam.Flux and Wedge.ExposureTime: inputs with
+    the same key only differ in flux and exposure times
+
+    Parameters
+    ----------
+    rad_dose_input : RadDoseInput
+        The raddose input pydantic model
+
+    Returns
+    -------
+    str
+        A JSON representation of the input without flux and exposure times
+    """
+    wedges = rad_dose_input.wedge
+    if not isinstance(wedges, list):
+        wedges = [wedges]
+    canonical = {
+        "crystal": rad_dose_input.crystal.model_dump(exclude_none=True),
+        "beam": rad_dose_input.beam.model_dump(exclude_none=True, exclude={"Flux"}),
+        "wedge": [
+            wedge.model_dump(exclude_none=True, exclude={"ExposureTime"})
+            for wedge in wedges
+        ],
+    }
+    return json.dumps(canonical, sort_keys=True)
+
+
+def rescale_factor(reference: RadDoseInput, target: RadDoseInput) -> float | None:
+    """
+    Returns the factor by which every dose of the reference run must be
+    multiplied to obtain the target run, or None if the target cannot be
+    derived from the reference analytically.
+
+    Doses scale linearly with the fluence, i.e. flux times exposure time, when:
+
+    - the inputs only differ in Beam.Flux and Wedge.ExposureTime
+    - Crystal.Subprogram is not set: Monte Carlo results are stochastic and
+      XFEL runs depend on the pulse structure
+    - Beam.PulseEnergy is not set
+    - the fluence of every wedge changes by the same factor, so that the dose
+      accumulated by each wedge scales like the total
+
+    RADDOSE-3D's default dose decay model is assumed, which is the only one
+    these schemas can select: diffraction is not attenuated by dose, so the
+    diffraction-weighted doses scale linearly too.
+
+    Parameters
+    ----------
+    reference : RadDoseInput
+        The input of the completed run
+    target : RadDoseInput
+        The input to derive
+
+    Returns
+    -------
+    float | None
+        The scaling factor, or None if rescaling is not valid
+    """
+    if rescale_key(reference) != rescale_key(target):
+        return None
+    if (
+        reference.crystal.Subprogram is not None
+        or reference.beam.PulseEnergy is not None
+    ):
+        return None
+    if reference.beam.Flux == 0:
+        return None
+
+    reference_wedges = reference.wedge
+    target_wedges = target.wedge
+    if not isinstance(reference_wedges, list):
+        reference_wedges = [reference_wedges]
+    if not isinstance(target_wedges, list):
+        target_wedges = [target_wedges]
+
+    flux_ratio = target.beam.Flux / reference.beam.Flux
+    factors = []
+    for reference_wedge, target_wedge in zip(reference_wedges, target_wedges):
+        if reference_wedge.ExposureTime == 0:
+            return None
+        factors.append(
+            flux_ratio * target_wedge.ExposureTime / reference_wedge.ExposureTime
+        )
+    if not all(math.isclose(factor, factors[0], rel_tol=1e-9) for factor in factors):
+        return None
+    return factors[0]
+
+
+def rescale_summary(
+    summary: "pd.DataFrame | Summary", factor: float
+) -> "pd.DataFrame | Summary":
+    """
+    Scales the dose, energy and yield columns of a summary
+
+    Parameters
+    ----------
+    summary : pd.DataFrame | Summary
+        The summary of the reference run
+    factor : float
+        The scaling factor, see rescale_factor
+
+    Returns
+    -------
+    pd.DataFrame | Summary
+        The rescaled summary, of the same type as summary
+
+    Raises
+    ------
+    ValueError
+        If a column is not known to be either invariant or linear in the fluence
+    """
+    rescaled = summary.copy()
+    for column in summary.columns:
+        name = str(column).strip().lower()
+        if any(keyword in name for keyword in INVARIANT_COLUMN_KEYWORDS):
+            continue
+        if any(keyword in name for keyword in LINEAR_COLUMN_KEYWORDS):
+            rescaled[column] = [value * factor for value in summary[column]]
+        else:
+            raise ValueError(f"Do not know how to rescale Summary column {column}")
+    return rescaled
+
+
+def rescale_dose_state(
+    csv_path: str, output_path: str, factor: float, chunksize: int = 1_000_000
+) -> None:
+    """
+    Writes a DoseState.csv with the dose column of another one scaled. The
+    coordinates and the remaining columns are copied unchanged
+
+    Parameters
+    ----------
+    csv_path : str
+        Path of the DoseState.csv of the reference run
+    output_path : str
+        Path of the rescaled DoseState.csv
+    factor : float
+        The scaling factor, see rescale_factor
+    chunksize : int, optional
+        Number of rows processed at a time, by default 1,000,000
+    """
+    reader = pd.read_csv(csv_path, header=None, chunksize=chunksize)
+    with open(output_path, "w") as fp:
+        for chunk in reader:
+            chunk[3] = chunk[3] * factor
+            chunk.to_csv(fp, header=False, index=False)
+
+
+class DoseRescaler:
+    """
+    Derives runs that only differ in flux and exposure time from completed
+    reference runs instead of running RADDOSE-3D again. Samples without a
+    suitable reference are run normally and become references themselves.
+
+    Only the Summary.csv and DoseState.csv outputs are written for rescaled
+    samples; the other RADDOSE-3D outputs are not reproduced.
+    """
+
+    def __init__(self) -> None:
+        self._references: dict[tuple[str, str], list[RadDose3D]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, sample: RadDose3D) -> tuple[str, str]:
+        return sample.raddose_3d_path, rescale_key(sample._create_pydantic_model())
+
+    def add_reference(self, sample: RadDose3D) -> None:
+        """
+        Registers a sample that has been run successfully as a reference
+        """
+        key = self._key(sample)
+        with self._lock:
+            self._references.setdefault(key, []).append(sample)
+
+    def find_reference(self, sample: RadDose3D) -> tuple[RadDose3D, float] | None:
+        """
+        Returns a reference the sample can be derived from and the scaling
+        factor, or None
+        """
+        target = sample._create_pydantic_model()
+        with self._lock:
+            references = list(self._references.get(self._key(sample), []))
+        for reference in references:
+            factor = rescale_factor(reference._create_pydantic_model(), target)
+            if factor is not None:
+                return reference, factor
+        return None
+
+    def run(self, sample: RadDose3D, **kwargs) -> "pd.DataFrame | Summary":
+        """
+        Rescales a reference run if possible, otherwise runs the sample
+
+        Parameters
+        ----------
+        sample : RadDose3D
+            The sample
+        **kwargs
+            Passed on to RadDose3D.run when the sample has to be run
+
+        Returns
+        -------
+        pd.DataFrame | Summary
+            The summary of the run, a Summary if sample.as_frame is False
+        """
+        match = self.find_reference(sample)
+        if match is not None:
+            reference, factor = match
+            try:
+                summary = rescale_summary(
+                    Summary.read_csv(reference.prefix + "Summary.csv"), factor
+                )
+            except ValueError as e:
+                logger.info(f"Cannot rescale {reference.sample_id}: {e}")
+            else:
+                sample._create_sample_directory()
+                summary.to_csv(sample.prefix + "Summary.csv")
+                dose_state_path = reference.prefix + "DoseState.csv"
+                if path.isfile(dose_state_path):
+                    rescale_dose_state(
+                        dose_state_path, sample.prefix + "DoseState.csv", factor
+                    )
+                logger.info(
+                    f"Results of {sample.sample_id} rescaled from "
+                    f"{reference.sample_id} by a factor of {factor:.6g}"
+                )
+                return summary.to_pandas() if sample.as_frame else summary
+
+        summary = sample.run(**kwargs)
+        self.add_reference(sample)
+        return summary
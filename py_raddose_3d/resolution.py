@@ -0,0 +1,303 @@
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from os import makedirs, path, replace
+
+import pandas as pd
+
+from .raddose3d import RadDose3D
+from .schemas.input import Beam, Crystal, Wedge
+from .singleflight import DirectoryLock
+from .sweep import apply_parameters
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS = ("Average DWD", "Max Dose")
+
+
+def _significant(value: float, digits: int = 2) -> float:
+    if value == 0:
+        return 0.0
+    return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+
+def _rounded(value) -> list | None:
+    if value is None:
+        return None
+    items = []
+    for item in str(value).split():
+        try:
+            items.append(_significant(float(item)))
+        except ValueError:
+            items.append(item.lower())
+    return items
+
+
+def geometry(crystal: Crystal, beam: Beam) -> dict:
+    """
+    Describes a crystal shape and beam combination. Dimensions and beam sizes
+    are rounded to two significant figures, so that similar geometries compare
+    equal
+
+    Parameters
+    ----------
+    crystal : Crystal
+        A Crystal Pydantic model
+    beam : Beam
+        A Beam pydantic model
+
+    Returns
+    -------
+    dict
+        The crystal type and dimensions, and the beam type, FWHM and collimation
+    """
+    return {
+        "crystal": [crystal.Type.lower(), _rounded(crystal.Dimensions)],
+        "beam": [beam.Type.lower(), _rounded(beam.FWHM), _rounded(beam.Collimation)],
+    }
+
+
+class ResolutionCache:
+    """
+    Remembers the PixelsPerMicron chosen for a geometry and tolerance in a JSON
+    file, so that later selections start at the right level.
+
+    Updates hold a DirectoryLock on the directory of the file and replace the
+    file atomically, so that concurrent selections, in threads or processes,
+    neither lose each other's entries nor read a partly written file.
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        """
+        Parameters
+        ----------
+        cache_path : str
+            Path of the JSON file
+        """
+        self.cache_path = path.expanduser(cache_path)
+
+    def _load(self) -> dict[str, float]:
+        if not path.isfile(self.cache_path):
+            return {}
+        with open(self.cache_path) as fp:
+            return json.load(fp)
+
+    def get(self, key: str) -> float | None:
+        return self._load().get(key)
+
+    def put(self, key: str, pixels_per_micron: float) -> None:
+        directory = path.dirname(path.abspath(self.cache_path))
+        makedirs(directory, exist_ok=True)
+        with DirectoryLock(directory):
+            entries = self._load()
+            entries[key] = pixels_per_micron
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as fp:
+                json.dump(entries, fp, indent=2, sort_keys=True)
+            replace(tmp_path, self.cache_path)
+
+
+@dataclass(frozen=True)
+class ResolutionLevel:
+    """
+    One run of the resolution ladder
+    """
+
+    pixels_per_micron: float
+    metrics: dict[str, float]
+    wall_time: float
+
+
+@dataclass
+class ResolutionResult:
+    """
+    The outcome of AdaptiveResolution.select
+    """
+
+    pixels_per_micron: float
+    converged: bool
+    summary: pd.DataFrame
+    levels: list[ResolutionLevel] = field(default_factory=list)
+
+    @property
+    def compute_time(self) -> float:
+        """
+        Total wall time of the runs in seconds
+        """
+        return sum(level.wall_time for level in self.levels)
+
+
+class AdaptiveResolution:
+    """
+    Chooses Crystal.PixelsPerMicron by running the same input at increasing
+    resolutions until the Summary metrics of two consecutive levels agree
+    within rtol. The coarser of the two levels is selected, since it already
+    meets the tolerance; the summary returned is that of the finer level.
+
+    The ladder starts with initial_voxels voxels across the smallest crystal
+    dimension and each level multiplies PixelsPerMicron by growth. With a
+    ResolutionCache, the level chosen for a similar geometry is used as the
+    starting point instead, which usually needs only two runs.
+    """
+
+    def __init__(
+        self,
+        crystal: Crystal,
+        beam: Beam,
+        wedge: Wedge | list[Wedge],
+        metrics: tuple[str, ...] = DEFAULT_METRICS,
+        rtol: float = 0.02,
+        initial_voxels: float = 8,
+        growth: float = math.sqrt(2),
+        max_levels: int = 8,
+        cache: ResolutionCache | None = None,
+        sample_id: str = "resolution",
+        output_directory: str | None = None,
+        **kwargs,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        crystal : Crystal
+            A Crystal Pydantic model. Its PixelsPerMicron is ignored
+        beam : Beam
+            A Beam pydantic model
+        wedge : Wedge | list[Wedge]
+            A Wedge pydantic model, or a list of Wedges
+        metrics : tuple[str, ...], optional
+            Summary columns compared between levels, in every row,
+            by default ("Average DWD", "Max Dose")
+        rtol : float, optional
+            Relative tolerance on the metrics, by default 0.02
+        initial_voxels : float, optional
+            Number of voxels across the smallest crystal dimension at the
+            first level, by default 8
+        growth : float, optional
+            Factor between the PixelsPerMicron of successive levels,
+            by default sqrt(2)
+        max_levels : int, optional
+            Maximum number of runs, by default 8
+        cache : ResolutionCache | None, optional
+            Cache of the levels chosen for previous geometries, by default None
+        sample_id : str, optional
+            Prefix of the sample ids of the runs, by default "resolution"
+        output_directory : str | None, optional
+            Output directory. If output_directory=None, we use the current
+            working directory, by default None
+        **kwargs
+            Passed on to every RadDose3D instance, e.g. pool or cache
+        """
+        if growth <= 1:
+            raise ValueError("growth must be greater than 1")
+        if max_levels < 2:
+            raise ValueError("max_levels must be at least 2")
+
+        self.crystal = crystal
+        self.beam = beam
+        self.wedge = wedge
+        self.metrics = metrics
+        self.rtol = rtol
+        self.initial_voxels = initial_voxels
+        self.growth = growth
+        self.max_levels = max_levels
+        self.cache = cache
+        self.sample_id = sample_id
+        self.output_directory = output_directory
+        self.kwargs = kwargs
+
+    def cache_key(self) -> str:
+        """
+        Identifies the geometry, metrics and tolerance in a ResolutionCache
+        """
+        key = geometry(self.crystal, self.beam)
+        key.update(metrics=list(self.metrics), rtol=self.rtol)
+        return json.dumps(key, sort_keys=True)
+
+    def initial_pixels_per_micron(self) -> float:
+        """
+        The resolution of the first level
+        """
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key())
+            if cached is not None:
+                logger.info(f"Starting at the cached PixelsPerMicron={cached}")
+                return cached
+        dimensions = [float(item) for item in str(self.crystal.Dimensions).split()]
+        return self.initial_voxels / min(dimensions)
+
+    def _run_level(
+        self, number: int, pixels_per_micron: float
+    ) -> tuple[ResolutionLevel, pd.DataFrame]:
+        crystal, beam, wedge = apply_parameters(
+            self.crystal,
+            self.beam,
+            self.wedge,
+            {"Crystal.PixelsPerMicron": pixels_per_micron},
+        )
+        sample = RadDose3D(
+            sample_id=f"{self.sample_id}_{number:02d}",
+            crystal=crystal,
+            beam=beam,
+            wedge=wedge,
+            output_directory=self.output_directory,
+            lazy=True,
+            **self.kwargs,
+        )
+        start = time.perf_counter()
+        summary = sample.run()
+        level = ResolutionLevel(
+            pixels_per_micron=pixels_per_micron,
+            metrics={
+                f"{metric}[{row}]": float(value)
+                for metric in self.metrics
+                for row, value in enumerate(summary[metric])
+            },
+            wall_time=time.perf_counter() - start,
+        )
+        logger.info(f"PixelsPerMicron={pixels_per_micron:.4g}: {level.metrics}")
+        return level, summary
+
+    def _agree(self, coarse: ResolutionLevel, fine: ResolutionLevel) -> bool:
+        return all(
+            math.isclose(coarse.metrics[name], value, rel_tol=self.rtol)
+            for name, value in fine.metrics.items()
+        )
+
+    def select(self) -> ResolutionResult:
+        """
+        Runs the resolution ladder until two consecutive levels agree
+
+        Returns
+        -------
+        ResolutionResult
+            The selected PixelsPerMicron, the summary of the finest level run
+            and the levels
+        """
+        pixels_per_micron = self.initial_pixels_per_micron()
+        levels = []
+        previous, summary = self._run_level(0, pixels_per_micron)
+        levels.append(previous)
+        for number in range(1, self.max_levels):
+            pixels_per_micron *= self.growth
+            level, summary = self._run_level(number, pixels_per_micron)
+            levels.append(level)
+            if self._agree(previous, level):
+                if self.cache is not None:
+                    self.cache.put(self.cache_key(), previous.pixels_per_micron)
+                return ResolutionResult(
+                    pixels_per_micron=previous.pixels_per_micron,
+                    converged=True,
+                    summary=summary,
+                    levels=levels,
+                )
+            previous = level
+
+        logger.warning(f"The metrics did not converge within {self.max_levels} levels")
+        return ResolutionResult(
+            pixels_per_micron=previous.pixels_per_micron,
+            converged=False,
+            summary=summary,
+            levels=levels,
+        )
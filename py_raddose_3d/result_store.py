@@ -0,0 +1,480 @@
+import hashlib
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from importlib.util import find_spec
+from os import makedirs, path, remove, replace
+from typing import TYPE_CHECKING, Iterable, Iterator
+from uuid import uuid4
+
+import pandas as pd
+
+from .cache import canonical_input
+from .schemas.input import RadDoseInput
+from .singleflight import DirectoryLock
+
+if TYPE_CHECKING:
+    from .raddose3d import RadDose3D
+    from .summary import Summary
+
+logger = logging.getLogger(__name__)
+
+# File extension of the parts of each storage format. Parquet needs the
+# optional pyarrow dependency
+FORMATS = {"parquet": ".parquet", "csv": ".csv.gz"}
+
+KEY_COLUMNS = ("sample_id", "input_hash", "recorded_at")
+
+# A filter is (column, operator, value), as in pandas.read_parquet
+Filter = tuple[str, str, object]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    file TEXT PRIMARY KEY,
+    partition TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    sample_id TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    file TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_sample_id ON runs (sample_id);
+CREATE INDEX IF NOT EXISTS runs_input_hash ON runs (input_hash);
+CREATE INDEX IF NOT EXISTS runs_file ON runs (file);
+CREATE INDEX IF NOT EXISTS parts_partition ON parts (partition, rows);
+"""
+
+_OPERATORS = {
+    "==": lambda column, value: column == value,
+    "=": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "in": lambda column, value: column.isin(value),
+    "not in": lambda column, value: ~column.isin(value),
+}
+
+
+def input_hash(rad_dose_input: RadDoseInput) -> str:
+    """
+    A hash of the canonical serialization of an input (see
+    py_raddose_3d.cache.canonical_input). Unlike RadDose3D.cache_key it does not
+    depend on the jar, so runs of the same input by different RADDOSE-3D
+    versions share it
+    """
+    return hashlib.sha256(canonical_input(rad_dose_input).encode()).hexdigest()
+
+
+def _flatten(prefix: str, values: dict) -> dict:
+    flat = {}
+    for name, value in values.items():
+        key = f"{prefix}.{name}"
+        if isinstance(value, dict):
+            flat.update(_flatten(key, value))
+        elif value is None or isinstance(value, (bool, int, float, str)):
+            flat[key] = value
+        else:
+            flat[key] = str(value)
+    return flat
+
+
+def summary_records(
+    sample_id: str,
+    rad_dose_input: RadDoseInput,
+    summary: "pd.DataFrame | Summary",
+    recorded_at: datetime | None = None,
+) -> pd.DataFrame:
+    """
+    The rows a run adds to a ResultStore: one per row of its summary, with the
+    input parameters as "Crystal.<field>", "Beam.<field>" and "Wedge.<field>"
+    columns (of the wedge of that row), and the run metrics found in
+    summary.attrs["metrics"] as "metrics.<field>" columns
+
+    Parameters
+    ----------
+    sample_id : str
+        Sample id of the run
+    rad_dose_input : RadDoseInput
+        The input of the run
+    summary : pd.DataFrame | Summary
+        The summary returned by the run
+    recorded_at : datetime | None, optional
+        Time of the run. If None, the current time, by default None
+
+    Returns
+    -------
+    pd.DataFrame
+        The rows
+    """
+    if not isinstance(summary, pd.DataFrame):
+        summary = summary.to_pandas()
+    if recorded_at is None:
+        recorded_at = datetime.now(timezone.utc)
+    wedges = rad_dose_input.wedge
+    if not isinstance(wedges, list):
+        wedges = [wedges]
+
+    common = {
+        "sample_id": sample_id,
+        "input_hash": input_hash(rad_dose_input),
+        "recorded_at": recorded_at.isoformat(),
+    }
+    common.update(
+        _flatten("Crystal", rad_dose_input.crystal.model_dump(exclude_none=True))
+    )
+    common.update(_flatten("Beam", rad_dose_input.beam.model_dump(exclude_none=True)))
+    metrics = summary.attrs.get("metrics")
+    if metrics is not None:
+        common.update(_flatten("metrics", metrics))
+
+    rows = []
+    for i, row in enumerate(summary.to_dict(orient="records")):
+        record = dict(common)
+        wedge = wedges[min(i, len(wedges) - 1)]
+        record.update(_flatten("Wedge", wedge.model_dump(exclude_none=True)))
+        record.update(row)
+        rows.append(record)
+    return pd.DataFrame(rows)
+
+
+def _apply_filters(frame: pd.DataFrame, filters: Iterable[Filter]) -> pd.DataFrame:
+    mask = pd.Series(True, index=frame.index)
+    for column, operator, value in filters:
+        if operator not in _OPERATORS:
+            raise ValueError(f"Unsupported filter operator {operator!r}")
+        if column not in frame:
+            # Rows of parts written before the column existed cannot match
+            mask &= False
+            continue
+        mask &= _OPERATORS[operator](frame[column], value)
+    return frame[mask]
+
+
+class ResultStore:
+    """
+    A columnar dataset of the summaries of many runs, so that a campaign can be
+    queried without globbing thousands of sample directories.
+
+    Every run appends one row per Summary row, with its sample id, input hash,
+    input parameters and run metrics, as a new part file in a partition per day
+    under root. A SQLite index maps sample ids and input hashes to the parts
+    holding them, so that queries by either only read those parts. compact
+    merges small parts into larger ones. Appends and compactions hold a
+    DirectoryLock on root, so that they are safe from several threads or
+    processes; queries take no lock.
+
+    Parts are Parquet files if pyarrow is installed, and gzipped CSV files
+    otherwise.
+    """
+
+    def __init__(
+        self, root: str, format: str | None = None, busy_timeout: float = 60.0
+    ) -> None:
+        """
+        Parameters
+        ----------
+        root : str
+            Directory of the dataset, created if it does not exist
+        format : str | None, optional
+            Format of the part files written, "parquet" or "csv". If None,
+            "parquet" if pyarrow is installed and "csv" otherwise. Parts of both
+            formats can be read, by default None
+        busy_timeout : float, optional
+            Seconds to wait for the store lock or the index lock held by
+            another thread or process, by default 60
+        """
+        if format is None:
+            format = "parquet" if find_spec("pyarrow") is not None else "csv"
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported format {format!r}, use one of {FORMATS}")
+        self.root = root
+        self.format = format
+        self.busy_timeout = busy_timeout
+        self.index_path = path.join(root, "index.sqlite")
+
+        makedirs(root, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(
+            self.index_path, timeout=self.busy_timeout, isolation_level=None
+        )
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _lock(self) -> DirectoryLock:
+        return DirectoryLock(self.root, self.busy_timeout)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT COALESCE(SUM(rows), 0) FROM parts"
+            ).fetchone()[0]
+
+    def _write_part(self, frame: pd.DataFrame, partition: str) -> str:
+        """
+        Writes a new part file atomically and returns its path relative to root
+        """
+        file = path.join(partition, f"part-{uuid4().hex}{FORMATS[self.format]}")
+        file_path = path.join(self.root, file)
+        makedirs(path.dirname(file_path), exist_ok=True)
+        tmp_path = file_path + ".tmp"
+        if self.format == "parquet":
+            frame.to_parquet(tmp_path, index=False)
+        else:
+            frame.to_csv(tmp_path, index=False, compression="gzip")
+        replace(tmp_path, file_path)
+        return file
+
+    def _read_part(self, file: str, columns: set[str] | None) -> pd.DataFrame:
+        file_path = path.join(self.root, file)
+        if file.endswith(FORMATS["parquet"]):
+            import pyarrow.parquet as pq
+
+            if columns is not None:
+                names = pq.read_schema(file_path).names
+                columns = [name for name in names if name in columns]
+            return pq.read_table(file_path, columns=columns).to_pandas()
+        usecols = None if columns is None else (lambda name: name in columns)
+        return pd.read_csv(
+            file_path, usecols=usecols, dtype=dict.fromkeys(KEY_COLUMNS, str)
+        )
+
+    def append_records(self, records: pd.DataFrame) -> None:
+        """
+        Appends rows built by summary_records
+
+        Parameters
+        ----------
+        records : pd.DataFrame
+            The rows, which must have sample_id, input_hash and recorded_at
+            columns
+        """
+        missing = [column for column in KEY_COLUMNS if column not in records]
+        if missing:
+            raise ValueError(f"Records are missing the columns {missing}")
+        if records.empty:
+            return
+
+        partitions = "date=" + records["recorded_at"].str.slice(0, 10)
+        with self._lock():
+            parts = []
+            for partition, frame in records.groupby(partitions, sort=False):
+                parts.append((self._write_part(frame, partition), partition, frame))
+
+            with self._transaction() as connection:
+                for file, partition, frame in parts:
+                    connection.execute(
+                        "INSERT INTO parts (file, partition, rows, created)"
+                        " VALUES (?, ?, ?, ?)",
+                        (file, partition, len(frame), time.time()),
+                    )
+                    connection.executemany(
+                        "INSERT INTO runs (sample_id, input_hash, recorded_at, file)"
+                        " VALUES (?, ?, ?, ?)",
+                        [
+                            (*keys, file)
+                            for keys in frame[list(KEY_COLUMNS)]
+                            .drop_duplicates()
+                            .itertuples(index=False)
+                        ],
+                    )
+
+    def append(self, sample: "RadDose3D", summary: "pd.DataFrame | Summary") -> None:
+        """
+        Appends the summary of a run
+
+        Parameters
+        ----------
+        sample : RadDose3D
+            The sample that was run
+        summary : pd.DataFrame | Summary
+            The summary returned by its run, with the run metrics in
+            summary.attrs["metrics"]
+        """
+        self.append_records(
+            summary_records(sample.sample_id, sample._create_pydantic_model(), summary)
+        )
+
+    def _files(
+        self,
+        sample_id: str | list[str] | None,
+        input_hash: str | list[str] | None,
+    ) -> list[str]:
+        conditions = []
+        parameters: list[str] = []
+        for column, values in (("sample_id", sample_id), ("input_hash", input_hash)):
+            if values is None:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            parameters += values
+        with self._connect() as connection:
+            if conditions:
+                rows = connection.execute(
+                    "SELECT DISTINCT file FROM runs WHERE " + " AND ".join(conditions),
+                    parameters,
+                )
+            else:
+                rows = connection.execute("SELECT file FROM parts")
+            return sorted(row[0] for row in rows)
+
+    def query(
+        self,
+        sample_id: str | list[str] | None = None,
+        input_hash: str | list[str] | None = None,
+        filters: list[Filter] | None = None,
+        columns: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """
+        Reads the rows of the store matching all the given conditions
+
+        Parameters
+        ----------
+        sample_id : str | list[str] | None, optional
+            Sample id(s) to select, looked up in the index, by default None
+        input_hash : str | list[str] | None, optional
+            Input hash(es) to select (see input_hash), looked up in the index,
+            by default None
+        filters : list[tuple[str, str, object]] | None, optional
+            Conditions (column, operator, value) on any column, e.g.
+            [("Beam.Flux", ">=", 1e12), ("Wedge Number", "==", 1)]. Operators
+            are ==, !=, <, <=, >, >=, in and not in, by default None
+        columns : list[str] | None, optional
+            Columns to return. If None, all columns, by default None
+
+        Returns
+        -------
+        pd.DataFrame
+            The matching rows, in the order they were recorded
+        """
+        filters = list(filters or [])
+        if sample_id is not None:
+            filters.append(
+                (
+                    "sample_id",
+                    "in",
+                    [sample_id] if isinstance(sample_id, str) else sample_id,
+                )
+            )
+        if input_hash is not None:
+            filters.append(
+                (
+                    "input_hash",
+                    "in",
+                    [input_hash] if isinstance(input_hash, str) else input_hash,
+                )
+            )
+        wanted = None
+        if columns is not None:
+            wanted = set(columns) | {column for column, _, _ in filters}
+            wanted.add("recorded_at")
+
+        # A concurrent compact may remove parts after the index was read
+        for attempt in range(2):
+            try:
+                frames = [
+                    _apply_filters(self._read_part(file, wanted), filters)
+                    for file in self._files(sample_id, input_hash)
+                ]
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        result = pd.concat(frames, ignore_index=True)
+        result = result.sort_values("recorded_at", kind="stable", ignore_index=True)
+        if columns is not None:
+            result = result.reindex(columns=columns)
+        return result
+
+    def compact(self, target_rows: int = 100_000) -> int:
+        """
+        Merges the parts of each partition smaller than target_rows into parts
+        of up to target_rows rows. Appends and other compactions wait until it
+        finishes
+
+        Parameters
+        ----------
+        target_rows : int, optional
+            Number of rows of the merged parts, by default 100000
+
+        Returns
+        -------
+        int
+            The number of parts removed
+        """
+        with self._lock():
+            with self._connect() as connection:
+                small = connection.execute(
+                    "SELECT partition, file, rows FROM parts WHERE rows < ?"
+                    " ORDER BY partition, created",
+                    (target_rows,),
+                ).fetchall()
+
+            groups: list[list[tuple[str, int]]] = []
+            current_partition = None
+            for partition, file, rows in small:
+                if (
+                    partition != current_partition
+                    or sum(r for _, r in groups[-1]) + rows > target_rows
+                ):
+                    groups.append([])
+                    current_partition = partition
+                groups[-1].append((file, rows))
+
+            removed = 0
+            for group in groups:
+                if len(group) < 2:
+                    continue
+                files = [file for file, _ in group]
+                frame = pd.concat(
+                    [self._read_part(file, None) for file in files], ignore_index=True
+                )
+                partition = path.dirname(files[0])
+                merged = self._write_part(frame, partition)
+                placeholders = ", ".join("?" * len(files))
+                with self._transaction() as connection:
+                    connection.execute(
+                        "INSERT INTO parts (file, partition, rows, created)"
+                        " VALUES (?, ?, ?, ?)",
+                        (merged, partition, len(frame), time.time()),
+                    )
+                    connection.execute(
+                        f"UPDATE runs SET file = ? WHERE file IN ({placeholders})",
+                        [merged, *files],
+                    )
+                    connection.execute(
+                        f"DELETE FROM parts WHERE file IN ({placeholders})", files
+                    )
+                for file in files:
+                    remove(path.join(self.root, file))
+                removed += len(files)
+        logger.info(f"Compacted {removed} parts of {self.root}")
+        return removed
@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import TYPE_CHECKING, Iterable
+
+from .cost import CostModel
+from .raddose3d import RadDose3D
+from .summary import Summary
+from .sweep import default_concurrency
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncScheduler:
+    """
+    Runs RadDose3D instances asynchronously with a bounded number of java
+    processes at once and, optionally, a bound on their total expected memory.
+
+    Jobs are started in submission order. A job that does not fit in the
+    remaining memory blocks the jobs behind it, so large jobs are never starved
+    by a stream of small ones. A job is always allowed to start when nothing
+    else is running, even if its memory estimate exceeds memory_limit_mb.
+
+    With a cost_model, jobs are started shortest predicted runtime first, and
+    their memory estimates and timeouts are derived from the model's
+    predictions unless given explicitly.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        memory_limit_mb: float | None = None,
+        job_memory_mb: float = 1024,
+        timeout: float | None = None,
+        cost_model: CostModel | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        max_concurrency : int | None, optional
+            Maximum number of runs in flight. If max_concurrency=None, it is
+            derived from the available cores and memory, by default None
+        memory_limit_mb : float | None, optional
+            Maximum total expected memory of the runs in flight in MB,
+            by default None
+        job_memory_mb : float, optional
+            Expected memory of a run in MB, used when a job does not provide its
+            own estimate, by default 1024
+        timeout : float | None, optional
+            Default maximum run time of a job in seconds, by default None
+        cost_model : CostModel | None, optional
+            Predicts the runtime and memory of each job, by default None
+        """
+        if max_concurrency is None:
+            max_concurrency = default_concurrency(job_memory_mb)
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self.memory_limit_mb = memory_limit_mb
+        self.job_memory_mb = job_memory_mb
+        self.timeout = timeout
+        self.cost_model = cost_model
+
+        self._condition = asyncio.Condition()
+        self._waiting: list[tuple[float, int]] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._memory_in_use = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of jobs waiting for a slot
+        """
+        return len(self._waiting)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of jobs currently running
+        """
+        return self._in_flight
+
+    @property
+    def memory_in_use_mb(self) -> float:
+        """
+        Total expected memory of the jobs currently running in MB
+        """
+        return self._memory_in_use
+
+    def _fits(self, memory_mb: float) -> bool:
+        if self._in_flight >= self.max_concurrency:
+            return False
+        if self.memory_limit_mb is None or self._in_flight == 0:
+            return True
+        return self._memory_in_use + memory_mb <= self.memory_limit_mb
+
+    async def _acquire(self, memory_mb: float, priority: float) -> None:
+        ticket = (priority, next(self._sequence))
+        async with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                await self._condition.wait_for(
+                    lambda: self._waiting[0] == ticket and self._fits(memory_mb)
+                )
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                # The next job in line may be able to start now
+                self._condition.notify_all()
+            self._in_flight += 1
+            self._memory_in_use += memory_mb
+
+    async def _release(self, memory_mb: float) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._memory_in_use -= memory_mb
+            self._condition.notify_all()
+
+    async def run(
+        self,
+        sample: RadDose3D,
+        memory_mb: float | None = None,
+        timeout: float | None = None,
+        priority: float | None = None,
+    ) -> "pd.DataFrame | Summary":
+        """
+        Waits for a free slot, then runs a sample. If the awaiting task is
+        cancelled, the sample leaves the queue or its java process is killed
+
+        Parameters
+        ----------
+        sample : RadDose3D
+            The sample to run
+        memory_mb : float | None, optional
+            Expected memory of the run in MB. If memory_mb=None, the cost
+            model's prediction or job_memory_mb is used, by default None
+        timeout : float | None, optional
+            Maximum run time in seconds, not counting the time spent queued.
+            If timeout=None, the scheduler's timeout is used, or one derived
+            from the cost model's prediction, by default None
+        priority : float | None, optional
+            Jobs with a lower priority value start first, jobs with equal
+            priority start in submission order. If priority=None, the
+            predicted runtime is used with a cost model and 0 otherwise,
+            by default None
+
+        Returns
+        -------
+        pd.DataFrame | Summary
+            The summary of the run
+        """
+        if self.cost_model is not None:
+            estimate = sample._create_pydantic_model().estimate_cost(self.cost_model)
+            if memory_mb is None:
+                memory_mb = estimate.memory_mb
+            if timeout is None and self.timeout is None:
+                timeout = estimate.timeout()
+            if priority is None:
+                priority = estimate.runtime_s
+        if memory_mb is None:
+            memory_mb = self.job_memory_mb
+        if timeout is None:
+            timeout = self.timeout
+        if priority is None:
+            priority = 0.0
+
+        await self._acquire(memory_mb, priority)
+        try:
+            logger.info(
+                f"Starting {sample.sample_id} ({self.in_flight} in flight, "
+                f"{self.queue_depth} queued)"
+            )
+            return await sample.run_async(timeout=timeout)
+        finally:
+            await self._release(memory_mb)
+
+    async def run_all(
+        self, samples: Iterable[RadDose3D]
+    ) -> "list[pd.DataFrame | Summary]":
+        """
+        Runs samples through the scheduler. If one fails, the others are cancelled
+
+        Parameters
+        ----------
+        samples : Iterable[RadDose3D]
+            The samples to run
+
+        Returns
+        -------
+        list[pd.DataFrame | Summary]
+            The summaries, in the order of samples
+        """
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(self.run(sample)) for sample in samples]
+        return [task.result() for task in tasks]
@@ -0,0 +1,347 @@
+import gzip
+import hashlib
+import logging
+import re
+import shutil
+import threading
+from os import link, makedirs, path, remove, replace, stat
+from uuid import uuid4
+
+from .input import RadDoseInput
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ASSET_DIRECTORY = path.join("~", ".cache", "py_raddose_3d", "assets")
+
+# Input fields naming files that RADDOSE-3D reads, as (block, field)
+FILE_FIELDS = (
+    ("crystal", "ModelFile"),
+    ("crystal", "SeqFile"),
+    ("crystal", "CIF"),
+    ("beam", "File"),
+)
+
+# A reference to an asset already in the cache, in place of a file path
+DIGEST_PREFIX = "sha256:"
+
+_PDB_CODE = re.compile(r"^[0-9][A-Za-z0-9]{3}$")
+
+
+class AssetCache:
+    """
+    A content-addressed store of the files RADDOSE-3D inputs refer to, one file
+    per sha256 digest. Files are copied in once and hashed while copying; the
+    digest of a path is memoised on its modification time and size, so shared
+    storage is only read again when the file changes. Blobs are written to a
+    temporary file and renamed into place, so concurrent processes can share
+    the same directory
+    """
+
+    def __init__(self, directory: str = DEFAULT_ASSET_DIRECTORY) -> None:
+        """
+        Parameters
+        ----------
+        directory : str, optional
+            The cache directory. It is created if it does not exist,
+            by default ~/.cache/py_raddose_3d/assets
+        """
+        self.directory = path.expanduser(directory)
+        makedirs(self.directory, exist_ok=True)
+        self._digests: dict[tuple[str, int, int, bool], str] = {}
+        self._lock = threading.Lock()
+
+    def path(self, digest: str) -> str:
+        """
+        The path of the blob with a digest
+        """
+        return path.join(self.directory, digest[:2], digest)
+
+    def __contains__(self, digest: str) -> bool:
+        return path.isfile(self.path(digest))
+
+    def add(self, file_path: str, decompress: bool = False) -> str:
+        """
+        Copies a file into the cache, unless it is unchanged since it was last
+        added
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the file
+        decompress : bool, optional
+            If True, the file is gzipped and its decompressed contents are
+            stored, by default False
+
+        Returns
+        -------
+        str
+            The sha256 hex digest of the stored contents
+
+        Raises
+        ------
+        FileNotFoundError
+            If the file does not exist
+        """
+        file_path = path.realpath(file_path)
+        file_stat = stat(file_path)
+        memo_key = (file_path, file_stat.st_mtime_ns, file_stat.st_size, decompress)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+        if digest is not None and digest in self:
+            return digest
+
+        temporary_path = path.join(self.directory, f".tmp-{uuid4().hex}")
+        sha256 = hashlib.sha256()
+        opener = gzip.open if decompress else open
+        try:
+            with opener(file_path, "rb") as src, open(temporary_path, "wb") as dst:
+                for chunk in iter(lambda: src.read(1 << 20), b""):
+                    sha256.update(chunk)
+                    dst.write(chunk)
+            digest = sha256.hexdigest()
+            makedirs(path.dirname(self.path(digest)), exist_ok=True)
+            replace(temporary_path, self.path(digest))
+        finally:
+            if path.exists(temporary_path):
+                remove(temporary_path)
+        with self._lock:
+            self._digests[memo_key] = digest
+        return digest
+
+    def stage(self, digest: str, destination: str) -> str:
+        """
+        Places the blob with a digest at destination, as a hard link when the
+        cache and destination share a file system and as a copy otherwise
+
+        Parameters
+        ----------
+        digest : str
+            The digest of the blob
+        destination : str
+            The path to place it at. An existing file is replaced
+
+        Returns
+        -------
+        str
+            destination
+        """
+        if digest not in self:
+            raise FileNotFoundError(f"No asset {digest} in {self.directory}")
+        temporary_path = f"{destination}.{uuid4().hex}.tmp"
+        try:
+            link(self.path(digest), temporary_path)
+        except OSError:
+            shutil.copyfile(self.path(digest), temporary_path)
+        replace(temporary_path, destination)
+        return destination
+
+
+class PdbMirror:
+    """
+    A local copy of PDB entries, e.g. an rsync of the wwPDB archive. Entries are
+    looked up as <code>.pdb and pdb<code>.ent, in the mirror directory or in the
+    two-letter subdirectories of the divided layout (km/pdb1kmt.ent for 1KMT),
+    optionally gzipped. mmCIF entries are ignored, since RADDOSE-3D reads a Pdb
+    structure in the PDB format
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Parameters
+        ----------
+        directory : str
+            The mirror directory
+        """
+        self.directory = path.expanduser(directory)
+
+    def find(self, code: str) -> str | None:
+        """
+        The path of an entry in the mirror, or None if it is not mirrored
+
+        Parameters
+        ----------
+        code : str
+            The four character PDB code, e.g. "1KMT"
+
+        Returns
+        -------
+        str | None
+            The path of the entry
+        """
+        code = code.lower()
+        names = [f"{code}.pdb", f"pdb{code}.ent"]
+        names += [name.upper() for name in names[:1]]
+        for directory in (self.directory, path.join(self.directory, code[1:3])):
+            for name in names:
+                for suffix in ("", ".gz"):
+                    candidate = path.join(directory, name + suffix)
+                    if path.isfile(candidate):
+                        return candidate
+        return None
+
+
+class AssetResolver:
+    """
+    Resolves the files an input refers to (Crystal.ModelFile, SeqFile, CIF and
+    Beam.File) and its Crystal.Pdb structure to assets in an AssetCache.
+
+    A file field may also hold "sha256:<digest>" to refer to an asset already in
+    the cache, so that runs do not depend on the original path being readable.
+    Pdb codes are looked up in the PDB mirror; a mirrored structure is staged
+    and passed to RADDOSE-3D as a local file instead of being downloaded. With
+    offline=True, a Pdb code that is not mirrored is an error rather than a
+    download.
+    """
+
+    def __init__(
+        self,
+        cache: AssetCache | str | None = None,
+        pdb_mirror: PdbMirror | str | None = None,
+        offline: bool = False,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        cache : AssetCache | str | None, optional
+            The asset cache, or its directory. If None, the default directory,
+            by default None
+        pdb_mirror : PdbMirror | str | None, optional
+            The local PDB mirror, or its directory, by default None
+        offline : bool, optional
+            If True, Pdb codes must be resolved from the mirror,
+            by default False
+        """
+        if not isinstance(cache, AssetCache):
+            cache = AssetCache(cache or DEFAULT_ASSET_DIRECTORY)
+        if isinstance(pdb_mirror, str):
+            pdb_mirror = PdbMirror(pdb_mirror)
+        self.cache = cache
+        self.pdb_mirror = pdb_mirror
+        self.offline = offline
+
+    def _resolve_file(self, value: str) -> str:
+        if value.startswith(DIGEST_PREFIX):
+            digest = value[len(DIGEST_PREFIX) :]
+            if digest not in self.cache:
+                raise FileNotFoundError(f"No asset {digest} in {self.cache.directory}")
+            return digest
+        return self.cache.add(value)
+
+    def _resolve_pdb(self, value: str) -> str | None:
+        if value.startswith(DIGEST_PREFIX) or path.isfile(value):
+            return self._resolve_file(value)
+        if _PDB_CODE.match(value) is not None and self.pdb_mirror is not None:
+            entry = self.pdb_mirror.find(value)
+            if entry is not None:
+                return self.cache.add(entry, decompress=entry.endswith(".gz"))
+        if self.offline:
+            raise FileNotFoundError(
+                f"Pdb {value} is not in the PDB mirror and offline=True"
+            )
+        return None
+
+    def resolve(self, rad_dose_input: RadDoseInput) -> dict[str, str]:
+        """
+        Adds the assets of an input to the cache
+
+        Parameters
+        ----------
+        rad_dose_input : RadDoseInput
+            The raddose input pydantic model
+
+        Returns
+        -------
+        dict[str, str]
+            The digest of each asset, keyed by "Crystal.<field>" or
+            "Beam.<field>". A Pdb code left for RADDOSE-3D to download is absent
+
+        Raises
+        ------
+        FileNotFoundError
+            If a file or cached asset does not exist, or a Pdb code cannot be
+            resolved offline
+        """
+        digests = {}
+        for block, field in FILE_FIELDS:
+            value = getattr(getattr(rad_dose_input, block), field)
+            if value is not None:
+                digests[f"{block.capitalize()}.{field}"] = self._resolve_file(value)
+        pdb = rad_dose_input.crystal.Pdb
+        if pdb is not None:
+            digest = self._resolve_pdb(pdb)
+            if digest is not None:
+                digests["Crystal.Pdb"] = digest
+        return digests
+
+    def _replace(
+        self, rad_dose_input: RadDoseInput, values: dict[str, str]
+    ) -> RadDoseInput:
+        updates = {"crystal": {}, "beam": {}}
+        for key, value in values.items():
+            block, field = key.split(".")
+            updates[block.lower()][field] = value
+        return rad_dose_input.model_copy(
+            update={
+                "crystal": rad_dose_input.crystal.model_copy(update=updates["crystal"]),
+                "beam": rad_dose_input.beam.model_copy(update=updates["beam"]),
+            }
+        )
+
+    def content_addressed(self, rad_dose_input: RadDoseInput) -> RadDoseInput:
+        """
+        The input with its assets replaced by "sha256:<digest>" references, so
+        that identical contents at different paths give the same input, see
+        py_raddose_3d.cache.input_key
+
+        Parameters
+        ----------
+        rad_dose_input : RadDoseInput
+            The raddose input pydantic model
+
+        Returns
+        -------
+        RadDoseInput
+            The content-addressed input
+        """
+        digests = self.resolve(rad_dose_input)
+        return self._replace(
+            rad_dose_input,
+            {key: DIGEST_PREFIX + digest for key, digest in digests.items()},
+        )
+
+    def stage(self, rad_dose_input: RadDoseInput, directory: str) -> RadDoseInput:
+        """
+        Places the assets of an input in directory/assets and points the input
+        at them
+
+        Parameters
+        ----------
+        rad_dose_input : RadDoseInput
+            The raddose input pydantic model
+        directory : str
+            The run directory, usually the sample directory
+
+        Returns
+        -------
+        RadDoseInput
+            The input with absolute paths of the staged assets
+        """
+        digests = self.resolve(rad_dose_input)
+        if not digests:
+            return rad_dose_input
+        asset_directory = path.abspath(path.join(directory, "assets"))
+        makedirs(asset_directory, exist_ok=True)
+
+        staged = {}
+        for key, digest in digests.items():
+            block, field = key.split(".")
+            value = getattr(getattr(rad_dose_input, block.lower()), field)
+            if field == "Pdb" and _PDB_CODE.match(value) is not None:
+                name = f"{value.upper()}.pdb"
+            elif value.startswith(DIGEST_PREFIX):
+                name = f"{field}-{digest[:16]}"
+            else:
+                name = f"{field}-{path.basename(value)}"
+            staged[key] = self.cache.stage(digest, path.join(asset_directory, name))
+        logger.debug(f"Staged {len(staged)} assets in {asset_directory}")
+        return self._replace(rad_dose_input, staged)
@@ -50,9 +50,11 @@ class Beam(RadDoseBase):
         cls, v: tuple[str, NonNegativeFloat, NonNegativeFloat]
     ):
         allowed_values = ["rectangular", "circular"]
-        if v[0].lower() not in allowed_values:
+        # Already converted to a string, e.g. when loading a serialized model
+        shape = v.split()[0] if isinstance(v, str) else v[0]
+        if shape.lower() not in allowed_values:
             raise ValueError(
-                f"Error validating Collimation. Allowed values are {allowed_values}, not {v[0]}"
+                f"Error validating Collimation. Allowed values are {allowed_values}, not {shape}"
             )
         return convert_tuple_to_str(v)
 
@@ -96,7 +96,7 @@ class Crystal(RadDoseBase):
         default=None,
     )
     ProteinConc: NonNegativeFloat | None = None
-    SmallMoleAtoms: tuple | None = Field(
+    SmallMoleAtoms: tuple | str | None = Field(
         example=("C", 18, "H", 15, "Bi", 8), default=None
     )
     CalculatePEescape: bool | None = None
@@ -1,10 +1,88 @@
+from io import StringIO
+from typing import TYPE_CHECKING, TextIO
+
 from .beam import Beam
 from .crystal import Crystal
 from .utils import RadDoseBase
 from .wedge import Wedge
 
+if TYPE_CHECKING:
+    from ..cost import CostEstimate, CostModel
+
+
+def _format_value(value) -> str:
+    """
+    Formats a field value the way RADDOSE-3D expects it. Tuples have already
+    been converted to space separated strings by the model validators
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _write_block(fp: TextIO, model: RadDoseBase, exclude: str | None = None) -> None:
+    for name in type(model).model_fields:
+        value = getattr(model, name)
+        if value is not None and name != exclude:
+            fp.write(f"  {name} {_format_value(value)}\n")
+
 
 class RadDoseInput(RadDoseBase):
     crystal: Crystal
     beam: Beam
     wedge: Wedge | list[Wedge]
+
+    def write(self, fp: TextIO) -> None:
+        """
+        Writes the input in the RADDOSE-3D keyword format: a Crystal block,
+        a Beam block and one block per wedge, each starting with its Wedge
+        angles. Fields that are None are omitted
+
+        Parameters
+        ----------
+        fp : TextIO
+            A text file or buffer
+        """
+        fp.write("Crystal\n")
+        _write_block(fp, self.crystal)
+        fp.write("Beam\n")
+        _write_block(fp, self.beam)
+
+        wedges = self.wedge if isinstance(self.wedge, list) else [self.wedge]
+        for wedge in wedges:
+            fp.write(f"Wedge {wedge.Wedge}\n")
+            _write_block(fp, wedge, exclude="Wedge")
+
+    def to_raddose_text(self) -> str:
+        """
+        Renders the input in the RADDOSE-3D keyword format
+
+        Returns
+        -------
+        str
+            The RADDOSE-3D input text
+        """
+        buffer = StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    def estimate_cost(self, model: "CostModel | None" = None) -> "CostEstimate":
+        """
+        Predicts the runtime and peak JVM memory of running this input
+
+        Parameters
+        ----------
+        model : CostModel | None, optional
+            A cost model calibrated on this machine. If model=None, the
+            uncalibrated default model is used, by default None
+
+        Returns
+        -------
+        CostEstimate
+            The predicted runtime and memory
+        """
+        from ..cost import default_cost_model
+
+        if model is None:
+            model = default_cost_model
+        return model.estimate(self)
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from os import O_CREAT, O_RDWR, close, makedirs, open as os_open, path
+from typing import TYPE_CHECKING
+
+from .cache import collect_outputs, restore_outputs
+from .raddose3d import RadDose3D
+from .summary import Summary
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE_NAME = ".raddose3d.lock"
+
+
+class DirectoryLock:
+    """
+    An exclusive lock on a directory, held through a lock file inside it.
+
+    Within a process the lock is a threading lock per directory; across
+    processes it is an advisory flock on the lock file, on platforms that
+    support it. Both are always taken, so the lock works the same between
+    threads and between processes. The threading lock of a directory is
+    dropped once no DirectoryLock on it is left.
+    """
+
+    _thread_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = (
+        weakref.WeakValueDictionary()
+    )
+    _registry_lock = threading.Lock()
+
+    def __init__(
+        self, directory: str, timeout: float | None = None, poll_interval: float = 0.1
+    ) -> None:
+        """
+        Parameters
+        ----------
+        directory : str
+            The directory, created if it does not exist
+        timeout : float | None, optional
+            Seconds to wait for the lock before raising TimeoutError. If
+            timeout=None, wait indefinitely, by default None
+        poll_interval : float, optional
+            Seconds between attempts to take the file lock, by default 0.1
+        """
+        self.directory = path.realpath(directory)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        with self._registry_lock:
+            self._thread_lock = self._thread_locks.get(self.directory)
+            if self._thread_lock is None:
+                self._thread_lock = threading.Lock()
+                self._thread_locks[self.directory] = self._thread_lock
+        self._fd: int | None = None
+
+    def acquire(self) -> None:
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(
+            timeout=-1 if deadline is None else self.timeout
+        ):
+            raise TimeoutError(f"Could not lock {self.directory}")
+        if fcntl is None:
+            return
+        try:
+            makedirs(self.directory, exist_ok=True)
+            self._fd = os_open(
+                path.join(self.directory, LOCK_FILE_NAME), O_RDWR | O_CREAT
+            )
+            while True:
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return
+                except BlockingIOError:
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise TimeoutError(f"Could not lock {self.directory}")
+                    time.sleep(self.poll_interval)
+        except BaseException:
+            self._close()
+            self._thread_lock.release()
+            raise
+
+    def _try_acquire(self) -> bool:
+        """
+        Takes the lock if it is free, without waiting
+
+        Returns
+        -------
+        bool
+            True if the lock was taken
+        """
+        if not self._thread_lock.acquire(blocking=False):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            makedirs(self.directory, exist_ok=True)
+            self._fd = os_open(
+                path.join(self.directory, LOCK_FILE_NAME), O_RDWR | O_CREAT
+            )
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            self._close()
+            self._thread_lock.release()
+            return False
+        except BaseException:
+            self._close()
+            self._thread_lock.release()
+            raise
+
+    async def acquire_async(self) -> None:
+        """
+        Asynchronous version of acquire, which polls the lock without blocking
+        the event loop. Nothing is held while waiting, so the waiting task can
+        be cancelled at any time
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self._try_acquire():
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock {self.directory}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            close(self._fd)
+            self._fd = None
+
+    def release(self) -> None:
+        # Closing the file descriptor releases the flock
+        self._close()
+        self._thread_lock.release()
+
+    def __enter__(self) -> "DirectoryLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent runs of the same input: the first caller runs the
+    sample and every caller asking for the same canonical input (see
+    RadDose3D.cache_key) while it runs waits for that run and receives its
+    summary. Callers with another sample directory also receive a copy of the
+    outputs there.
+
+    Every run holds a DirectoryLock on its sample directory, so that two runs
+    never write into the same output prefix at once, even from different
+    processes. RadDose3D.run itself takes no lock: callers running samples
+    with the same prefix outside a SingleFlight must serialise them, e.g. with
+    a DirectoryLock on sample.sample_directory. With lock_directory, runs of the same input are also serialised
+    across processes through a lock file per input key; give the samples a
+    shared DiskCache so that the processes that waited restore the result from
+    the cache instead of running it again.
+    """
+
+    def __init__(
+        self, lock_directory: str | None = None, lock_timeout: float | None = None
+    ) -> None:
+        """
+        Parameters
+        ----------
+        lock_directory : str | None, optional
+            Directory holding the cross-process locks per input key. If None,
+            deduplication is limited to this process, by default None
+        lock_timeout : float | None, optional
+            Seconds to wait for a lock before raising TimeoutError,
+            by default None
+        """
+        self.lock_directory = lock_directory
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._flights: dict[str, Future] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of distinct inputs currently running
+        """
+        return len(self._flights) + len(self._tasks)
+
+    def _locks(self, sample: RadDose3D, key: str) -> list[DirectoryLock]:
+        locks = []
+        if self.lock_directory is not None:
+            locks.append(
+                DirectoryLock(path.join(self.lock_directory, key), self.lock_timeout)
+            )
+        locks.append(DirectoryLock(sample.sample_directory, self.lock_timeout))
+        return locks
+
+    def _share(
+        self, leader: RadDose3D, sample: RadDose3D, summary: "pd.DataFrame | Summary"
+    ) -> "pd.DataFrame | Summary":
+        """
+        Gives a waiting caller its own copy of the leader's result
+        """
+        if path.realpath(leader.prefix) != path.realpath(sample.prefix):
+            with DirectoryLock(sample.sample_directory, self.lock_timeout):
+                restore_outputs(sample.prefix, collect_outputs(leader.prefix))
+        return summary.copy()
+
+    def run(self, sample: RadDose3D, **kwargs) -> "pd.DataFrame | Summary":
+        """
+        Runs a sample, or waits for an identical run already in progress
+
+        Parameters
+        ----------
+        sample : RadDose3D
+            The sample
+        **kwargs
+            Passed on to RadDose3D.run by the caller that runs the sample
+
+        Returns
+        -------
+        pd.DataFrame | Summary
+            The summary of the run
+        """
+        key = sample.cache_key()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                flight.sample = sample
+                self._flights[key] = flight
+
+        if not leader:
+            logger.info(
+                f"{sample.sample_id} joins the run of {flight.sample.sample_id}"
+            )
+            return self._share(flight.sample, sample, flight.result())
+
+        acquired = []
+        try:
+            try:
+                for lock in self._locks(sample, key):
+                    lock.acquire()
+                    acquired.append(lock)
+                summary = sample.run(**kwargs)
+            finally:
+                for lock in reversed(acquired):
+                    lock.release()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(summary)
+            return summary
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    async def run_async(self, sample: RadDose3D, **kwargs) -> "pd.DataFrame | Summary":
+        """
+        Asynchronous version of run. Cancelling a waiting caller does not
+        cancel the shared run; it is cancelled if the caller that started it is
+
+        Parameters
+        ----------
+        sample : RadDose3D
+            The sample
+        **kwargs
+            Passed on to RadDose3D.run_async by the caller that runs the sample
+
+        Returns
+        -------
+        pd.DataFrame | Summary
+            The summary of the run
+        """
+        key = sample.cache_key()
+        task = self._tasks.get(key)
+        if task is not None:
+            logger.info(f"{sample.sample_id} joins the run of {task.sample.sample_id}")
+            summary = await asyncio.shield(task)
+            return self._share(task.sample, sample, summary)
+
+        task = asyncio.ensure_future(self._run_locked_async(sample, key, **kwargs))
+        task.sample = sample
+        self._tasks[key] = task
+        try:
+            return await task
+        finally:
+            del self._tasks[key]
+
+    async def _run_locked_async(
+        self, sample: RadDose3D, key: str, **kwargs
+    ) -> "pd.DataFrame | Summary":
+        acquired = []
+        try:
+            for lock in self._locks(sample, key):
+                await lock.acquire_async()
+                acquired.append(lock)
+            return await sample.run_async(**kwargs)
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
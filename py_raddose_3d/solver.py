@@ -0,0 +1,315 @@
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+import pandas as pd
+
+from .raddose3d import RadDose3D
+from .rescale import DoseRescaler
+from .schemas.input import Beam, Crystal, Wedge
+from .summary import Summary
+from .sweep import apply_parameters, default_concurrency, parse_parameter
+
+logger = logging.getLogger(__name__)
+
+# Parameters the dose is proportional to, see py_raddose_3d.rescale
+PROPORTIONAL_PARAMETERS = ("Beam.Flux", "Wedge.ExposureTime")
+
+
+@dataclass(frozen=True)
+class SolverIteration:
+    """
+    One evaluation of the target metric
+    """
+
+    sample_id: str
+    value: float
+    metric: float
+    wall_time: float
+    rescaled: bool
+
+
+@dataclass
+class SolverResult:
+    """
+    The outcome of DoseTargetSolver.solve
+    """
+
+    parameter: str
+    value: float
+    metric: float
+    target: float
+    converged: bool
+    history: list[SolverIteration] = field(default_factory=list)
+
+    @property
+    def java_runs(self) -> int:
+        """
+        Number of evaluations that ran RADDOSE-3D
+        """
+        return sum(not iteration.rescaled for iteration in self.history)
+
+    @property
+    def compute_time(self) -> float:
+        """
+        Total wall time of the evaluations in seconds
+        """
+        return sum(iteration.wall_time for iteration in self.history)
+
+
+class DoseTargetSolver:
+    """
+    Finds the value of a Beam or Wedge parameter for which a metric of the
+    Summary reaches a target, e.g. the exposure time giving an average
+    diffraction-weighted dose of 10 MGy.
+
+    The metric must increase with the parameter. The solver first brackets the
+    target, probing several values concurrently, then narrows the bracket with
+    the Illinois variant of regula falsi. For Beam.Flux and Wedge.ExposureTime
+    the dose is proportional to the parameter, so the first guess is an exact
+    linear extrapolation, and with use_rescaling the following evaluations are
+    derived from the first run without running RADDOSE-3D again.
+    """
+
+    def __init__(
+        self,
+        crystal: Crystal,
+        beam: Beam,
+        wedge: Wedge | list[Wedge],
+        parameter: str = "Wedge.ExposureTime",
+        metric: str | Callable[["pd.DataFrame | Summary"], float] = "Average DWD",
+        row: int = -1,
+        sample_id: str = "solve",
+        output_directory: str | None = None,
+        rtol: float = 0.01,
+        max_evaluations: int = 20,
+        max_workers: int | None = None,
+        growth: float = 2.0,
+        use_rescaling: bool = True,
+        **kwargs,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        crystal : Crystal
+            A Crystal Pydantic model
+        beam : Beam
+            A Beam pydantic model
+        wedge : Wedge | list[Wedge]
+            A Wedge pydantic model, or a list of Wedges
+        parameter : str, optional
+            The parameter to solve for, in the notation of RadDose3D.sweep,
+            by default "Wedge.ExposureTime"
+        metric : str | Callable[[pd.DataFrame | Summary], float], optional
+            A Summary column, or a function computing the metric from the
+            summary returned by RadDose3D.run, a Summary if as_frame=False is
+            passed, by default "Average DWD"
+        row : int, optional
+            The Summary row (wedge) the column is read from, by default the last
+        sample_id : str, optional
+            Prefix of the sample ids of the evaluations, by default "solve"
+        output_directory : str | None, optional
+            Output directory. If output_directory=None, we use the current
+            working directory, by default None
+        rtol : float, optional
+            Relative tolerance on the metric, by default 0.01
+        max_evaluations : int, optional
+            Maximum number of evaluations, by default 20
+        max_workers : int | None, optional
+            Maximum number of concurrent probes while bracketing. If None, it is
+            derived from the available cores and memory, by default None
+        growth : float, optional
+            Factor between successive probes while bracketing, by default 2
+        use_rescaling : bool, optional
+            Derive evaluations from earlier runs with a DoseRescaler where that
+            is exact, by default True
+        **kwargs
+            Passed on to every RadDose3D instance, e.g. pool or cache
+        """
+        model_name, _, _ = parse_parameter(parameter)
+        if model_name == "Crystal":
+            raise ValueError("The solver only supports Beam and Wedge parameters")
+        if growth <= 1:
+            raise ValueError("growth must be greater than 1")
+
+        self.crystal = crystal
+        self.beam = beam
+        self.wedge = wedge
+        self.parameter = parameter
+        self.metric = metric
+        self.row = row
+        self.sample_id = sample_id
+        self.output_directory = output_directory
+        self.rtol = rtol
+        self.max_evaluations = max_evaluations
+        self.max_workers = max_workers or default_concurrency()
+        self.growth = growth
+        self.rescaler = DoseRescaler() if use_rescaling else None
+        self.kwargs = kwargs
+
+        self.history: list[SolverIteration] = []
+
+    def current_value(self) -> float:
+        """
+        The value of the parameter in the given crystal, beam and wedge(s)
+        """
+        model_name, index, field_name = parse_parameter(self.parameter)
+        if model_name == "Beam":
+            return getattr(self.beam, field_name)
+        wedges = self.wedge if isinstance(self.wedge, list) else [self.wedge]
+        return getattr(wedges[index or 0], field_name)
+
+    def _metric_value(self, summary: "pd.DataFrame | Summary") -> float:
+        if callable(self.metric):
+            return float(self.metric(summary))
+        return float(list(summary[self.metric])[self.row])
+
+    def _evaluate_one(self, number: int, value: float) -> SolverIteration:
+        crystal, beam, wedge = apply_parameters(
+            self.crystal, self.beam, self.wedge, {self.parameter: value}
+        )
+        sample = RadDose3D(
+            sample_id=f"{self.sample_id}_{number:03d}",
+            crystal=crystal,
+            beam=beam,
+            wedge=wedge,
+            output_directory=self.output_directory,
+            lazy=True,
+            **self.kwargs,
+        )
+        start = time.perf_counter()
+        if self.rescaler is None:
+            rescaled = False
+            summary = sample.run()
+        else:
+            rescaled = self.rescaler.find_reference(sample) is not None
+            summary = self.rescaler.run(sample)
+        return SolverIteration(
+            sample_id=sample.sample_id,
+            value=value,
+            metric=self._metric_value(summary),
+            wall_time=time.perf_counter() - start,
+            rescaled=rescaled,
+        )
+
+    def _evaluate(self, values: list[float]) -> list[SolverIteration]:
+        """
+        Evaluates the metric at several values concurrently
+        """
+        numbers = range(len(self.history), len(self.history) + len(values))
+        if len(values) == 1:
+            batch = [self._evaluate_one(numbers[0], values[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                batch = list(executor.map(self._evaluate_one, numbers, values))
+
+        for iteration in batch:
+            logger.info(
+                f"{self.parameter}={iteration.value:.6g} gives a metric of "
+                f"{iteration.metric:.6g}"
+            )
+        self.history.extend(batch)
+        return batch
+
+    def _converged(self, iteration: SolverIteration, target: float) -> bool:
+        return abs(iteration.metric - target) <= self.rtol * abs(target)
+
+    def _result(self, best: SolverIteration, target: float) -> SolverResult:
+        return SolverResult(
+            parameter=self.parameter,
+            value=best.value,
+            metric=best.metric,
+            target=target,
+            converged=self._converged(best, target),
+            history=list(self.history),
+        )
+
+    def solve(self, target: float, initial: float | None = None) -> SolverResult:
+        """
+        Solves for the parameter value giving the target metric
+
+        Parameters
+        ----------
+        target : float
+            The target value of the metric, e.g. a dose in MGy
+        initial : float | None, optional
+            The first value to evaluate. If initial=None, the value in the
+            given crystal, beam and wedge(s) is used, by default None
+
+        Returns
+        -------
+        SolverResult
+            The best value found and the history of the evaluations
+        """
+        self.history = []
+        x = self.current_value() if initial is None else initial
+        if x <= 0:
+            raise ValueError("The initial parameter value must be positive")
+
+        best = self._evaluate([x])[0]
+        if self._converged(best, target):
+            return self._result(best, target)
+
+        def closest() -> SolverIteration:
+            return min(self.history, key=lambda it: abs(it.metric - target))
+
+        # The dose is proportional to flux and exposure time: extrapolate
+        if self.parameter in PROPORTIONAL_PARAMETERS and best.metric > 0:
+            best = self._evaluate([best.value * target / best.metric])[0]
+            if self._converged(best, target):
+                return self._result(best, target)
+
+        # Bracket the target, probing several values at once
+        while len(self.history) < self.max_evaluations:
+            below = [it for it in self.history if it.metric < target]
+            above = [it for it in self.history if it.metric >= target]
+            if below and above:
+                break
+            remaining = self.max_evaluations - len(self.history)
+            probes = min(self.max_workers, remaining)
+            if below:
+                start = max(it.value for it in below)
+                values = [start * self.growth ** (k + 1) for k in range(probes)]
+            else:
+                start = min(it.value for it in above)
+                values = [start / self.growth ** (k + 1) for k in range(probes)]
+            self._evaluate(values)
+            if self._converged(closest(), target):
+                return self._result(closest(), target)
+        else:
+            logger.warning(f"Could not bracket a metric of {target}")
+            return self._result(closest(), target)
+
+        # Illinois regula falsi on the tightest bracket
+        low = max(
+            (it for it in self.history if it.metric < target), key=lambda it: it.value
+        )
+        high = min(
+            (it for it in self.history if it.metric >= target), key=lambda it: it.value
+        )
+        low_metric, high_metric = low.metric - target, high.metric - target
+        side = 0
+        while len(self.history) < self.max_evaluations:
+            value = high.value - high_metric * (high.value - low.value) / (
+                high_metric - low_metric
+            )
+            if not low.value < value < high.value or math.isnan(value):
+                value = (low.value + high.value) / 2
+            iteration = self._evaluate([value])[0]
+            if self._converged(iteration, target):
+                return self._result(iteration, target)
+            if iteration.metric < target:
+                low, low_metric = iteration, iteration.metric - target
+                if side == -1:
+                    high_metric /= 2
+                side = -1
+            else:
+                high, high_metric = iteration, iteration.metric - target
+                if side == 1:
+                    low_metric /= 2
+                side = 1
+
+        return self._result(closest(), target)
@@ -0,0 +1,123 @@
+import csv
+import math
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _number(value: str) -> float | int | str:
+    value = value.strip()
+    if not value:
+        return math.nan
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+@dataclass
+class Summary:
+    """
+    The Summary.csv output of a run as a dictionary of columns, read without
+    pandas. It is returned by RadDose3D.run when as_frame=False, and supports
+    the parts of the DataFrame interface most used on a summary: indexing and
+    assigning columns by name, len (the number of wedges), columns and attrs.
+    """
+
+    data: dict[str, list[float | int | str]]
+    attrs: dict = field(default_factory=dict)
+
+    @classmethod
+    def read_csv(cls, csv_path: str) -> "Summary":
+        """
+        Reads a RADDOSE-3D Summary.csv file
+
+        Parameters
+        ----------
+        csv_path : str
+            Path of the file
+
+        Returns
+        -------
+        Summary
+            The summary, with ints and floats parsed
+        """
+        with open(csv_path, newline="") as fp:
+            reader = csv.reader(fp)
+            columns = next(reader)
+            data: dict[str, list] = {column: [] for column in columns}
+            for row in reader:
+                if not row:
+                    continue
+                for column, value in zip(columns, row):
+                    data[column].append(_number(value))
+        return cls(data)
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.data)
+
+    def __getitem__(self, column: str) -> list[float | int | str]:
+        return self.data[column]
+
+    def __setitem__(self, column: str, values: list[float | int | str]) -> None:
+        self.data[column] = list(values)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.data
+
+    def __len__(self) -> int:
+        return len(next(iter(self.data.values()), []))
+
+    def copy(self) -> "Summary":
+        return Summary(
+            {column: list(values) for column, values in self.data.items()},
+            dict(self.attrs),
+        )
+
+    def to_csv(self, csv_path: str) -> None:
+        """
+        Writes the summary in the format of RADDOSE-3D's Summary.csv, NaN as an
+        empty field as pandas does
+
+        Parameters
+        ----------
+        csv_path : str
+            Path of the file
+        """
+        with open(csv_path, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(self.columns)
+            for row in zip(*self.data.values()):
+                writer.writerow(
+                    "" if isinstance(value, float) and math.isnan(value) else value
+                    for value in row
+                )
+
+    def to_dict(self, orient: str = "list") -> dict:
+        """
+        The columns keyed by name (orient="list") or a list of rows keyed by
+        column name (orient="records"), as DataFrame.to_dict does
+        """
+        if orient == "list":
+            return {column: list(values) for column, values in self.data.items()}
+        if orient == "records":
+            return [dict(zip(self.data, row)) for row in zip(*self.data.values())]
+        raise ValueError(f"Unsupported orient {orient!r}")
+
+    def to_pandas(self) -> "pd.DataFrame":
+        """
+        Converts the summary to the pandas DataFrame RadDose3D.run returns with
+        as_frame=True, attrs included
+        """
+        import pandas as pd
+
+        frame = pd.DataFrame(self.data)
+        frame.attrs.update(self.attrs)
+        return frame
@@ -0,0 +1,445 @@
+import asyncio
+import logging
+import math
+import re
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Sequence
+
+from .metrics import _read_proc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Severities of a line of output
+FATAL = "fatal"
+WARNING = "warning"
+NOISE = "noise"
+SEVERITIES = (FATAL, WARNING, NOISE)
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+
+@dataclass(frozen=True)
+class OutputPattern:
+    """
+    A row of the pattern table of a Supervisor: lines of stream (either stream
+    if None) matching the regular expression pattern, case-insensitively, have
+    severity. reason names the failure a fatal line causes
+    """
+
+    pattern: str
+    severity: str
+    reason: str | None = None
+    stream: str | None = None
+
+    def __post_init__(self) -> None:
+        if self.severity not in SEVERITIES:
+            raise ValueError(
+                f"Unsupported severity {self.severity!r}, use one of {SEVERITIES}"
+            )
+
+
+DEFAULT_PATTERNS = (
+    # Notices of the JVM, including the class data sharing logs of JVMOptions
+    OutputPattern(r"^(NOTE: )?Picked up \w*JAVA\w*OPTIONS", NOISE, stream=STDERR),
+    OutputPattern(r"^\[[\d.]+s\]\[\w+\s*\]\[cds", NOISE, stream=STDERR),
+    OutputPattern(r"VM warning:", WARNING, "jvm_warning", STDERR),
+    OutputPattern(r"^WARNING:", WARNING, "jvm_warning", STDERR),
+    # The JVM could not start
+    OutputPattern(
+        r"^(Error: (Unable to access jarfile|Could not find or load main class)"
+        r"|Error occurred during initialization of VM"
+        r"|Error: Could not create the Java Virtual Machine)",
+        FATAL,
+        "launch",
+        STDERR,
+    ),
+    OutputPattern(r"java\.lang\.OutOfMemoryError", FATAL, "out_of_memory"),
+    # Syntax errors of the input file, reported by its ANTLR parser
+    OutputPattern(
+        r"\b(mismatched input|extraneous input|no viable alternative at input"
+        r"|missing \S+ at)\b",
+        FATAL,
+        "input_syntax",
+    ),
+    OutputPattern(r"^Exception in thread", FATAL, "exception", STDERR),
+)
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """
+    Limits on the java process of a run. Exceeding one kills the process.
+
+    Wall-clock time is measured from the start of the process. CPU time (user
+    and system) and peak RSS are sampled from /proc on Linux; CPU time is also
+    enforced by the kernel with RLIMIT_CPU. Memory is not limited with
+    RLIMIT_AS, as the JVM reserves far more address space than it uses; limit
+    the heap with JVMOptions as well.
+    """
+
+    wall_clock_s: float | None = None
+    cpu_s: float | None = None
+    memory_mb: float | None = None
+
+    @property
+    def sampled(self) -> bool:
+        return self.cpu_s is not None or self.memory_mb is not None
+
+    def __bool__(self) -> bool:
+        return self.wall_clock_s is not None or self.sampled
+
+
+class RadDose3DError(RuntimeError):
+    """
+    Raised when a RADDOSE-3D run fails: its output contained a fatal line, it
+    exceeded a ResourceLimits limit or the java process exited with an error.
+
+    reason is the reason of the fatal pattern, e.g. "input_syntax" or
+    "out_of_memory", "stderr" for unclassified standard error, one of
+    "wall_clock_limit", "cpu_limit" and "memory_limit", or "exit_code". line
+    and stream are those of the fatal line, stderr holds the last lines of
+    standard error and warnings the lines classified as warnings.
+    """
+
+    def __init__(
+        self,
+        sample_id: str,
+        reason: str,
+        message: str,
+        stream: str | None = None,
+        line: str | None = None,
+        returncode: int | None = None,
+        stderr: str = "",
+        warnings: Sequence[str] = (),
+    ) -> None:
+        super().__init__(f"RADDOSE-3D run of {sample_id} failed ({reason}): {message}")
+        self.sample_id = sample_id
+        self.reason = reason
+        self.message = message
+        self.stream = stream
+        self.line = line
+        self.returncode = returncode
+        self.stderr = stderr
+        self.warnings = list(warnings)
+
+    def to_dict(self) -> dict:
+        return {
+            "sample_id": self.sample_id,
+            "reason": self.reason,
+            "message": self.message,
+            "stream": self.stream,
+            "line": self.line,
+            "returncode": self.returncode,
+            "stderr": self.stderr,
+            "warnings": self.warnings,
+        }
+
+
+class Supervisor:
+    """
+    Watches the output and resource usage of RADDOSE-3D java processes.
+
+    Every line of stdout and stderr is classified as it is written, by the
+    first matching row of the pattern table: fatal lines kill the process at
+    once, warnings are logged and kept, noise is ignored. Unmatched stdout is
+    noise; unmatched stderr has severity unmatched_stderr, a warning by
+    default, so that unknown JVM notices do not fail a run while unexpected
+    errors are still reported, and fail it if java exits with an error. A
+    Supervisor holds no run state and can be shared between RadDose3D
+    instances.
+    """
+
+    def __init__(
+        self,
+        patterns: Sequence[OutputPattern] = DEFAULT_PATTERNS,
+        limits: ResourceLimits | None = None,
+        unmatched_stderr: str = WARNING,
+        poll_interval: float = 0.25,
+        max_lines: int = 1000,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        patterns : Sequence[OutputPattern], optional
+            The pattern table, searched in order. To add rows, pass e.g.
+            (OutputPattern(...), *DEFAULT_PATTERNS), by default DEFAULT_PATTERNS
+        limits : ResourceLimits | None, optional
+            Limits on each java process, by default None
+        unmatched_stderr : str, optional
+            Severity of stderr lines no pattern matches, by default "warning"
+        poll_interval : float, optional
+            Seconds between two checks of the resource limits, by default 0.25
+        max_lines : int, optional
+            Number of lines of stderr kept for the error, by default 1000
+        """
+        if unmatched_stderr not in SEVERITIES:
+            raise ValueError(
+                f"Unsupported severity {unmatched_stderr!r}, use one of {SEVERITIES}"
+            )
+        self.patterns = tuple(patterns)
+        self.limits = limits or ResourceLimits()
+        self.unmatched_stderr = unmatched_stderr
+        self.poll_interval = poll_interval
+        self.max_lines = max_lines
+        self._compiled = [
+            (re.compile(row.pattern, re.IGNORECASE), row) for row in self.patterns
+        ]
+
+    def classify(self, line: str, stream: str) -> tuple[str, str | None]:
+        """
+        Classifies a line of output
+
+        Parameters
+        ----------
+        line : str
+            The line, without its line break
+        stream : str
+            "stdout" or "stderr"
+
+        Returns
+        -------
+        tuple[str, str | None]
+            The severity and the reason of the line
+        """
+        for regex, row in self._compiled:
+            if row.stream in (None, stream) and regex.search(line) is not None:
+                return row.severity, row.reason
+        if stream == STDERR:
+            return self.unmatched_stderr, "stderr"
+        return NOISE, None
+
+    def supervise(
+        self,
+        sample_id: str,
+        process: "subprocess.Popen | asyncio.subprocess.Process | None" = None,
+    ) -> "Supervision":
+        """
+        Starts supervising a run
+
+        Parameters
+        ----------
+        sample_id : str
+            Sample id of the run
+        process : subprocess.Popen | asyncio.subprocess.Process | None, optional
+            The java process, killed on failure unless it has already exited.
+            If None, e.g. for output checked after the run, failures are only
+            raised by Supervision.check, by default None
+
+        Returns
+        -------
+        Supervision
+            The state of the run
+        """
+        return Supervision(self, sample_id, process)
+
+
+class Supervision:
+    """
+    The supervision of one run, see Supervisor.supervise. feed may be called
+    from the threads reading stdout and stderr concurrently
+    """
+
+    def __init__(
+        self,
+        supervisor: Supervisor,
+        sample_id: str,
+        process: "subprocess.Popen | asyncio.subprocess.Process | None" = None,
+    ) -> None:
+        self.supervisor = supervisor
+        self.sample_id = sample_id
+        self.warnings: list[str] = []
+        self.failure: RadDose3DError | None = None
+        self._process = process
+        self._stderr: deque[str] = deque(maxlen=supervisor.max_lines)
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+    @property
+    def stderr(self) -> str:
+        """
+        The last max_lines lines of stderr
+        """
+        return "\n".join(self._stderr)
+
+    def _fail(
+        self,
+        reason: str,
+        message: str,
+        stream: str | None = None,
+        line: str | None = None,
+    ) -> None:
+        with self._lock:
+            if self.failure is not None:
+                return
+            self.failure = RadDose3DError(
+                self.sample_id, reason, message, stream, line, warnings=self.warnings
+            )
+        logger.error(str(self.failure))
+        # Once the process has been reaped its pid may belong to another one
+        if self._process is not None and self._process.returncode is None:
+            try:
+                self._process.kill()
+            except ProcessLookupError:
+                pass
+
+    def feed(self, line: str | bytes, stream: str) -> str:
+        """
+        Classifies a line of output, killing the process if it is fatal
+
+        Parameters
+        ----------
+        line : str | bytes
+            The line
+        stream : str
+            "stdout" or "stderr"
+
+        Returns
+        -------
+        str
+            The severity of the line
+        """
+        if isinstance(line, bytes):
+            line = str(line, encoding="utf-8", errors="replace")
+        line = line.rstrip("\r\n")
+        if stream == STDERR:
+            self._stderr.append(line)
+        if not line.strip():
+            return NOISE
+        severity, reason = self.supervisor.classify(line, stream)
+        if severity == FATAL:
+            self._fail(reason, line, stream, line)
+        elif severity == WARNING:
+            self.warnings.append(line)
+            logger.warning(f"{self.sample_id} {stream}: {line}")
+        return severity
+
+    def feed_lines(self, lines: Iterable[str | bytes], stream: str) -> None:
+        """
+        Classifies lines of output until the iterable is exhausted, e.g. a pipe
+        read in a thread
+        """
+        for line in lines:
+            self.feed(line, stream)
+
+    def feed_all(self, output: bytes, stream: str) -> None:
+        """
+        Classifies the complete output of a stream, e.g. of a pooled run
+        """
+        for line in str(output, encoding="utf-8", errors="replace").splitlines():
+            self.feed(line, stream)
+
+    def limit(self, pid: int) -> None:
+        """
+        Sets RLIMIT_CPU of the java process, where supported, so that the kernel
+        stops it even if the process is not polled
+        """
+        cpu_s = self.supervisor.limits.cpu_s
+        if cpu_s is None or resource is None or not hasattr(resource, "prlimit"):
+            return
+        seconds = math.ceil(cpu_s) + 1
+        try:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (seconds, seconds + 1))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not set RLIMIT_CPU of {pid}: {e}")
+
+    def poll(self, pid: int) -> None:
+        """
+        Checks the resource limits, killing the process if one is exceeded
+
+        Parameters
+        ----------
+        pid : int
+            Process id of the java process
+        """
+        limits = self.supervisor.limits
+        elapsed = time.monotonic() - self._start
+        if limits.wall_clock_s is not None and elapsed > limits.wall_clock_s:
+            self._fail(
+                "wall_clock_limit",
+                f"ran for more than {limits.wall_clock_s}s",
+            )
+            return
+        if not limits.sampled:
+            return
+        sample = _read_proc(pid)
+        if sample is None:
+            return
+        peak_rss_mb, cpu_user_s, cpu_system_s = sample
+        if limits.cpu_s is not None and cpu_user_s + cpu_system_s > limits.cpu_s:
+            self._fail(
+                "cpu_limit",
+                f"used {cpu_user_s + cpu_system_s:.1f}s of CPU time, more than "
+                f"{limits.cpu_s}s",
+            )
+        elif limits.memory_mb is not None and peak_rss_mb > limits.memory_mb:
+            self._fail(
+                "memory_limit",
+                f"used {peak_rss_mb:.0f}MB of memory, more than {limits.memory_mb}MB",
+            )
+
+    def watch(self, pid: int, stop: threading.Event) -> None:
+        """
+        Polls the resource limits until stop is set or a limit is exceeded, in
+        a watchdog thread
+        """
+        while not stop.wait(self.supervisor.poll_interval):
+            self.poll(pid)
+            if self.failure is not None:
+                return
+
+    async def watch_async(self, pid: int) -> None:
+        """
+        Asynchronous version of watch, which runs until it is cancelled or a
+        limit is exceeded
+        """
+        while self.failure is None:
+            await asyncio.sleep(self.supervisor.poll_interval)
+            self.poll(pid)
+
+    def check(self, returncode: int | None = None) -> None:
+        """
+        Raises the failure of the run, if any
+
+        Parameters
+        ----------
+        returncode : int | None, optional
+            Exit code of the java process, if known, by default None
+
+        Raises
+        ------
+        RadDose3DError
+            If a fatal line was seen, a limit was exceeded or returncode is not 0
+        """
+        failure = self.failure
+        if failure is None and returncode not in (None, 0):
+            if self.supervisor.limits.cpu_s is not None and returncode == -getattr(
+                signal, "SIGXCPU", 0
+            ):
+                failure = RadDose3DError(
+                    self.sample_id,
+                    "cpu_limit",
+                    f"used more than {self.supervisor.limits.cpu_s}s of CPU time",
+                )
+            else:
+                failure = RadDose3DError(
+                    self.sample_id,
+                    "exit_code",
+                    f"java exited with code {returncode}",
+                )
+        if failure is None:
+            return
+        failure.returncode = returncode
+        failure.stderr = self.stderr
+        failure.warnings = list(self.warnings)
+        raise failure
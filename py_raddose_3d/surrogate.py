@@ -0,0 +1,620 @@
+import json
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from os import makedirs, path
+from typing import TYPE_CHECKING, Mapping, Sequence
+
+import numpy as np
+
+from .cost import DEFAULT_PIXELS_PER_MICRON
+from .schemas.input import RadDoseInput
+from .sweep import default_concurrency
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from .raddose3d import RadDose3D
+    from .result_store import ResultStore
+    from .summary import Summary
+
+logger = logging.getLogger(__name__)
+
+# Summary columns predicted by default
+DEFAULT_TARGETS = ("Average DWD", "Max Dose")
+
+FEATURES = (
+    "log_flux",
+    "log_energy",
+    "log_exposure_time",
+    "log_rotation",
+    "log_beam_x",
+    "log_beam_y",
+    "log_crystal_x",
+    "log_crystal_y",
+    "log_crystal_z",
+    "log_pixels_per_micron",
+    "log_residue_density",
+    "solvent_fraction",
+)
+
+# Sources of a DoseEstimate
+SURROGATE = "surrogate"
+RUN = "run"
+FAILED = "failed"
+
+
+def _numbers(value: object) -> list[float]:
+    """
+    The numbers of a field value, e.g. [100.0, 100.0] for "Rectangular 100 100".
+    Missing values, e.g. None or the NaN of a ResultStore column, give []
+    """
+    if value is None:
+        return []
+    if isinstance(value, (int, float)):
+        return [] if math.isnan(value) else [float(value)]
+    numbers = []
+    for item in str(value).split():
+        try:
+            numbers.append(float(item))
+        except ValueError:
+            continue
+    return numbers
+
+
+def _log(value: float | None) -> float:
+    if value is None or not value > 0 or math.isinf(value):
+        return math.nan
+    return math.log10(value)
+
+
+def _first(value: object) -> float | None:
+    numbers = _numbers(value)
+    return numbers[0] if numbers else None
+
+
+def surrogate_features(parameters: Mapping[str, object]) -> list[float]:
+    """
+    The features of one wedge of a run, in the order of FEATURES: mostly
+    logarithms, as doses scale as power laws of flux, exposure time and sizes
+
+    Parameters
+    ----------
+    parameters : Mapping[str, object]
+        The input fields as "Crystal.<field>", "Beam.<field>" and
+        "Wedge.<field>", like the columns of a ResultStore, see
+        input_parameters
+
+    Returns
+    -------
+    list[float]
+        The features, NaN where the fields they need are missing
+    """
+    angles = _numbers(parameters.get("Wedge.Wedge"))
+    rotation = abs(angles[1] - angles[0]) if len(angles) >= 2 else None
+
+    if str(parameters.get("Beam.Type", "")).lower() == "gaussian":
+        beam = _numbers(parameters.get("Beam.FWHM"))
+    else:
+        beam = _numbers(parameters.get("Beam.Collimation"))
+    beam = (beam + [math.nan, math.nan])[:2]
+
+    crystal = _numbers(parameters.get("Crystal.Dimensions"))
+    if len(crystal) == 1:
+        crystal = crystal * 3
+    elif len(crystal) == 2:
+        # Cylinders: diameter and height
+        crystal = [crystal[0], crystal[0], crystal[1]]
+    crystal = (crystal + [math.nan] * 3)[:3]
+
+    unit_cell = _numbers(parameters.get("Crystal.UnitCell"))
+    monomers = _first(parameters.get("Crystal.NumMonomers"))
+    residues = _first(parameters.get("Crystal.NumResidues"))
+    residue_density = None
+    if len(unit_cell) >= 3 and monomers is not None and residues is not None:
+        residue_density = monomers * residues / math.prod(unit_cell[:3])
+
+    solvent_fraction = _first(parameters.get("Crystal.SolventFraction"))
+    pixels_per_micron = _first(parameters.get("Crystal.PixelsPerMicron"))
+    return [
+        _log(_first(parameters.get("Beam.Flux"))),
+        _log(_first(parameters.get("Beam.Energy"))),
+        _log(_first(parameters.get("Wedge.ExposureTime"))),
+        _log(None if rotation is None else 1 + rotation),
+        _log(beam[0]),
+        _log(beam[1]),
+        _log(crystal[0]),
+        _log(crystal[1]),
+        _log(crystal[2]),
+        _log(pixels_per_micron or DEFAULT_PIXELS_PER_MICRON),
+        _log(residue_density),
+        math.nan if solvent_fraction is None else solvent_fraction,
+    ]
+
+
+def input_parameters(rad_dose_input: RadDoseInput) -> list[dict[str, object]]:
+    """
+    The fields of an input as "Crystal.<field>", "Beam.<field>" and
+    "Wedge.<field>", one dictionary per wedge, like the rows a run adds to a
+    ResultStore
+    """
+    common = {
+        f"Crystal.{name}": value
+        for name, value in rad_dose_input.crystal.model_dump(exclude_none=True).items()
+    }
+    common.update(
+        (f"Beam.{name}", value)
+        for name, value in rad_dose_input.beam.model_dump(exclude_none=True).items()
+    )
+    wedges = rad_dose_input.wedge
+    if not isinstance(wedges, list):
+        wedges = [wedges]
+    rows = []
+    for wedge in wedges:
+        row = dict(common)
+        row.update(
+            (f"Wedge.{name}", value)
+            for name, value in wedge.model_dump(exclude_none=True).items()
+        )
+        rows.append(row)
+    return rows
+
+
+def feature_matrix(
+    rad_dose_inputs: Sequence[RadDoseInput],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The features of many inputs, one row per wedge
+
+    Parameters
+    ----------
+    rad_dose_inputs : Sequence[RadDoseInput]
+        The inputs
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The features, of shape (wedges, len(FEATURES)), and the index of the
+        input of each row
+    """
+    rows = []
+    index = []
+    for i, rad_dose_input in enumerate(rad_dose_inputs):
+        for parameters in input_parameters(rad_dose_input):
+            rows.append(surrogate_features(parameters))
+            index.append(i)
+    features = np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURES))
+    return features, np.array(index, dtype=np.intp)
+
+
+@dataclass(frozen=True)
+class SurrogatePrediction:
+    """
+    Predictions of a SurrogateModel, one row per row of features.
+
+    uncertainty is the relative standard uncertainty of each value: the
+    residual scatter of the fit, in log space, widened by the leverage of the
+    row. in_domain is False for rows outside the training domain, whose values
+    should not be trusted
+    """
+
+    values: dict[str, np.ndarray]
+    uncertainty: dict[str, np.ndarray]
+    in_domain: np.ndarray
+
+
+@dataclass
+class DoseEstimate:
+    """
+    The dose metrics of a sample, one value per wedge, from the surrogate model
+    or, when the sample was outside its domain, from a run of RADDOSE-3D, whose
+    summary is kept. If that run failed, source is "failed", the values are
+    empty and error holds the exception
+    """
+
+    sample_id: str
+    values: dict[str, list[float]]
+    uncertainty: dict[str, list[float]]
+    source: str
+    summary: "pd.DataFrame | Summary | None" = field(default=None, repr=False)
+    error: BaseException | None = field(default=None, repr=False)
+
+
+@dataclass(frozen=True)
+class _Fit:
+    active: np.ndarray
+    mean: np.ndarray
+    scale: np.ndarray
+    coefficients: np.ndarray
+    sigma: np.ndarray
+    precision: np.ndarray
+    low: np.ndarray
+    high: np.ndarray
+    leverage_limit: float
+    constant: np.ndarray
+    constant_values: np.ndarray
+
+
+class SurrogateModel:
+    """
+    Approximates Summary dose metrics of RADDOSE-3D runs from their inputs, for
+    screening many candidate strategies far faster than running them.
+
+    Each target is predicted by a ridge regression of its logarithm on the
+    features of surrogate_features, fitted to recorded runs, one row per wedge.
+    Features that are constant in the training runs are left out of the fit,
+    and queries must match them; features missing from some training runs are
+    not used. A query is in the training domain when its used features lie
+    within their training range, widened by domain_margin, and its leverage is
+    no larger than that of the training runs. Runs are recorded to a JSON
+    lines file, as for CostModel, or loaded from a ResultStore.
+    """
+
+    def __init__(
+        self,
+        history_path: str | None = None,
+        targets: Sequence[str] = DEFAULT_TARGETS,
+        min_records: int = 20,
+        ridge: float = 1e-6,
+        domain_margin: float = 0.05,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        history_path : str | None, optional
+            File the recorded runs are appended to and read from. If None,
+            they are only kept in memory, by default None
+        targets : Sequence[str], optional
+            The Summary columns predicted, by default ("Average DWD", "Max Dose")
+        min_records : int, optional
+            Number of recorded wedges needed before the model is fitted. Until
+            then, every query is outside the domain, by default 20
+        ridge : float, optional
+            Ridge penalty relative to the number of records, by default 1e-6
+        domain_margin : float, optional
+            Fraction of the training range by which queries may extrapolate,
+            by default 0.05
+        """
+        if history_path is not None:
+            history_path = path.expanduser(history_path)
+        self.history_path = history_path
+        self.targets = tuple(targets)
+        self.min_records = min_records
+        self.ridge = ridge
+        self.domain_margin = domain_margin
+        self._features: list[list[float]] = []
+        self._values: list[list[float]] = []
+        self._fit: _Fit | None = None
+        self._lock = threading.Lock()
+
+        if history_path is not None and path.isfile(history_path):
+            with open(history_path) as fp:
+                for line in fp:
+                    if line.strip():
+                        self._append(json.loads(line))
+            self.fit()
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    @property
+    def fitted(self) -> bool:
+        return self._fit is not None
+
+    def _append(self, record: dict) -> None:
+        self._features.append(
+            [math.nan if value is None else value for value in record["features"]]
+        )
+        self._values.append(
+            [
+                _first(record["targets"].get(target)) or math.nan
+                for target in self.targets
+            ]
+        )
+
+    def _record(self, records: list[dict]) -> None:
+        with self._lock:
+            for record in records:
+                self._append(record)
+            if self.history_path is not None and records:
+                makedirs(path.dirname(path.abspath(self.history_path)), exist_ok=True)
+                with open(self.history_path, "a") as fp:
+                    for record in records:
+                        fp.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def _history_record(parameters: Mapping[str, object], row: Mapping) -> dict:
+        features = surrogate_features(parameters)
+        targets = {}
+        for name, value in row.items():
+            number = _first(value)
+            if number is not None:
+                targets[name] = number
+        return {
+            "features": [None if math.isnan(value) else value for value in features],
+            "targets": targets,
+        }
+
+    def record(
+        self,
+        rad_dose_input: RadDoseInput,
+        summary: "pd.DataFrame | Summary",
+        refit: bool = True,
+    ) -> None:
+        """
+        Records the summary of a run, one record per wedge
+
+        Parameters
+        ----------
+        rad_dose_input : RadDoseInput
+            The input of the run
+        summary : pd.DataFrame | Summary
+            The summary returned by the run
+        refit : bool, optional
+            If True, the model is refitted, by default True
+        """
+        wedges = input_parameters(rad_dose_input)
+        rows = summary.to_dict(orient="records")
+        records = [
+            self._history_record(wedges[min(i, len(wedges) - 1)], row)
+            for i, row in enumerate(rows)
+        ]
+        self._record(records)
+        if refit:
+            self.fit()
+
+    def record_frame(self, frame: "pd.DataFrame", refit: bool = True) -> int:
+        """
+        Records runs from the rows of a ResultStore, see ResultStore.query
+
+        Parameters
+        ----------
+        frame : pd.DataFrame
+            Rows with "Crystal.<field>", "Beam.<field>", "Wedge.<field>" and
+            target columns
+        refit : bool, optional
+            If True, the model is refitted, by default True
+
+        Returns
+        -------
+        int
+            The number of records added
+        """
+        targets = [target for target in self.targets if target in frame.columns]
+        records = [
+            self._history_record(row, {target: row[target] for target in targets})
+            for row in frame.to_dict(orient="records")
+        ]
+        self._record(records)
+        if refit:
+            self.fit()
+        return len(records)
+
+    @classmethod
+    def from_result_store(
+        cls, store: "ResultStore", filters: list | None = None, **kwargs
+    ) -> "SurrogateModel":
+        """
+        A model fitted to the runs of a ResultStore
+
+        Parameters
+        ----------
+        store : ResultStore
+            The result store
+        filters : list | None, optional
+            Conditions selecting the runs, see ResultStore.query, by default None
+        **kwargs
+            Passed on to SurrogateModel
+
+        Returns
+        -------
+        SurrogateModel
+            The fitted model
+        """
+        model = cls(**kwargs)
+        model.record_frame(store.query(filters=filters))
+        return model
+
+    def fit(self) -> None:
+        """
+        Refits the model from the recorded runs with finite, positive values of
+        every target
+        """
+        with self._lock:
+            features = np.array(self._features, dtype=np.float64)
+            values = np.array(self._values, dtype=np.float64)
+        features = features.reshape(len(features), len(FEATURES))
+        values = values.reshape(len(values), len(self.targets))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logs = np.log10(values)
+        usable = np.isfinite(logs).all(axis=1)
+        features, logs = features[usable], logs[usable]
+
+        complete = np.isfinite(features).all(axis=0)
+        spread = np.zeros(len(FEATURES))
+        if len(features):
+            spread[complete] = np.ptp(features[:, complete], axis=0)
+        active = complete & (spread > 0)
+        constant = complete & (spread == 0)
+        n, p = len(features), int(active.sum()) + 1
+        if n < max(self.min_records, p + 2):
+            self._fit = None
+            return
+
+        used = features[:, active]
+        mean = used.mean(axis=0)
+        scale = used.std(axis=0)
+        design = np.hstack([np.ones((n, 1)), (used - mean) / scale])
+        penalty = np.full(p, self.ridge * n)
+        penalty[0] = 0.0
+        precision = np.linalg.inv(design.T @ design + np.diag(penalty))
+        coefficients = precision @ design.T @ logs
+        residuals = logs - design @ coefficients
+        sigma = np.sqrt((residuals**2).sum(axis=0) / (n - p))
+        leverage = np.einsum("ij,jk,ik->i", design, precision, design)
+
+        standardized = design[:, 1:]
+        low, high = standardized.min(axis=0), standardized.max(axis=0)
+        margin = self.domain_margin * (high - low)
+        self._fit = _Fit(
+            active=active,
+            mean=mean,
+            scale=scale,
+            coefficients=coefficients,
+            sigma=sigma,
+            precision=precision,
+            low=low - margin,
+            high=high + margin,
+            leverage_limit=float(leverage.max()),
+            constant=constant,
+            constant_values=features[0, constant],
+        )
+        logger.debug(
+            f"Surrogate model fitted on {n} records with {p - 1} features, "
+            f"residual scatter {dict(zip(self.targets, sigma.tolist()))}"
+        )
+
+    def predict(self, features: np.ndarray) -> SurrogatePrediction:
+        """
+        Predicts the targets for a batch of feature rows
+
+        Parameters
+        ----------
+        features : np.ndarray
+            Features of shape (rows, len(FEATURES)), see feature_matrix
+
+        Returns
+        -------
+        SurrogatePrediction
+            The predictions. Before the model is fitted, every row is outside
+            the domain and the values are NaN
+        """
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURES))
+        n = len(features)
+        fit = self._fit
+        if fit is None:
+            nan = np.full(n, np.nan)
+            return SurrogatePrediction(
+                values={target: nan.copy() for target in self.targets},
+                uncertainty={target: nan.copy() for target in self.targets},
+                in_domain=np.zeros(n, dtype=bool),
+            )
+
+        standardized = (features[:, fit.active] - fit.mean) / fit.scale
+        finite = np.isfinite(standardized).all(axis=1)
+        standardized[~finite] = 0.0
+        design = np.hstack([np.ones((n, 1)), standardized])
+        logs = design @ fit.coefficients
+        leverage = np.einsum("ij,jk,ik->i", design, fit.precision, design)
+        in_domain = (
+            finite
+            & ((standardized >= fit.low) & (standardized <= fit.high)).all(axis=1)
+            & (leverage <= fit.leverage_limit)
+            & np.isclose(features[:, fit.constant], fit.constant_values).all(axis=1)
+        )
+        # Relative uncertainty of 10**x for a standard deviation s of x
+        uncertainty = math.log(10) * fit.sigma * np.sqrt(1 + leverage)[:, None]
+        return SurrogatePrediction(
+            values={t: 10 ** logs[:, i] for i, t in enumerate(self.targets)},
+            uncertainty={t: uncertainty[:, i] for i, t in enumerate(self.targets)},
+            in_domain=in_domain,
+        )
+
+    def screen(
+        self,
+        samples: Sequence["RadDose3D"],
+        max_uncertainty: float | None = None,
+        max_workers: int | None = None,
+        learn: bool = True,
+    ) -> list[DoseEstimate]:
+        """
+        Estimates the dose metrics of many samples with the surrogate model,
+        running RADDOSE-3D for the samples outside its training domain. Create
+        the samples with lazy=True so that only those that are run write files
+
+        Parameters
+        ----------
+        samples : Sequence[RadDose3D]
+            The samples
+        max_uncertainty : float | None, optional
+            Samples whose predicted relative uncertainty exceeds this are run
+            as well, by default None
+        max_workers : int | None, optional
+            Maximum number of concurrent runs. If None, derived from the cores
+            and memory of the machine, by default None
+        learn : bool, optional
+            If True, the runs are recorded and the model refitted,
+            by default True
+
+        Returns
+        -------
+        list[DoseEstimate]
+            The estimates, in the order of samples. A sample whose run failed
+            gets an estimate with source "failed"; the other runs are still
+            recorded
+        """
+        inputs = [sample._create_pydantic_model() for sample in samples]
+        features, index = feature_matrix(inputs)
+        prediction = self.predict(features)
+
+        accepted = prediction.in_domain.copy()
+        if max_uncertainty is not None:
+            for target in self.targets:
+                accepted &= prediction.uncertainty[target] <= max_uncertainty
+        rejected = np.zeros(len(samples), dtype=bool)
+        rejected[index[~accepted]] = True
+
+        estimates: list[DoseEstimate | None] = [None] * len(samples)
+        for i in np.flatnonzero(~rejected):
+            rows = index == i
+            estimates[i] = DoseEstimate(
+                sample_id=samples[i].sample_id,
+                values={t: v[rows].tolist() for t, v in prediction.values.items()},
+                uncertainty={
+                    t: u[rows].tolist() for t, u in prediction.uncertainty.items()
+                },
+                source=SURROGATE,
+            )
+
+        to_run = np.flatnonzero(rejected).tolist()
+        if to_run:
+            logger.info(
+                f"{len(to_run)} of {len(samples)} samples are outside the domain "
+                "of the surrogate model, running RADDOSE-3D"
+            )
+            workers = min(len(to_run), max_workers or default_concurrency())
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {i: executor.submit(samples[i].run) for i in to_run}
+            for i, future in futures.items():
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    logger.warning(f"Run of {samples[i].sample_id} failed: {e}")
+                    estimates[i] = DoseEstimate(
+                        sample_id=samples[i].sample_id,
+                        values={t: [] for t in self.targets},
+                        uncertainty={t: [] for t in self.targets},
+                        source=FAILED,
+                        error=e,
+                    )
+                    continue
+                if learn:
+                    self.record(inputs[i], summary, refit=False)
+                estimates[i] = DoseEstimate(
+                    sample_id=samples[i].sample_id,
+                    values={
+                        t: [float(v) for v in summary[t]] if t in summary else []
+                        for t in self.targets
+                    },
+                    uncertainty={
+                        t: [0.0] * len(summary[t]) if t in summary else []
+                        for t in self.targets
+                    },
+                    source=RUN,
+                    summary=summary,
+                )
+            if learn:
+                self.fit()
+        return estimates
@@ -0,0 +1,152 @@
+import itertools
+import os
+import re
+from typing import Any, Iterable
+
+from .schemas.input import Beam, Crystal, Wedge
+from .schemas.utils import RadDoseBase
+
+_parameter_pattern = re.compile(
+    r"^(?P<model>Crystal|Beam|Wedge)(\[(?P<index>\d+)\])?\.(?P<field>\w+)$"
+)
+
+
+def parse_parameter(name: str) -> tuple[str, int | None, str]:
+    """
+    Parses a swept parameter name such as "Beam.Flux", "Wedge.ExposureTime"
+    (every wedge) or "Wedge[1].ExposureTime" (the second wedge only)
+
+    Parameters
+    ----------
+    name : str
+        The parameter name
+
+    Returns
+    -------
+    tuple[str, int | None, str]
+        The model name, the wedge index (None for every wedge) and the field name
+
+    Raises
+    ------
+    ValueError
+        If the name is not a valid parameter of the Crystal, Beam or Wedge models
+    """
+    match = _parameter_pattern.match(name)
+    if match is None:
+        raise ValueError(
+            f"Invalid parameter {name}. Expected Crystal.<field>, Beam.<field>, "
+            "Wedge.<field> or Wedge[<index>].<field>"
+        )
+    model_name, index, field = match.group("model", "index", "field")
+    if index is not None and model_name != "Wedge":
+        raise ValueError(f"Only Wedge parameters can be indexed, not {name}")
+
+    model = {"Crystal": Crystal, "Beam": Beam, "Wedge": Wedge}[model_name]
+    if field not in model.model_fields:
+        raise ValueError(f"{model_name} has no field {field}")
+    return model_name, None if index is None else int(index), field
+
+
+def _with_value(model: RadDoseBase, field: str, value: Any) -> RadDoseBase:
+    """
+    Returns a copy of a model with one field changed, running the same
+    validation as the model constructor
+    """
+    copy = model.model_copy()
+    copy.__pydantic_validator__.validate_assignment(copy, field, value)
+    return copy
+
+
+def apply_parameters(
+    crystal: Crystal,
+    beam: Beam,
+    wedge: Wedge | list[Wedge],
+    parameters: dict[str, Any],
+) -> tuple[Crystal, Beam, Wedge | list[Wedge]]:
+    """
+    Returns copies of the crystal, beam and wedges with parameters applied
+
+    Parameters
+    ----------
+    crystal : Crystal
+        A Crystal pydantic model
+    beam : Beam
+        A Beam pydantic model
+    wedge : Wedge | list[Wedge]
+        A Wedge pydantic model, or a list of Wedges
+    parameters : dict[str, Any]
+        Values keyed by parameter name, see parse_parameter
+
+    Returns
+    -------
+    tuple[Crystal, Beam, Wedge | list[Wedge]]
+        The modified crystal, beam and wedge(s)
+    """
+    wedges = wedge if isinstance(wedge, list) else [wedge]
+    for name, value in parameters.items():
+        model_name, index, field = parse_parameter(name)
+        if model_name == "Crystal":
+            crystal = _with_value(crystal, field, value)
+        elif model_name == "Beam":
+            beam = _with_value(beam, field, value)
+        elif index is None:
+            wedges = [_with_value(w, field, value) for w in wedges]
+        else:
+            if index >= len(wedges):
+                raise ValueError(f"{name} refers to a wedge that does not exist")
+            wedges = list(wedges)
+            wedges[index] = _with_value(wedges[index], field, value)
+
+    return crystal, beam, wedges if isinstance(wedge, list) else wedges[0]
+
+
+def expand_grid(grid: dict[str, Iterable[Any]]) -> list[dict[str, Any]]:
+    """
+    Expands a parameter grid into the cartesian product of its values
+
+    Parameters
+    ----------
+    grid : dict[str, Iterable[Any]]
+        Values to sweep, keyed by parameter name
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        One dictionary of parameter values per grid point
+    """
+    for name in grid:
+        parse_parameter(name)
+    names = list(grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(list(grid[name]) for name in names))
+    ]
+
+
+def default_concurrency(memory_per_job_mb: float = 1024) -> int:
+    """
+    Number of RADDOSE-3D processes that can run at once on this machine:
+    one per available core, limited by the available memory
+
+    Parameters
+    ----------
+    memory_per_job_mb : float, optional
+        Expected peak memory of one java process in MB, by default 1024
+
+    Returns
+    -------
+    int
+        The number of concurrent jobs, at least 1
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+
+    try:
+        available_mb = (
+            os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024**2
+        )
+    except (AttributeError, ValueError, OSError):
+        return cores
+    return max(1, min(cores, int(available_mb // memory_per_job_mb)))
@@ -0,0 +1,468 @@
+import logging
+import queue
+import subprocess
+import threading
+from os import path
+
+from .jvm import JVMOptions
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerUnavailableError(RuntimeError):
+    """
+    Raised when a JVM worker cannot be started or dies while running a job
+    """
+
+
+class WorkerJobError(RuntimeError):
+    """
+    Raised when RADDOSE-3D fails inside a JVM worker, with an exception or a
+    non-zero System.exit status
+
+    Attributes
+    ----------
+    status : int
+        The status of the job reported by the worker
+    stdout : bytes
+        stdout of the job
+    stderr : bytes
+        stderr of the job
+    """
+
+    def __init__(self, status: int, stdout: bytes, stderr: bytes) -> None:
+        super().__init__(f"RADDOSE-3D failed in a JVM worker with status {status}")
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class JVMWorker:
+    """
+    A single long-lived Java process running RadDoseWorker.java
+    """
+
+    worker_source = path.join(path.dirname(__file__), "java", "RadDoseWorker.java")
+
+    def __init__(
+        self,
+        raddose_3d_path: str,
+        java: str = "java",
+        startup_timeout: float = 60.0,
+        jvm_arguments: list[str] | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        raddose_3d_path : str
+            Path of the raddose3d.jar file
+        java : str, optional
+            The java executable, by default "java"
+        startup_timeout : float, optional
+            Seconds to wait for the worker to report it is ready, by default 60
+        jvm_arguments : list[str] | None, optional
+            Options of the JVM, e.g. its heap size, by default None
+
+        Raises
+        ------
+        WorkerUnavailableError
+            If the worker process cannot be started
+        """
+        self.jobs_completed = 0
+        self.timed_out = False
+        try:
+            self.process = subprocess.Popen(
+                [
+                    java,
+                    *(jvm_arguments or []),
+                    "-cp",
+                    raddose_3d_path,
+                    self.worker_source,
+                    raddose_3d_path,
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise WorkerUnavailableError(f"Could not start JVM worker: {e}") from e
+
+        if self._readline(startup_timeout) != b"READY":
+            self.kill()
+            raise WorkerUnavailableError("JVM worker did not become ready")
+
+    def _readline(self, timeout: float | None) -> bytes:
+        """
+        Reads a protocol line from the worker, killing the worker if no line
+        arrives within timeout seconds
+
+        Parameters
+        ----------
+        timeout : float | None
+            Seconds to wait. If None, wait forever
+
+        Returns
+        -------
+        bytes
+            The line without its line terminator, or b"" if the worker died
+        """
+        watchdog = None
+        if timeout is not None:
+            watchdog = threading.Timer(timeout, self._time_out)
+            watchdog.start()
+        try:
+            return self.process.stdout.readline().rstrip(b"\r\n")
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+    def _time_out(self) -> None:
+        self.timed_out = True
+        self.kill()
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self.process.stdout.read(size)
+        if len(data) != size:
+            raise WorkerUnavailableError("JVM worker died while sending results")
+        return data
+
+    def _send(self, request: str) -> None:
+        try:
+            self.process.stdin.write(request.encode("utf-8") + b"\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerUnavailableError("JVM worker is not accepting requests") from e
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        """
+        Health check: the worker must answer PING with PONG within timeout seconds
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for the answer, by default 5
+
+        Returns
+        -------
+        bool
+            True if the worker is healthy
+        """
+        if not self.is_alive():
+            return False
+        try:
+            self._send("PING")
+        except WorkerUnavailableError:
+            return False
+        return self._readline(timeout) == b"PONG"
+
+    def execute(
+        self, input_text_file_path: str, prefix: str, timeout: float | None = None
+    ) -> tuple[bytes, bytes]:
+        """
+        Runs RADDOSE-3D on an input file inside the worker
+
+        Parameters
+        ----------
+        input_text_file_path : str
+            Path of the RADDOSE-3D input text file
+        prefix : str
+            Output prefix passed to RADDOSE-3D
+        timeout : float | None, optional
+            Maximum run time in seconds. The worker is killed if exceeded,
+            by default None
+
+        Returns
+        -------
+        tuple[bytes, bytes]
+            stdout and stderr of the run
+
+        Raises
+        ------
+        TimeoutError
+            If the run takes longer than timeout. The worker is killed
+        WorkerUnavailableError
+            If the worker dies during the run, e.g. because RADDOSE-3D called
+            System.exit on a JVM where RadDoseWorker cannot trap it
+        WorkerJobError
+            If the worker reports a non-zero status for the run
+        """
+        if (
+            "\t" in input_text_file_path + prefix
+            or "\n" in input_text_file_path + prefix
+        ):
+            raise ValueError("Paths containing tabs or newlines are not supported")
+
+        self._send(f"RUN\t{input_text_file_path}\t{prefix}")
+        header = self._readline(timeout).split()
+        if len(header) != 4 or header[0] != b"DONE":
+            self.kill()
+            if self.timed_out:
+                raise TimeoutError(f"JVM worker did not finish the job in {timeout}s")
+            raise WorkerUnavailableError("JVM worker died while running a job")
+
+        stdout = self._read_exactly(int(header[2]))
+        stderr = self._read_exactly(int(header[3]))
+        self.jobs_completed += 1
+        status = int(header[1])
+        if status != 0:
+            raise WorkerJobError(status, stdout, stderr)
+        return stdout, stderr
+
+    def kill(self) -> None:
+        if self.is_alive():
+            self.process.kill()
+
+    def close(self) -> None:
+        """
+        Asks the worker to exit and waits for it, killing it if it does not comply
+        """
+        if self.is_alive():
+            try:
+                self._send("QUIT")
+                self.process.wait(timeout=5)
+            except (WorkerUnavailableError, subprocess.TimeoutExpired):
+                self.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+
+class JVMWorkerPool:
+    """
+    A pool of long-lived Java processes running RADDOSE-3D, shared between
+    RadDose3D instances so that JVM startup and class loading are paid once
+    per worker instead of once per run.
+
+    Workers are started lazily, health-checked before each job and recycled
+    after max_jobs_per_worker jobs. RADDOSE-3D keeps some static state between
+    runs, so recycling also bounds how long any state can accumulate.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        raddose_3d_path: str | None = None,
+        java: str = "java",
+        max_jobs_per_worker: int = 100,
+        startup_timeout: float = 60.0,
+        job_timeout: float | None = None,
+        max_start_failures: int = 3,
+        jvm_options: JVMOptions | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        size : int, optional
+            Maximum number of worker processes, by default 2
+        raddose_3d_path : str | None, optional
+            Path of the raddose3d.jar file. If None, the jar shipped with
+            py_raddose_3d is used, by default None
+        java : str, optional
+            The java executable, by default "java"
+        max_jobs_per_worker : int, optional
+            Number of jobs after which a worker is replaced, by default 100
+        startup_timeout : float, optional
+            Seconds to wait for a new worker to become ready, by default 60
+        job_timeout : float | None, optional
+            Maximum run time of a single job in seconds, by default None
+        max_start_failures : int, optional
+            Number of consecutive failures to start a worker after which the
+            pool disables itself, by default 3
+        jvm_options : JVMOptions | None, optional
+            The java executable, fixed heap size and extra flags of the workers,
+            which replace java. Since workers run many inputs, auto_heap and
+            class_data_sharing do not apply to them, by default None
+        """
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+
+        if raddose_3d_path is None:
+            raddose_3d_path = path.join(path.dirname(__file__), "raddose3d.jar")
+
+        self.size = size
+        self.raddose_3d_path = raddose_3d_path
+        self.java = java
+        self.jvm_arguments: list[str] = []
+        if jvm_options is not None:
+            self.java = jvm_options.java
+            self.jvm_arguments = jvm_options.jvm_arguments()
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.startup_timeout = startup_timeout
+        self.job_timeout = job_timeout
+        self.max_start_failures = max_start_failures
+
+        self._idle: queue.LifoQueue[JVMWorker] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        # The worker running each output prefix, None while it waits for one
+        self._running: dict[str, JVMWorker | None] = {}
+        self._cancelled: set[str] = set()
+        self._workers = 0
+        self._start_failures = 0
+        self._closed = False
+
+    @property
+    def available(self) -> bool:
+        """
+        False once the pool has been closed or has failed to start workers
+        max_start_failures times in a row
+        """
+        return not self._closed and self._start_failures < self.max_start_failures
+
+    def _acquire(self) -> JVMWorker:
+        while True:
+            if not self.available:
+                raise WorkerUnavailableError("The JVM worker pool is not available")
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_start = self._workers < self.size
+                    if can_start:
+                        self._workers += 1
+                if can_start:
+                    return self._start_worker()
+                # Poll so that a busy worker being discarded frees a slot
+                try:
+                    worker = self._idle.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+
+            if worker.ping():
+                return worker
+            logger.info("Replacing unhealthy JVM worker")
+            self._discard(worker)
+
+    def _start_worker(self) -> JVMWorker:
+        try:
+            worker = JVMWorker(
+                self.raddose_3d_path,
+                self.java,
+                self.startup_timeout,
+                self.jvm_arguments,
+            )
+        except WorkerUnavailableError:
+            with self._lock:
+                self._workers -= 1
+                self._start_failures += 1
+            raise
+        with self._lock:
+            self._start_failures = 0
+        return worker
+
+    def _discard(self, worker: JVMWorker) -> None:
+        worker.kill()
+        worker.close()
+        with self._lock:
+            self._workers -= 1
+
+    def _release(self, worker: JVMWorker) -> None:
+        if self._closed or worker.jobs_completed >= self.max_jobs_per_worker:
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+
+    def execute(
+        self, input_text_file_path: str, prefix: str, timeout: float | None = None
+    ) -> tuple[bytes, bytes]:
+        """
+        Runs RADDOSE-3D on a worker from the pool, blocking until a worker is free
+
+        Parameters
+        ----------
+        input_text_file_path : str
+            Path of the RADDOSE-3D input text file
+        prefix : str
+            Output prefix passed to RADDOSE-3D, which identifies the job to
+            cancel
+        timeout : float | None, optional
+            Maximum run time in seconds, in addition to the pool's job_timeout,
+            by default None
+
+        Returns
+        -------
+        tuple[bytes, bytes]
+            stdout and stderr of the run
+
+        Raises
+        ------
+        TimeoutError
+            If the run takes longer than timeout or job_timeout. The worker is
+            killed and replaced
+        WorkerUnavailableError
+            If no worker could be started, the worker died during the run or
+            the job was cancelled. Callers are expected to fall back to a
+            one-shot java process unless they cancelled the job
+        WorkerJobError
+            If RADDOSE-3D failed in the worker. The worker is replaced, as
+            the failed run may have left RADDOSE-3D's static state behind
+        """
+        timeouts = [t for t in (timeout, self.job_timeout) if t is not None]
+        timeout = min(timeouts, default=None)
+        with self._lock:
+            self._running[prefix] = None
+        try:
+            worker = self._acquire()
+            with self._lock:
+                cancelled = prefix in self._cancelled
+                self._running[prefix] = worker
+            if cancelled:
+                self._release(worker)
+                raise WorkerUnavailableError("The job was cancelled")
+            try:
+                result = worker.execute(input_text_file_path, prefix, timeout)
+            except BaseException:
+                self._discard(worker)
+                raise
+            self._release(worker)
+            return result
+        finally:
+            with self._lock:
+                del self._running[prefix]
+                self._cancelled.discard(prefix)
+
+    def cancel(self, prefix: str) -> bool:
+        """
+        Cancels the job running or waiting for a worker with an output prefix.
+        A running job's worker is killed, so that it stops computing, and
+        replaced
+
+        Parameters
+        ----------
+        prefix : str
+            The output prefix passed to execute
+
+        Returns
+        -------
+        bool
+            False if no such job was running or waiting
+        """
+        with self._lock:
+            if prefix not in self._running:
+                return False
+            self._cancelled.add(prefix)
+            worker = self._running[prefix]
+        if worker is not None:
+            logger.info(f"Killing the JVM worker running {prefix}")
+            worker.kill()
+        return True
+
+    def close(self) -> None:
+        """
+        Stops all idle workers. Workers that are busy are stopped when released
+        """
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(worker)
+
+    def __enter__(self) -> "JVMWorkerPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
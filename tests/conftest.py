@@ -0,0 +1,63 @@
+import os
+import stat
+import sys
+from os import path
+
+import pytest
+
+from py_raddose_3d.schemas.input import Beam, Crystal, Wedge
+
+FAKE_JAVA = path.join(path.dirname(__file__), "fake_java.py")
+
+
+@pytest.fixture
+def fake_java(tmp_path, monkeypatch) -> str:
+    """
+    Puts a java executable running tests/fake_java.py first on PATH
+    """
+    bin_directory = tmp_path / "bin"
+    bin_directory.mkdir()
+    java = bin_directory / "java"
+    java.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_JAVA}" "$@"\n')
+    java.chmod(java.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    monkeypatch.setenv("PATH", f"{bin_directory}{os.pathsep}{os.environ['PATH']}")
+    for name in (
+        "FAKE_JAVA_SLEEP",
+        "FAKE_JAVA_STDERR",
+        "FAKE_JAVA_EXIT",
+        "FAKE_JAVA_UNGUARDED",
+    ):
+        monkeypatch.delenv(name, raising=False)
+    return str(java)
+
+
+@pytest.fixture
+def crystal() -> Crystal:
+    return Crystal(
+        Type="Cuboid",
+        Dimensions=(100, 100, 100),
+        PixelsPerMicron=0.1,
+        AbsCoefCalc="RD3D",
+        UnitCell=(78.02, 78.02, 78.02),
+        NumMonomers=24,
+        NumResidues=51,
+        ProteinHeavyAtoms=("Zn", 0.333, "S", 6),
+        SolventHeavyConc=("P", 425),
+        SolventFraction=0.64,
+    )
+
+
+@pytest.fixture
+def beam() -> Beam:
+    return Beam(
+        Type="Gaussian",
+        Flux=2e12,
+        FWHM=(20, 70),
+        Energy=12.1,
+        Collimation=("Rectangular", 100, 100),
+    )
+
+
+@pytest.fixture
+def wedge() -> Wedge:
+    return Wedge(Wedge=(0.0, 90.0), ExposureTime=50.0, AngularResolution=1)
@@ -0,0 +1,200 @@
+"""
+A stand-in for the java executable, so that the wrapper can be tested without
+Java or raddose3d.jar. Run with -jar, it behaves like a one-shot RADDOSE-3D
+process: it reads the -i input, prints progress lines and writes Summary.csv and
+DoseState.csv under the -p prefix. Run without -jar, it speaks the protocol of
+RadDoseWorker.java (READY, PING/PONG, RUN, QUIT) and runs each input the same
+way.
+
+The Average DWD of each wedge is ExposureTime * Flux / 1e12 accumulated over the
+wedges, scaled by DOSE_SCALE in the environment; Summary.csv has all the columns
+of RADDOSE-3D. Other environment variables:
+
+    FAKE_JAVA_SLEEP     seconds to sleep before writing the outputs
+    FAKE_JAVA_STDERR    a line printed to stderr before the outputs
+    FAKE_JAVA_EXIT      exit status of a one-shot run, or the status a worker
+                        reports for a run
+    FAKE_JAVA_UNGUARDED if set, a worker exits with FAKE_JAVA_EXIT while running
+                        a job, like RADDOSE-3D calling System.exit on a JVM
+                        where RadDoseWorker cannot trap it
+    FAKE_JAVA_LOG       a file to which every run appends its input path
+
+With the JVM option -Dfake_java.outputs=full, as used by
+benchmarks/run_benchmarks.py, the outputs have a realistic size: a progress line
+per angular step, the warning banner of RADDOSE-3D, and a DoseState.csv row per
+voxel of the crystal's bounding box at its PixelsPerMicron. Such runs simulate
+FAKE_JAVA_SECONDS_PER_MVOXEL_STEP seconds of compute per million voxel-angle
+steps, 0 by default, so that launch overhead can be measured separately from a
+realistic run duration.
+
+    $ python tests/fake_java.py -Dfake_java.outputs=full -jar raddose3d.jar \
+        -i sample.txt -p output/sample-
+"""
+
+import io
+import os
+import sys
+import time
+
+FULL_OUTPUTS = "-Dfake_java.outputs=full"
+
+SUMMARY_COLUMNS = (
+    "Wedge Number",
+    "Average DWD",
+    "Last DWD",
+    "Elastic Yield",
+    "Diffraction Efficiency",
+    "AD-WC",
+    "AD-ExpRegion",
+    "Max Dose",
+    "Dose Threshold",
+    "Abs En Threshold",
+    "TAD",
+    "Dose Contrast",
+    "Used Volume",
+    "Wedge Absorbed Energy",
+    "Dose Inefficiency",
+    "Dose Inefficiency PE",
+)
+
+
+def parse_input(input_path):
+    blocks = {"crystal": {}, "beam": {}}
+    wedges = []
+    block = None
+    with open(input_path) as fp:
+        for line in fp:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            keyword, _, value = line.strip().partition(" ")
+            # RADDOSE-3D starts a block at its keyword, whatever the indentation
+            if keyword.lower() in ("crystal", "beam", "wedge"):
+                block = keyword.lower()
+                if block == "wedge":
+                    wedges.append({"Wedge": value})
+                continue
+            if block == "wedge":
+                wedges[-1][keyword] = value.strip()
+            elif block in blocks:
+                blocks[block][keyword] = value.strip()
+    return blocks["crystal"], blocks["beam"], wedges
+
+
+def voxel_shape(crystal, pixels_per_micron):
+    dimensions = [float(d) for d in crystal.get("Dimensions", "1").split()]
+    dimensions = (dimensions * 3)[:3]
+    return [max(1, int(round(d * pixels_per_micron))) for d in dimensions]
+
+
+def write_voxels(csv_path, shape, pixels_per_micron, dose):
+    import numpy as np
+
+    x, y, z = np.meshgrid(
+        *(np.arange(n, dtype=np.float64) for n in shape), indexing="ij"
+    )
+    voxels = np.column_stack(
+        [
+            x.ravel() / pixels_per_micron,
+            y.ravel() / pixels_per_micron,
+            z.ravel() / pixels_per_micron,
+            np.random.default_rng(0).gamma(2.0, dose / 2, x.size),
+            np.ones(x.size),
+            np.ones(x.size),
+        ]
+    )
+    np.savetxt(csv_path, voxels, delimiter=",", fmt="%.6g")
+
+
+def run(input_path, prefix, stdout, stderr, full=False):
+    if os.environ.get("FAKE_JAVA_LOG"):
+        with open(os.environ["FAKE_JAVA_LOG"], "a") as fp:
+            fp.write(input_path + "\n")
+    crystal, beam, wedges = parse_input(input_path)
+    flux = float(beam.get("Flux", "1e12"))
+    scale = float(os.environ.get("DOSE_SCALE", "1"))
+    print("RADDOSE-3D version 4.0 (fake)", file=stdout, flush=True)
+    if full:
+        pixels_per_micron = float(crystal.get("PixelsPerMicron", "0.5"))
+        shape = voxel_shape(crystal, pixels_per_micron)
+        seconds_per_step = float(
+            os.environ.get("FAKE_JAVA_SECONDS_PER_MVOXEL_STEP", "0")
+        )
+        print(f"Crystal with {shape[0]}x{shape[1]}x{shape[2]} voxels", file=stdout)
+    if os.environ.get("FAKE_JAVA_STDERR"):
+        print(os.environ["FAKE_JAVA_STDERR"], file=stderr, flush=True)
+    time.sleep(float(os.environ.get("FAKE_JAVA_SLEEP", "0")))
+    dose = 0.0
+    rows = []
+    for number, wedge in enumerate(wedges, start=1):
+        start, stop = (float(angle) for angle in wedge["Wedge"].split()[:2])
+        print(f"Wedge {number}:", file=stdout, flush=True)
+        if full:
+            resolution = float(wedge.get("AngularResolution", "2"))
+            steps = max(1, int(abs(stop - start) / resolution))
+            for step in range(steps):
+                print(
+                    f"Exposing angle {start + step * resolution:.2f} deg", file=stdout
+                )
+            stdout.flush()
+            voxels = shape[0] * shape[1] * shape[2]
+            time.sleep(seconds_per_step * steps * voxels / 1e6)
+        else:
+            print(f"Exposing angle {start:.2f} deg", file=stdout, flush=True)
+            print(f"Exposing angle {stop:.2f} deg", file=stdout, flush=True)
+        dose += float(wedge.get("ExposureTime", "1")) * flux / 1e12 * scale
+        rows.append(
+            [number, dose, dose * 1.5, 3e8, 3e8, dose * 0.9, dose * 0.8, dose * 4]
+            + [0.4, 95, dose * 1.2, 3.0, 100, 1e-9, 4e-9, 5e-9]
+        )
+    if full:
+        print("* WARNING *", file=stdout)
+        print("Angular resolution too big", file=stdout, flush=True)
+    with open(prefix + "Summary.csv", "w") as fp:
+        fp.write(",".join(SUMMARY_COLUMNS) + "\n")
+        for row in rows:
+            fp.write(",".join(str(value) for value in row) + "\n")
+    if full:
+        write_voxels(prefix + "DoseState.csv", shape, pixels_per_micron, dose)
+        return
+    with open(prefix + "DoseState.csv", "w") as fp:
+        fp.write(f"0,0,0,{dose},1,1\n1,0,0,{2 * dose},1,1\n0,1,0,0,0,0\n")
+
+
+def serve(full=False):
+    out = sys.stdout.buffer
+    out.write(b"READY\n")
+    out.flush()
+    for line in sys.stdin.buffer:
+        request = line.rstrip(b"\n").decode()
+        if request == "PING":
+            out.write(b"PONG\n")
+            out.flush()
+            continue
+        if request == "QUIT":
+            break
+        _, input_path, prefix = request.split("\t")
+        stdout, stderr = io.StringIO(), io.StringIO()
+        run(input_path, prefix, stdout, stderr, full)
+        status = int(os.environ.get("FAKE_JAVA_EXIT", "0"))
+        if os.environ.get("FAKE_JAVA_UNGUARDED"):
+            os._exit(status)
+        stdout_bytes = stdout.getvalue().encode()
+        stderr_bytes = stderr.getvalue().encode()
+        out.write(f"DONE {status} {len(stdout_bytes)} {len(stderr_bytes)}\n".encode())
+        out.write(stdout_bytes + stderr_bytes)
+        out.flush()
+
+
+def main():
+    args = sys.argv[1:]
+    full = FULL_OUTPUTS in args
+    if "-jar" not in args:
+        serve(full)
+        return
+    input_path, prefix = args[args.index("-i") + 1], args[args.index("-p") + 1]
+    run(input_path, prefix, sys.stdout, sys.stderr, full)
+    sys.exit(int(os.environ.get("FAKE_JAVA_EXIT", "0")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+from os import path
+
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.schemas.assets import (
+    DIGEST_PREFIX,
+    AssetCache,
+    AssetResolver,
+    PdbMirror,
+)
+from py_raddose_3d.schemas.input import RadDoseInput
+
+SEQUENCE = b">2VEO\nMKVLAAGIVALLLAAGCSSSKE\n"
+STRUCTURE = b"HEADER    TEST\nATOM      1  N   MET A   1\nEND\n"
+
+
+@pytest.fixture
+def cache(tmp_path) -> AssetCache:
+    return AssetCache(str(tmp_path / "assets"))
+
+
+@pytest.fixture
+def mirror(tmp_path) -> str:
+    directory = tmp_path / "mirror"
+    (directory / "km").mkdir(parents=True)
+    with gzip.open(directory / "km" / "pdb1kmt.ent.gz", "wb") as fp:
+        fp.write(STRUCTURE)
+    (directory / "2veo.cif").write_bytes(b"data_2VEO\n")
+    return str(directory)
+
+
+def sequence_input(crystal, beam, wedge, seq_file: str) -> RadDoseInput:
+    crystal = crystal.model_copy(
+        update={"AbsCoefCalc": "SEQUENCE", "SeqFile": seq_file}
+    )
+    return RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge])
+
+
+def test_add_stores_contents_by_digest(cache, tmp_path):
+    source = tmp_path / "seq.fasta"
+    source.write_bytes(SEQUENCE)
+
+    digest = cache.add(str(source))
+
+    assert digest == hashlib.sha256(SEQUENCE).hexdigest()
+    assert digest in cache
+    with open(cache.path(digest), "rb") as fp:
+        assert fp.read() == SEQUENCE
+    assert cache.add(str(source)) == digest
+
+
+def test_add_detects_changed_files(cache, tmp_path):
+    source = tmp_path / "seq.fasta"
+    source.write_bytes(SEQUENCE)
+    first = cache.add(str(source))
+    source.write_bytes(SEQUENCE + b"A\n")
+
+    assert cache.add(str(source)) != first
+
+
+def test_stage_places_the_blob(cache, tmp_path):
+    source = tmp_path / "seq.fasta"
+    source.write_bytes(SEQUENCE)
+    digest = cache.add(str(source))
+    destination = str(tmp_path / "staged.fasta")
+
+    assert cache.stage(digest, destination) == destination
+    with open(destination, "rb") as fp:
+        assert fp.read() == SEQUENCE
+    with pytest.raises(FileNotFoundError):
+        cache.stage("0" * 64, destination)
+
+
+def test_mirror_finds_pdb_entries_only(mirror):
+    pdb_mirror = PdbMirror(mirror)
+
+    assert pdb_mirror.find("1KMT") == path.join(mirror, "km", "pdb1kmt.ent.gz")
+    assert pdb_mirror.find("2VEO") is None
+
+
+def test_resolver_stages_a_mirrored_pdb_as_pdb(
+    cache, mirror, tmp_path, crystal, beam, wedge
+):
+    resolver = AssetResolver(cache, mirror)
+    rad_dose_input = RadDoseInput(
+        crystal=crystal.model_copy(update={"Pdb": "1KMT"}), beam=beam, wedge=[wedge]
+    )
+
+    staged = resolver.stage(rad_dose_input, str(tmp_path / "sample"))
+
+    pdb = staged.crystal.Pdb
+    assert pdb == str(tmp_path / "sample" / "assets" / "1KMT.pdb")
+    with open(pdb, "rb") as fp:
+        assert fp.read() == STRUCTURE
+
+
+def test_offline_resolver_rejects_unmirrored_codes(cache, mirror, crystal, beam, wedge):
+    rad_dose_input = RadDoseInput(
+        crystal=crystal.model_copy(update={"Pdb": "2VEO"}), beam=beam, wedge=[wedge]
+    )
+
+    assert AssetResolver(cache, mirror).resolve(rad_dose_input) == {}
+    with pytest.raises(FileNotFoundError, match="2VEO"):
+        AssetResolver(cache, mirror, offline=True).resolve(rad_dose_input)
+
+
+def test_digest_references(cache, tmp_path, crystal, beam, wedge):
+    source = tmp_path / "seq.fasta"
+    source.write_bytes(SEQUENCE)
+    resolver = AssetResolver(cache)
+    rad_dose_input = sequence_input(crystal, beam, wedge, str(source))
+
+    addressed = resolver.content_addressed(rad_dose_input)
+    source.unlink()
+
+    digest = hashlib.sha256(SEQUENCE).hexdigest()
+    assert addressed.crystal.SeqFile == DIGEST_PREFIX + digest
+    assert resolver.resolve(addressed) == {"Crystal.SeqFile": digest}
+    with pytest.raises(FileNotFoundError):
+        resolver.resolve(sequence_input(crystal, beam, wedge, DIGEST_PREFIX + "0"))
+
+
+def test_cache_key_depends_on_contents_not_paths(
+    cache, tmp_path, fake_java, crystal, beam, wedge
+):
+    resolver = AssetResolver(cache)
+    paths = [tmp_path / "a.fasta", tmp_path / "b.fasta"]
+    for file_path in paths:
+        file_path.write_bytes(SEQUENCE)
+    samples = [
+        RadDose3D(
+            f"sample{i}",
+            sequence_input(crystal, beam, wedge, str(file_path)).crystal,
+            beam,
+            wedge,
+            str(tmp_path),
+            lazy=True,
+            assets=resolver,
+        )
+        for i, file_path in enumerate(paths)
+    ]
+
+    assert samples[0].cache_key() == samples[1].cache_key()
+    paths[1].write_bytes(SEQUENCE + b"A\n")
+    assert samples[0].cache_key() != samples[1].cache_key()
+
+    summary = samples[0].run()
+    assert summary.attrs["metrics"]["phases"]["asset_stage"] >= 0
+    with open(samples[0].input_text_file_path) as fp:
+        assert str(tmp_path / "sample0" / "assets" / "SeqFile-a.fasta") in fp.read()
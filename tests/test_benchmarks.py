@@ -0,0 +1,96 @@
+import importlib.util
+import logging
+import sys
+import warnings
+from os import path
+
+import pytest
+
+TESTS = path.dirname(path.abspath(__file__))
+BENCHMARK_DIRECTORY = path.join(path.dirname(TESTS), "benchmarks")
+
+
+@pytest.fixture(scope="module")
+def run_benchmarks():
+    spec = importlib.util.spec_from_file_location(
+        "run_benchmarks", path.join(BENCHMARK_DIRECTORY, "run_benchmarks.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def results(**benchmarks) -> dict:
+    return {"version": "test", "benchmarks": benchmarks}
+
+
+def test_stand_in_writes_raddose_outputs(tmp_path, run_benchmarks):
+    with pytest.warns(RuntimeWarning, match="Angular resolution"):
+        sample = run_benchmarks._stand_in_outputs(str(tmp_path), 0.1, wedges=3)
+
+    # The benchmarks use the stand-in java of the tests
+    assert path.samefile(run_benchmarks.FAKE_JAVA, path.join(TESTS, "fake_java.py"))
+    summary = sample._read_summary()
+    assert len(summary.columns) == 16
+    assert summary.columns[-1] == "Dose Inefficiency PE"
+    assert summary["Wedge Number"].tolist() == [1, 2, 3]
+    assert summary["Average DWD"].is_monotonic_increasing
+    assert sample.load_dose_state().dose.shape == (10, 8, 6)
+
+
+def test_benchmarks_run(tmp_path, run_benchmarks):
+    result = run_benchmarks.bench_input_rendering(str(tmp_path), quick=True)
+
+    assert result["repeat"] == 5
+    assert 0 < result["min_s"] <= result["median_s"]
+
+
+def test_compare_flags_regressions(run_benchmarks):
+    comparison = run_benchmarks.compare(
+        results(a={"median_s": 1.5}, b={"median_s": 1.0}, new={"median_s": 1.0}),
+        results(a={"median_s": 1.0}, b={"median_s": 1.0}),
+        threshold=0.2,
+    )
+
+    assert comparison["benchmark"].tolist() == ["a", "b"]
+    assert comparison["regression"].tolist() == [True, False]
+
+
+@pytest.mark.parametrize(
+    "result, within",
+    [
+        ({"median_s": 0.1, "budget_s": 0.5, "heavy_modules": []}, True),
+        ({"median_s": 0.6, "budget_s": 0.5, "heavy_modules": []}, False),
+        ({"median_s": 0.1, "budget_s": 0.5, "heavy_modules": ["pandas"]}, False),
+    ],
+)
+def test_import_budget(run_benchmarks, result, within):
+    assert run_benchmarks.check_import_budget(results(import_time=result)) is within
+    assert run_benchmarks.check_import_budget(results())
+
+
+def test_runner_exits_on_a_blown_budget(run_benchmarks, monkeypatch):
+    monkeypatch.setattr(
+        run_benchmarks,
+        "BENCHMARKS",
+        {
+            "fast": {
+                "import_time": lambda work_directory, quick: {
+                    "median_s": 1.0,
+                    "budget_s": 0.5,
+                    "heavy_modules": [],
+                }
+            },
+            "jar": {},
+        },
+    )
+    monkeypatch.setattr(run_benchmarks, "previous_results", lambda version: None)
+    monkeypatch.setattr(sys, "argv", ["run_benchmarks", "--tier", "fast", "--no-save"])
+
+    # main sets the root logger level and the warning filters
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "level", root.level)
+    with warnings.catch_warnings(), pytest.raises(SystemExit) as exc_info:
+        run_benchmarks.main()
+
+    assert exc_info.value.code == 1
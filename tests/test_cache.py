@@ -0,0 +1,122 @@
+import os
+import time
+
+import pytest
+
+from py_raddose_3d.cache import (
+    DiskCache,
+    MemoryCache,
+    TieredCache,
+    canonical_input,
+    input_key,
+)
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.schemas.input import RadDoseInput
+
+OUTPUTS = {"Summary.csv": b"Wedge Number,Average DWD\n1,1.0\n", "log.txt": b"ok\n"}
+
+
+@pytest.fixture
+def rad_dose_input(crystal, beam, wedge) -> RadDoseInput:
+    return RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge])
+
+
+def test_key_is_canonical(tmp_path, rad_dose_input, wedge):
+    jar = str(tmp_path / "raddose3d.jar")
+    single = rad_dose_input.model_copy(update={"wedge": wedge})
+
+    assert canonical_input(single) == canonical_input(rad_dose_input)
+    assert input_key(single, jar) == input_key(rad_dose_input, jar)
+    brighter = rad_dose_input.model_copy(
+        update={"beam": rad_dose_input.beam.model_copy(update={"Flux": 3e12})}
+    )
+    assert input_key(brighter, jar) != input_key(rad_dose_input, jar)
+
+
+def test_key_depends_on_the_jar_and_referenced_files(tmp_path, rad_dose_input):
+    jar = tmp_path / "raddose3d.jar"
+    jar.write_bytes(b"v1")
+    seq_file = tmp_path / "seq.fasta"
+    seq_file.write_text(">A\nMKV\n")
+    sequence_input = rad_dose_input.model_copy(
+        update={
+            "crystal": rad_dose_input.crystal.model_copy(
+                update={"SeqFile": str(seq_file)}
+            )
+        }
+    )
+    first = input_key(sequence_input, str(jar))
+
+    seq_file.write_text(">A\nMKVL\n")
+    second = input_key(sequence_input, str(jar))
+    jar.write_bytes(b"v2")
+    os.utime(jar, ns=(time.time_ns(), time.time_ns() + 10**9))
+
+    assert len({first, second, input_key(sequence_input, str(jar))}) == 3
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, OUTPUTS)
+    cache.get("a")
+    cache.put("c", OUTPUTS)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == OUTPUTS
+    assert len(cache) == 2
+
+
+def test_memory_cache_limits_bytes_and_age(monkeypatch):
+    size = sum(len(contents) for contents in OUTPUTS.values())
+    cache = MemoryCache(max_entries=None, max_bytes=2 * size, max_age=10)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    for key in ("a", "b", "c"):
+        cache.put(key, OUTPUTS)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == OUTPUTS
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("b") is None
+
+
+def test_disk_cache_round_trips_and_evicts(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    cache.put("a", OUTPUTS)
+
+    assert DiskCache(cache.directory).get("a") == OUTPUTS
+    assert cache.get("missing") is None
+
+    size = sum(len(contents) for contents in OUTPUTS.values())
+    bounded = DiskCache(cache.directory, max_bytes=2 * size)
+    os.utime(bounded._entry_directory("a"), (1, 1))
+    bounded.put("b", OUTPUTS)
+    assert bounded.get("a") is None
+    assert bounded.get("b") == OUTPUTS
+    assert not [name for name in os.listdir(cache.directory) if name[0] == "."]
+
+
+def test_tiered_cache_promotes_hits(tmp_path):
+    memory, disk = MemoryCache(), DiskCache(str(tmp_path / "cache"))
+    disk.put("a", OUTPUTS)
+    cache = TieredCache(memory, disk)
+
+    assert cache.get("a") == OUTPUTS
+    assert memory.get("a") == OUTPUTS
+
+
+def test_cached_runs_skip_java(tmp_path, fake_java, crystal, beam, wedge, monkeypatch):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    cache = MemoryCache()
+
+    first = RadDose3D("first", crystal, beam, wedge, str(tmp_path), cache=cache)
+    first.run()
+    second = RadDose3D("second", crystal, beam, wedge, str(tmp_path), cache=cache)
+    summary = second.run()
+
+    assert summary["Average DWD"].tolist() == [100.0]
+    assert summary.attrs["metrics"]["mode"] == "cache"
+    assert os.path.isfile(second.prefix + "DoseState.csv")
+    assert len(log.read_text().splitlines()) == 1
@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+import pytest
+
+from py_raddose_3d.cost import (
+    DEFAULT_RUNTIME_COEFFICIENTS,
+    CostEstimate,
+    CostModel,
+    _fit,
+    cost_features,
+    crystal_volume,
+)
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.schemas.input import RadDoseInput, Wedge
+
+
+def make_input(crystal, beam, pixels_per_micron, angular_resolution=1.0):
+    return RadDoseInput(
+        crystal=crystal.model_copy(update={"PixelsPerMicron": pixels_per_micron}),
+        beam=beam,
+        wedge=[
+            Wedge(
+                Wedge=(0.0, 90.0),
+                ExposureTime=10.0,
+                AngularResolution=angular_resolution,
+            )
+        ],
+    )
+
+
+def test_features(crystal, beam):
+    rad_dose_input = make_input(crystal, beam, 0.1, angular_resolution=2.0)
+
+    features = cost_features(rad_dose_input)
+
+    assert crystal_volume(rad_dose_input) == 1e6
+    assert features["voxels"] == pytest.approx(1000)
+    assert features["voxel_steps"] == pytest.approx(1000 * 45)
+    assert features["spectrum_voxel_steps"] == 0
+    assert features["photons"] == 0
+    sphere = rad_dose_input.model_copy(
+        update={
+            "crystal": rad_dose_input.crystal.model_copy(
+                update={"Type": "Spherical", "Dimensions": "10"}
+            )
+        }
+    )
+    assert crystal_volume(sphere) == pytest.approx(math.pi / 6 * 1000)
+
+
+def test_uncalibrated_model_uses_defaults(crystal, beam):
+    model = CostModel()
+    features = cost_features(make_input(crystal, beam, 0.1))
+
+    estimate = model.estimate(make_input(crystal, beam, 0.1))
+
+    assert model.runtime_coefficients == list(DEFAULT_RUNTIME_COEFFICIENTS)
+    assert estimate.runtime_s == pytest.approx(
+        1.0 + 1e-6 * features["voxels"] + 2e-7 * features["voxel_steps"]
+    )
+
+
+def test_model_learns_from_recorded_runs(tmp_path, crystal, beam):
+    history_path = str(tmp_path / "cost" / "history.jsonl")
+    model = CostModel(history_path, min_records=4)
+    for pixels_per_micron in (0.1, 0.2, 0.3, 0.4, 0.5):
+        for angular_resolution in (1.0, 5.0):
+            rad_dose_input = make_input(
+                crystal, beam, pixels_per_micron, angular_resolution
+            )
+            features = cost_features(rad_dose_input)
+            model.record(
+                rad_dose_input,
+                2.0 + 1e-5 * features["voxel_steps"],
+                100.0 + 1e-3 * features["voxels"],
+            )
+
+    estimate = model.estimate(make_input(crystal, beam, 0.25))
+
+    features = cost_features(make_input(crystal, beam, 0.25))
+    assert estimate.runtime_s == pytest.approx(2.0 + 1e-5 * features["voxel_steps"])
+    assert estimate.memory_mb == pytest.approx(100.0 + 1e-3 * features["voxels"])
+    reloaded = CostModel(history_path, min_records=4)
+    assert len(reloaded) == 10
+    reloaded_estimate = reloaded.estimate(make_input(crystal, beam, 0.25))
+    assert reloaded_estimate.runtime_s == pytest.approx(estimate.runtime_s)
+    assert reloaded_estimate.memory_mb == pytest.approx(estimate.memory_mb)
+
+
+def test_dropped_features_get_no_weight():
+    x = np.array([10.0, 20.0, 30.0, 40.0])
+    rows = np.column_stack([np.ones(4), x, np.full(4, 5.0)])
+
+    # With the constant feature at its default, the fitted intercept is -5
+    coefficients = _fit(rows, 2 * x + 10, defaults=(1.0, 1e-6, 3.0))
+
+    assert coefficients[0] == 0
+    assert coefficients[1] == pytest.approx(np.dot(x, 2 * x - 5) / np.dot(x, x))
+    assert coefficients[2] == 3.0
+
+
+def test_estimate_helpers():
+    estimate = CostEstimate(runtime_s=100.0, memory_mb=300.0)
+
+    assert estimate.timeout() == 300.0
+    assert CostEstimate(runtime_s=1.0, memory_mb=1.0).timeout() == 60.0
+    assert estimate.heap_mb() == 450
+    assert CostEstimate(runtime_s=1.0, memory_mb=1.0).heap_mb() == 256
+
+
+def test_runs_are_recorded(tmp_path, fake_java, crystal, beam, wedge):
+    model = CostModel()
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path), cost_model=model)
+
+    sample.run()
+
+    assert len(model) == 1
+    assert model._records[0]["runtime_s"] > 0
+    assert sample.estimate_cost() == model.estimate(sample._create_pydantic_model())
@@ -0,0 +1,95 @@
+import os
+from os import path
+
+import numpy as np
+import pytest
+
+from py_raddose_3d.dose_state import (
+    DoseGrid,
+    SparseDoseGrid,
+    load_dose_state,
+    save_dose_state,
+    sidecar_directory,
+)
+from py_raddose_3d.raddose3d import RadDose3D
+
+DOSE_STATE = (
+    "0.0,0.0,0.0,1.5,1,1\n"
+    "0.5,0.0,0.0,2.5,1,1\n"
+    "0.0,0.5,1.0,3.0,1,1\n"
+    "0.5,0.5,1.0,0,0,0\n"
+)
+
+
+@pytest.fixture
+def csv_path(tmp_path) -> str:
+    csv_path = tmp_path / "DoseState.csv"
+    csv_path.write_text(DOSE_STATE)
+    return str(csv_path)
+
+
+def test_dense_grid(csv_path):
+    grid = load_dose_state(csv_path, sidecar=False, chunksize=2)
+
+    assert isinstance(grid, DoseGrid)
+    assert grid.dose.shape == (2, 2, 2)
+    assert grid.x.tolist() == [0.0, 0.5]
+    assert grid.z.tolist() == [0.0, 1.0]
+    assert grid.dose[1, 0, 0] == 2.5
+    assert grid.dose[0, 1, 1] == 3.0
+    assert grid.dose[1, 1, 1] == 0.0
+    assert np.isnan(grid.dose[1, 1, 0])
+
+
+def test_sparse_grid_round_trips(csv_path):
+    sparse = load_dose_state(csv_path, sparse=True, sidecar=False)
+    dense = sparse.to_dense()
+
+    assert isinstance(sparse, SparseDoseGrid)
+    assert sparse.shape == (2, 2, 2)
+    assert sorted(sparse.dose.tolist()) == [0.0, 1.5, 2.5, 3.0]
+    np.testing.assert_array_equal(
+        dense.to_sparse().dose, dense.dose[~np.isnan(dense.dose)]
+    )
+
+
+def test_sidecar_is_reused_until_the_csv_changes(csv_path):
+    first = load_dose_state(csv_path)
+
+    assert path.isfile(path.join(sidecar_directory(csv_path), "dense.npy"))
+    assert isinstance(load_dose_state(csv_path).dose, np.memmap)
+    np.testing.assert_array_equal(load_dose_state(csv_path).dose, first.dose)
+
+    with open(csv_path, "a") as fp:
+        fp.write("1.0,0.0,0.0,9.0,1,1\n")
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert load_dose_state(csv_path).dose.shape == (3, 2, 2)
+
+
+def test_sparse_sidecar_does_not_serve_dense_loads(csv_path):
+    load_dose_state(csv_path, sparse=True)
+
+    assert not path.exists(path.join(sidecar_directory(csv_path), "dense.npy"))
+    assert isinstance(load_dose_state(csv_path), DoseGrid)
+
+
+def test_npz_round_trips(csv_path, tmp_path):
+    sparse = load_dose_state(csv_path, sparse=True, sidecar=False)
+    npz_path = str(tmp_path / "DoseState.npz")
+
+    save_dose_state(npz_path, sparse)
+
+    loaded = load_dose_state(npz_path, sparse=True)
+    np.testing.assert_array_equal(loaded.indices, sparse.indices)
+    np.testing.assert_array_equal(loaded.dose, sparse.dose)
+    assert load_dose_state(npz_path).dose.shape == (2, 2, 2)
+
+
+def test_sample_loads_its_dose_state(tmp_path, fake_java, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+    sample.run()
+
+    assert np.nanmax(sample.load_dose_state().dose) == 200.0
+    assert sample.load_dose_state(sparse=True).dose.tolist() == [100.0, 200.0, 0.0]
@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+import pytest
+
+from py_raddose_3d.dose_stats import DoseStatistics, QuantileSketch
+from py_raddose_3d.raddose3d import RadDose3D
+
+
+def test_sketch_quantiles_are_within_the_relative_accuracy():
+    values = np.random.default_rng(0).lognormal(0, 2, 100_000)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.update(values[:50_000])
+    other = QuantileSketch(relative_accuracy=0.01)
+    other.update(values[50_000:])
+    sketch.merge(other)
+
+    for q in (0.1, 0.5, 0.9, 0.99):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.02)
+    assert math.isnan(QuantileSketch().quantile(0.5))
+    with pytest.raises(ValueError):
+        sketch.merge(QuantileSketch(relative_accuracy=0.02))
+
+
+def test_statistics_of_chunks_match_the_whole():
+    dose = np.array([0.0, 0.05, 0.25, 1.0, 2.0, np.nan])
+    statistics = DoseStatistics(bin_width=0.5, thresholds=(0.0, 0.5))
+    statistics.update(dose[:3])
+    statistics.update(dose[3:])
+
+    result = statistics.to_dict()
+
+    assert result["count"] == 5
+    assert result["max"] == 2.0
+    assert result["mean"] == pytest.approx(3.3 / 5)
+    assert result["histogram"] == {
+        "counts": [3, 0, 1, 0, 1],
+        "edges": [0.0, 0.5, 1.0, 1.5, 2.0, 2.5],
+    }
+    assert result["threshold_averages"] == {
+        0.0: pytest.approx(3.3 / 4),
+        0.5: pytest.approx(1.5),
+    }
+    assert result["percentiles"][50] == pytest.approx(0.25, rel=0.02)
+
+
+def test_fixed_bins_and_merging():
+    first = DoseStatistics(bins=[0, 1, 2])
+    second = DoseStatistics(bins=[0, 1, 2])
+    first.update([0.5, 5.0])
+    second.update([1.5])
+
+    first.merge(second)
+
+    assert first.count == 3
+    assert first.histogram()[0].tolist() == [1, 1]
+    with pytest.raises(ValueError):
+        first.merge(DoseStatistics())
+
+
+def test_empty_statistics():
+    result = DoseStatistics().to_dict()
+
+    assert result["count"] == 0
+    assert math.isnan(result["max"])
+    assert math.isnan(result["mean"])
+    assert math.isnan(result["threshold_averages"][0.0])
+
+
+def test_run_reports_dose_statistics(tmp_path, fake_java, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    summary = sample.run(dose_statistics=DoseStatistics(bin_width=100))
+
+    statistics = summary.attrs["dose_statistics"]
+    assert statistics["count"] == 3
+    assert statistics["max"] == 200.0
+    assert statistics["threshold_averages"][0.0] == 150.0
+    assert statistics["histogram"]["counts"] == [1, 1, 1]
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+from os import path
+
+import pytest
+
+# The same budget as the import_time benchmark, see benchmarks/run_benchmarks.py
+IMPORT_TIME_BUDGET_S = 0.5
+HEAVY_MODULES = ("pandas", "numpy")
+IMPORT_SCRIPT = """
+import logging, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in sys.argv[1:] if m in sys.modules]
+print(elapsed, len(logging.getLogger().handlers), *heavy)
+"""
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+def fresh_import(module: str) -> tuple[float, int, list[str]]:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(module=module), *HEAVY_MODULES],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    ).stdout.split()
+    return float(output[0]), int(output[1]), output[2:]
+
+
+@pytest.mark.parametrize(
+    "module", ["py_raddose_3d", "py_raddose_3d.raddose3d", "py_raddose_3d.summary"]
+)
+def test_import_is_light(module):
+    # The best of a few runs, so that a busy machine does not fail the test
+    results = [fresh_import(module) for _ in range(3)]
+
+    assert min(elapsed for elapsed, _, _ in results) < IMPORT_TIME_BUDGET_S
+    for _, root_handlers, heavy in results:
+        assert heavy == []
+        assert root_handlers == 0
@@ -0,0 +1,62 @@
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.schemas.input import Beam, Crystal, RadDoseInput, Wedge
+
+
+def test_renders_the_keyword_format():
+    rad_dose_input = RadDoseInput(
+        crystal=Crystal(
+            Type="Cuboid",
+            Dimensions=(100, 80, 60),
+            PixelsPerMicron=0.5,
+            AbsCoefCalc="SEQUENCE",
+            SeqFile="C:/data/2: seq.fasta",
+            CalculatePEescape=True,
+            CalcSurrounding=False,
+        ),
+        beam=Beam(
+            Type="TopHat", Flux=2e12, Energy=12.1, Collimation=("Circular", 50, 50)
+        ),
+        wedge=[
+            Wedge(Wedge=(0, 90), ExposureTime=50),
+            Wedge(Wedge=(90, 180), ExposureTime=10.0, StartOffset=(0, 1, 0)),
+        ],
+    )
+
+    assert rad_dose_input.to_raddose_text() == (
+        "Crystal\n"
+        "  Type Cuboid\n"
+        "  Dimensions 100.0 80.0 60.0\n"
+        "  PixelsPerMicron 0.5\n"
+        "  AbsCoefCalc SEQUENCE\n"
+        "  SeqFile C:/data/2: seq.fasta\n"
+        "  CalculatePEescape true\n"
+        "  CalcSurrounding false\n"
+        "Beam\n"
+        "  Type TopHat\n"
+        "  Flux 2000000000000.0\n"
+        "  Energy 12.1\n"
+        "  Collimation Circular 50.0 50.0\n"
+        "Wedge 0.0 90.0\n"
+        "  ExposureTime 50.0\n"
+        "Wedge 90.0 180.0\n"
+        "  ExposureTime 10.0\n"
+        "  StartOffset 0.0 1.0 0.0\n"
+    )
+
+
+def test_single_wedge_renders_like_a_list(crystal, beam, wedge):
+    single = RadDoseInput(crystal=crystal, beam=beam, wedge=wedge)
+
+    assert single.to_raddose_text() == (
+        RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge]).to_raddose_text()
+    )
+
+
+def test_sample_writes_its_input_file(tmp_path, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    with open(sample.input_text_file_path) as fp:
+        text = fp.read()
+
+    expected = RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge])
+    assert text == expected.to_raddose_text()
@@ -0,0 +1,51 @@
+import pickle
+from os import path
+
+from py_raddose_3d.job import RadDoseJob
+from py_raddose_3d.raddose3d import RadDose3D
+
+
+def test_lazy_samples_do_not_touch_the_filesystem(tmp_path, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path), lazy=True)
+
+    assert not path.exists(sample.sample_directory)
+    sample.prepare()
+    sample.prepare()
+    assert path.isfile(sample.input_text_file_path)
+
+
+def test_eager_samples_write_their_input(tmp_path, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    assert path.isfile(sample.input_text_file_path)
+
+
+def test_lazy_run(tmp_path, fake_java, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path), lazy=True)
+
+    assert sample.run()["Average DWD"].tolist() == [100.0]
+
+
+def test_jobs_compare_by_canonical_input(tmp_path, crystal, beam, wedge):
+    job = RadDoseJob("sample", crystal, beam, [wedge], str(tmp_path))
+    same = RadDoseJob("sample", crystal.model_copy(), beam, wedge, str(tmp_path))
+    brighter = RadDoseJob(
+        "sample", crystal, beam.model_copy(update={"Flux": 3e12}), wedge, str(tmp_path)
+    )
+
+    assert job.wedge == (wedge,)
+    assert job == same
+    assert hash(job) == hash(same)
+    assert job != brighter
+    assert len({job, same, brighter}) == 2
+    assert pickle.loads(pickle.dumps(job)) == job
+
+
+def test_samples_round_trip_through_jobs(tmp_path, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, [wedge], str(tmp_path), lazy=True)
+
+    copy = RadDose3D.from_job(sample.job)
+
+    assert copy.job == sample.job
+    assert copy.prefix == sample.prefix
+    assert not path.exists(copy.sample_directory)
@@ -0,0 +1,96 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from py_raddose_3d.job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue, QueueWorker
+from py_raddose_3d.schemas.crystal import Crystal
+from py_raddose_3d.schemas.input import RadDoseInput
+
+
+@pytest.fixture
+def queue(tmp_path) -> JobQueue:
+    return JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2)
+
+
+@pytest.fixture
+def rad_dose_input(crystal, beam, wedge) -> RadDoseInput:
+    return RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge])
+
+
+def test_enqueue_is_idempotent(queue, rad_dose_input):
+    first = queue.enqueue(rad_dose_input, "sample")
+    assert queue.enqueue(rad_dose_input, "sample") == first
+    assert queue.enqueue(rad_dose_input, "other") != first
+    assert queue.counts()[QUEUED] == 2
+
+
+def test_claim_round_trips_small_molecule_input(queue, beam, wedge):
+    crystal = Crystal(
+        Type="Cuboid",
+        Dimensions=(10, 10, 10),
+        PixelsPerMicron=0.5,
+        AbsCoefCalc="SMALLMOLE",
+        SmallMoleAtoms=("C", 18, "H", 15, "Bi", 8),
+    )
+    rad_dose_input = RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge])
+    job_id = queue.enqueue(rad_dose_input, "small")
+
+    job = queue.claim("worker")
+
+    assert job.id == job_id
+    assert job.input.crystal.SmallMoleAtoms == "C 18 H 15 Bi 8"
+    assert queue.status(job_id) == RUNNING
+
+
+def test_claim_fails_undecodable_jobs(queue, rad_dose_input):
+    bad_id = queue.enqueue(rad_dose_input, "bad")
+    good_id = queue.enqueue(rad_dose_input, "good")
+    with sqlite3.connect(queue.database_path) as connection:
+        connection.execute(
+            "UPDATE jobs SET input = ? WHERE id = ?", ('{"crystal": 1}', bad_id)
+        )
+
+    job = queue.claim("worker")
+
+    assert job.id == good_id
+    assert queue.status(bad_id) == FAILED
+    assert queue.error(bad_id).startswith("ValidationError")
+    assert queue.claim("other-worker") is None
+
+
+def test_expired_lease_is_claimed_again(queue, rad_dose_input):
+    job_id = queue.enqueue(rad_dose_input, "sample")
+    queue.lease_seconds = -1
+    first = queue.claim("worker-1")
+
+    second = queue.claim("worker-2")
+
+    assert second.id == job_id
+    assert second.attempts == 2
+    assert not queue.complete(first, pd.DataFrame({"Average DWD": [1.0]}))
+
+
+def test_worker_completes_jobs(queue, rad_dose_input, fake_java, tmp_path):
+    job_id = queue.enqueue(rad_dose_input, "sample", str(tmp_path))
+
+    assert QueueWorker(queue, "worker").run(stop_when_empty=True) == 1
+
+    assert queue.status(job_id) == DONE
+    assert queue.result(job_id)["Average DWD"].tolist() == [100.0]
+
+
+def test_worker_retries_then_fails(
+    queue, rad_dose_input, fake_java, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("FAKE_JAVA_EXIT", "1")
+    job_id = queue.enqueue(rad_dose_input, "sample", str(tmp_path))
+    worker = QueueWorker(queue, "worker")
+
+    assert worker.run_one()
+    assert queue.status(job_id) == QUEUED
+    assert worker.run_one()
+
+    assert queue.status(job_id) == FAILED
+    assert queue.error(job_id).startswith("RadDose3DError")
+    assert not worker.run_one()
@@ -0,0 +1,120 @@
+import json
+from os import path
+
+import pytest
+
+from py_raddose_3d.jvm import DUMP, SHARED, JVMOptions
+from py_raddose_3d.metrics import RunMetrics
+from py_raddose_3d.raddose3d import RadDose3D
+
+
+@pytest.fixture
+def jar(tmp_path) -> str:
+    jar_path = tmp_path / "raddose3d.jar"
+    jar_path.write_bytes(b"jar")
+    return str(jar_path)
+
+
+def dumped(launch) -> None:
+    with open(launch.dump, "wb") as fp:
+        fp.write(b"archive")
+
+
+def test_jvm_arguments():
+    options = JVMOptions(initial_heap_mb=128, flags=("-XX:+UseSerialGC",))
+
+    assert options.jvm_arguments() == ["-Xms128m", "-XX:+UseSerialGC"]
+    assert options.jvm_arguments(heap_mb=512.5)[0] == "-Xmx512m"
+    assert JVMOptions(heap_mb=1024).jvm_arguments(heap_mb=512) == ["-Xmx1024m"]
+
+
+def test_launch_without_class_data_sharing(jar):
+    launch = JVMOptions(heap_mb=256).launch(jar)
+
+    assert launch.command == ["java", "-Xmx256m", "-jar", jar]
+    assert launch.class_data_sharing is None
+    launch.finish(True, RunMetrics("sample"))
+
+
+def test_archive_is_dumped_then_shared(tmp_path, jar):
+    options = JVMOptions(class_data_sharing=True, archive_directory=str(tmp_path))
+    first = options.launch(jar)
+
+    assert first.class_data_sharing == DUMP
+    assert f"-XX:ArchiveClassesAtExit={first.dump}" in first.command
+    assert first.command[-2:] == ["-jar", jar]
+    dumped(first)
+    cold = RunMetrics("first", phases={"first_output": 0.8})
+    first.finish(True, cold)
+
+    assert cold.class_data_sharing == DUMP
+    assert path.isfile(first.archive)
+    assert not path.exists(first.dump)
+    second = options.launch(jar)
+    assert second.class_data_sharing == SHARED
+    assert f"-XX:SharedArchiveFile={first.archive}" in second.command
+    warm = RunMetrics("second", phases={"first_output": 0.3})
+    second.finish(True, warm)
+    assert warm.class_data_sharing == SHARED
+    assert warm.startup_saving_s == pytest.approx(0.5)
+
+
+def test_failed_dumps_are_discarded(tmp_path, jar):
+    launch = JVMOptions(
+        class_data_sharing=True, archive_directory=str(tmp_path)
+    ).launch(jar)
+    dumped(launch)
+
+    launch.finish(False, RunMetrics("sample"))
+
+    assert not path.exists(launch.dump)
+    assert not path.exists(launch.archive)
+
+
+def test_shared_runs_without_stats_report_no_saving(tmp_path, jar):
+    options = JVMOptions(class_data_sharing=True, archive_directory=str(tmp_path))
+    with open(options.archive_path(jar), "wb") as fp:
+        fp.write(b"archive")
+    metrics = RunMetrics("sample", phases={"first_output": 0.3})
+
+    options.launch(jar).finish(True, metrics)
+
+    assert metrics.class_data_sharing == SHARED
+    assert metrics.startup_saving_s is None
+
+
+def test_archives_are_kept_per_jar(tmp_path, jar):
+    options = JVMOptions(class_data_sharing=True, archive_directory=str(tmp_path))
+    archive = options.archive_path(jar)
+
+    with open(jar, "ab") as fp:
+        fp.write(b" updated")
+
+    assert options.archive_path(jar) != archive
+    assert path.dirname(archive) == str(tmp_path)
+    assert path.basename(archive).startswith("raddose3d-")
+
+
+def test_runs_use_the_jvm_options(tmp_path, fake_java, crystal, beam, wedge):
+    archive_directory = tmp_path / "cds"
+    sample = RadDose3D(
+        "sample",
+        crystal,
+        beam,
+        wedge,
+        str(tmp_path),
+        jvm_options=JVMOptions(
+            auto_heap=True,
+            class_data_sharing=True,
+            archive_directory=str(archive_directory),
+        ),
+    )
+
+    summary = sample.run()
+
+    assert summary["Average DWD"].tolist() == [100.0]
+    assert summary.attrs["metrics"]["class_data_sharing"] == DUMP
+    # The stand-in java dumps no archive, and none is published
+    assert list(archive_directory.iterdir()) == []
+    heap_mb = sample.estimate_cost().heap_mb()
+    assert f"-Xmx{heap_mb}m" in sample._command()
@@ -0,0 +1,174 @@
+import asyncio
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from py_raddose_3d.metrics import (
+    PrometheusExporter,
+    RunMetrics,
+    add_metrics_hook,
+    remove_metrics_hook,
+    wait_with_rusage,
+)
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.supervisor import FATAL, STDERR, OutputPattern, Supervisor
+
+
+class FakeProcess:
+    def __init__(self, returncode):
+        self.returncode = returncode
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+
+
+@pytest.fixture
+def hooked():
+    received = []
+    add_metrics_hook(received.append)
+    yield received
+    remove_metrics_hook(received.append)
+
+
+def test_run_records_metrics(tmp_path, fake_java, crystal, beam, wedge, hooked):
+    def failing_hook(metrics):
+        raise RuntimeError("hook failure")
+
+    sample = RadDose3D(
+        "sample", crystal, beam, wedge, str(tmp_path), metrics_hook=failing_hook
+    )
+
+    summary = sample.run()
+
+    metrics = summary.attrs["metrics"]
+    assert metrics["mode"] == "process"
+    assert metrics["status"] == "ok"
+    for phase in ("cache_lookup", "spawn", "first_output", "compute", "output_parse"):
+        assert metrics["phases"][phase] >= 0
+    assert metrics["phases"]["first_output"] <= metrics["phases"]["compute"]
+    assert metrics["peak_rss_mb"] > 0
+    assert metrics["cpu_user_s"] is not None
+    assert metrics["total_s"] >= sum(
+        metrics["phases"][phase] for phase in ("spawn", "compute")
+    )
+    assert hooked == [sample.metrics]
+
+
+def test_failed_run_reports_error_status(
+    tmp_path, fake_java, crystal, beam, wedge, hooked, monkeypatch
+):
+    monkeypatch.setenv("FAKE_JAVA_EXIT", "2")
+
+    with pytest.raises(RuntimeError):
+        RadDose3D("sample", crystal, beam, wedge, str(tmp_path)).run()
+
+    assert hooked[0].status == "error"
+
+
+def test_async_run_samples_the_process(tmp_path, fake_java, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    summary = asyncio.run(sample.run_async())
+
+    assert summary.attrs["metrics"]["phases"]["compute"] > 0
+
+
+def test_wait_with_rusage_races_with_poll():
+    process = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(3)"])
+    metrics = RunMetrics("sample")
+    stop = threading.Event()
+
+    def poll():
+        while not stop.is_set():
+            process.poll()
+            process.send_signal(0)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    try:
+        wait_with_rusage(process, metrics)
+    finally:
+        stop.set()
+        poller.join()
+
+    assert process.returncode == 3
+    assert process.poll() == 3
+    assert metrics.cpu_user_s is not None
+    assert metrics.peak_rss_mb > 0
+
+
+def test_wait_with_rusage_after_poll_reaped():
+    process = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(4)"])
+    process.wait()
+    metrics = RunMetrics("sample")
+
+    wait_with_rusage(process, metrics)
+
+    assert process.returncode == 4
+    assert metrics.peak_rss_mb is None
+
+
+class LocklessProcess:
+    """
+    A Popen without the private wait lock of CPython's implementation
+    """
+
+    def __init__(self, process):
+        self._process = process
+        self.pid = process.pid
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+    def wait(self):
+        return self._process.wait()
+
+
+def test_wait_without_the_popen_wait_lock():
+    process = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(5)"])
+    metrics = RunMetrics("sample")
+
+    wait_with_rusage(LocklessProcess(process), metrics)
+
+    assert process.returncode == 5
+    assert metrics.peak_rss_mb is None
+
+
+@pytest.mark.parametrize("returncode, killed", [(None, True), (0, False), (1, False)])
+def test_supervisor_only_kills_running_processes(returncode, killed):
+    supervisor = Supervisor([OutputPattern("boom", FATAL, reason="boom")])
+    process = FakeProcess(returncode)
+    supervision = supervisor.supervise("sample", process)
+
+    supervision.feed("boom\n", STDERR)
+
+    assert process.killed is killed
+    assert supervision.failure.reason == "boom"
+
+
+def test_prometheus_exporter(tmp_path):
+    exporter = PrometheusExporter(buckets=(1, 10))
+    for total_s, status in ((0.5, "ok"), (5, "ok"), (50, "error")):
+        metrics = RunMetrics("sample", status=status, peak_rss_mb=100.0)
+        metrics.phases = {"compute": total_s}
+        metrics.total_s = total_s
+        metrics.cpu_user_s, metrics.cpu_system_s = 1.0, 0.5
+        exporter(metrics)
+
+    text = exporter.render()
+
+    assert 'raddose3d_runs_total{mode="process",status="ok"} 2' in text
+    assert 'raddose3d_runs_total{mode="process",status="error"} 1' in text
+    assert 'raddose3d_run_seconds_bucket{le="1"} 1' in text
+    assert 'raddose3d_run_seconds_bucket{le="10"} 2' in text
+    assert 'raddose3d_run_seconds_bucket{le="+Inf"} 3' in text
+    assert 'raddose3d_phase_seconds_sum{phase="compute"} 55.5' in text
+    assert 'raddose3d_child_cpu_seconds_total{cpu_mode="user"} 3.0' in text
+    assert f"raddose3d_child_peak_rss_bytes {100 * 2**20}" in text
+
+    exporter.write(str(tmp_path / "raddose3d.prom"))
+    assert (tmp_path / "raddose3d.prom").read_text() == text
@@ -0,0 +1,116 @@
+import asyncio
+import math
+from os import listdir
+
+import pandas as pd
+import pytest
+
+from py_raddose_3d.cost import CostModel
+from py_raddose_3d.metrics import (
+    PrometheusExporter,
+    add_metrics_hook,
+    remove_metrics_hook,
+)
+from py_raddose_3d.montecarlo import merge_summaries, split_monte_carlo
+from py_raddose_3d.raddose3d import RadDose3D
+
+
+class RecordingCostModel(CostModel):
+    def __init__(self) -> None:
+        super().__init__()
+        self.recorded = []
+
+    def record(self, rad_dose_input, runtime_s, memory_mb=None) -> None:
+        self.recorded.append((rad_dose_input, runtime_s, memory_mb))
+        super().record(rad_dose_input, runtime_s, memory_mb)
+
+
+@pytest.fixture
+def monte_carlo(crystal):
+    return crystal.model_copy(update={"Subprogram": "MONTECARLO", "Runs": 4})
+
+
+def test_split_distributes_runs(monte_carlo):
+    assert [c.Runs for c in split_monte_carlo(monte_carlo, 3)] == [2, 1, 1]
+
+
+def test_split_divides_photons_when_runs_are_few(monte_carlo):
+    crystal = monte_carlo.model_copy(update={"Runs": 1, "SimPhotons": 10})
+
+    shards = split_monte_carlo(crystal, 4)
+
+    assert [c.SimPhotons for c in shards] == [3, 3, 2, 2]
+    assert split_monte_carlo(crystal.model_copy(update={"SimPhotons": None}), 4) == [
+        crystal.model_copy(update={"SimPhotons": None})
+    ]
+
+
+def test_merge_summaries_weights_shards():
+    summaries = [
+        pd.DataFrame({"Wedge Number": [1], "Average DWD": [1.0]}),
+        pd.DataFrame({"Wedge Number": [1], "Average DWD": [4.0]}),
+    ]
+
+    merged, standard_error = merge_summaries(summaries, [2, 1])
+
+    assert merged["Average DWD"].tolist() == [2.0]
+    assert merged["Wedge Number"].tolist() == [1]
+    assert standard_error["Average DWD"][0] == pytest.approx(math.sqrt(2))
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+def test_sharded_run_records_one_cost_sample(
+    tmp_path, fake_java, monte_carlo, beam, wedge, run_async
+):
+    cost_model = RecordingCostModel()
+    sample = RadDose3D(
+        "sample",
+        monte_carlo,
+        beam,
+        wedge,
+        str(tmp_path),
+        lazy=True,
+        monte_carlo_shards=2,
+        cost_model=cost_model,
+    )
+
+    summary = asyncio.run(sample.run_async()) if run_async else sample.run()
+
+    assert summary["Average DWD"].tolist() == [100.0]
+    assert summary.attrs["standard_error"]["Average DWD"] == [0.0]
+    assert summary.attrs["metrics"]["mode"] == "shards"
+    assert len(cost_model.recorded) == 1
+    rad_dose_input, runtime_s, memory_mb = cost_model.recorded[0]
+    assert rad_dose_input.crystal.Runs == 4
+    assert 0 < runtime_s <= summary.attrs["metrics"]["total_s"]
+    assert memory_mb == summary.attrs["metrics"]["peak_rss_mb"]
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+def test_sharded_run_reports_once_and_cleans_up(
+    tmp_path, fake_java, monte_carlo, beam, wedge, run_async
+):
+    received = []
+    exporter = PrometheusExporter()
+    sample = RadDose3D(
+        "sample",
+        monte_carlo,
+        beam,
+        wedge,
+        str(tmp_path),
+        monte_carlo_shards=2,
+        metrics_hook=exporter,
+    )
+
+    add_metrics_hook(received.append)
+    try:
+        asyncio.run(sample.run_async()) if run_async else sample.run()
+    finally:
+        remove_metrics_hook(received.append)
+
+    assert [metrics.sample_id for metrics in received] == ["sample"]
+    assert received[0].mode == "shards"
+    assert 'raddose3d_runs_total{mode="shards",status="ok"} 1' in exporter.render()
+    assert received[0].cpu_user_s is not None
+    assert exporter._cpu["user"] == received[0].cpu_user_s
+    assert not any("shard" in name for name in listdir(sample.sample_directory))
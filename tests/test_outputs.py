@@ -0,0 +1,157 @@
+import gzip
+from os import listdir, path
+
+import numpy as np
+import pytest
+
+from py_raddose_3d.outputs import (
+    OutputPolicy,
+    apply_output_policy,
+    output_snapshot,
+    remove_scratch,
+)
+from py_raddose_3d.raddose3d import RadDose3D
+
+DOSE_STATE = "0,0,0,1.5,1,1\n1,0,0,3.0,1,1\n0,1,0,0,0,0\n"
+
+
+@pytest.fixture
+def outputs(tmp_path) -> str:
+    run_directory = tmp_path / "run"
+    run_directory.mkdir()
+    prefix = str(run_directory / "sample-")
+    for name, contents in (
+        ("Summary.csv", "Wedge Number,Average DWD\n1,1.5\n"),
+        ("Summary.txt", "summary\n"),
+        ("RDE.csv", "rde\n"),
+        ("DoseState.csv", DOSE_STATE),
+    ):
+        with open(prefix + name, "w") as fp:
+            fp.write(contents)
+    return prefix
+
+
+def test_invalid_dose_state_format():
+    with pytest.raises(ValueError, match="dose_state_format"):
+        OutputPolicy(dose_state_format="parquet")
+
+
+def test_patterns():
+    policy = OutputPolicy(keep=("*.txt",), compress=("*.csv",))
+
+    assert policy.keeps("Summary.csv")
+    assert policy.keeps("Summary.txt")
+    assert not policy.keeps("RDE.csv")
+    assert not policy.compresses("Summary.csv")
+    assert policy.compresses("RDE.csv")
+    assert OutputPolicy().keeps("RDE.csv")
+
+
+def test_outputs_are_kept_in_place_by_default(outputs):
+    kept = apply_output_policy(OutputPolicy(), outputs, outputs)
+
+    assert kept == ["DoseState.csv", "RDE.csv", "Summary.csv", "Summary.txt"]
+
+
+def test_outputs_are_pruned_and_compressed(tmp_path, outputs):
+    destination = str(tmp_path / "sample-")
+    policy = OutputPolicy(keep=("Summary.*", "RDE.csv"), compress=("RDE.csv",))
+
+    kept = apply_output_policy(policy, outputs, destination)
+
+    assert kept == ["RDE.csv.gz", "Summary.csv", "Summary.txt"]
+    assert listdir(path.dirname(outputs)) == []
+    with gzip.open(destination + "RDE.csv.gz", "rt") as fp:
+        assert fp.read() == "rde\n"
+
+
+def test_dose_state_is_converted(outputs):
+    policy = OutputPolicy(keep=("DoseState.csv",), dose_state_format="npz")
+
+    kept = apply_output_policy(policy, outputs, outputs)
+
+    assert kept == ["DoseState.npz", "Summary.csv"]
+    assert not path.exists(outputs + "DoseState.csv")
+
+
+def test_unchanged_outputs_of_earlier_runs_are_left_alone(outputs):
+    policy = OutputPolicy(compress=("RDE.csv*",))
+    apply_output_policy(policy, outputs, outputs)
+    previous = output_snapshot(outputs)
+    with open(outputs + "RDE.csv", "w") as fp:
+        fp.write("rde again\n")
+
+    kept = apply_output_policy(policy, outputs, outputs, previous)
+
+    assert kept == ["RDE.csv.gz"]
+    assert sorted(listdir(path.dirname(outputs))) == [
+        "sample-DoseState.csv",
+        "sample-RDE.csv.gz",
+        "sample-Summary.csv",
+        "sample-Summary.txt",
+    ]
+    with gzip.open(outputs + "RDE.csv.gz", "rt") as fp:
+        assert fp.read() == "rde again\n"
+
+
+def test_scratch_prefix(tmp_path):
+    assert OutputPolicy().scratch_prefix("sample") is None
+
+    prefix = OutputPolicy(scratch_directory=str(tmp_path)).scratch_prefix("sample")
+
+    assert path.isdir(path.dirname(prefix))
+    assert path.basename(prefix) == "sample-"
+    remove_scratch(prefix)
+    assert not path.exists(path.dirname(prefix))
+
+
+def test_runs_apply_the_policy(tmp_path, fake_java, crystal, beam, wedge):
+    scratch = tmp_path / "scratch"
+    policy = OutputPolicy(
+        keep=("DoseState.csv",),
+        dose_state_format="npz",
+        scratch_directory=str(scratch),
+    )
+    sample = RadDose3D(
+        "sample", crystal, beam, wedge, str(tmp_path), output_policy=policy
+    )
+
+    summary = sample.run()
+
+    assert summary["Average DWD"].tolist() == [100.0]
+    assert path.isfile(sample.prefix + "Summary.csv")
+    assert path.isfile(sample.prefix + "DoseState.npz")
+    assert not path.exists(sample.prefix + "DoseState.csv")
+    assert np.nanmax(sample.load_dose_state().dose) == 200.0
+    assert listdir(scratch) == []
+
+
+@pytest.mark.parametrize(
+    "policy, outputs",
+    [
+        (
+            OutputPolicy(keep=("DoseState.csv",), dose_state_format="npz"),
+            ["DoseState.npz", "Summary.csv"],
+        ),
+        (
+            OutputPolicy(compress=("DoseState.csv*",)),
+            ["DoseState.csv.gz", "Summary.csv"],
+        ),
+    ],
+)
+def test_repeated_runs_in_place(
+    tmp_path, fake_java, crystal, beam, wedge, policy, outputs
+):
+    sample = RadDose3D(
+        "sample", crystal, beam, wedge, str(tmp_path), output_policy=policy
+    )
+
+    sample.run()
+    sample.run()
+
+    names = [
+        name[len("sample-") :]
+        for name in sorted(listdir(sample.sample_directory))
+        if name.startswith("sample-")
+    ]
+    assert names == outputs
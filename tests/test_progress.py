@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from py_raddose_3d.progress import ProgressStream, StdoutParser
+from py_raddose_3d.raddose3d import RadDose3D
+
+
+def test_parser_tracks_wedge_and_angle():
+    events = []
+    parser = StdoutParser("sample", events.append, max_lines=2)
+
+    for line in (b"Wedge 2:\n", "Exposing angle 12.50 deg\r\n", "Done"):
+        parser.feed(line)
+
+    assert [(e.line_number, e.wedge, e.angle) for e in events] == [
+        (1, 2, None),
+        (2, 2, 12.5),
+        (3, 2, 12.5),
+    ]
+    assert events[1].line == "Exposing angle 12.50 deg"
+    assert parser.log == "Exposing angle 12.50 deg\nDone"
+
+
+def test_parser_raises_warnings_as_they_appear():
+    parser = StdoutParser("sample")
+
+    with pytest.warns(RuntimeWarning) as record:
+        parser.feed("Warning: angular resolution too big")
+        parser.feed("* WARNING *")
+        banner = parser.feed("The beam misses the crystal")
+        parser.feed_all(b"ok\n* WARNING *\n")
+
+    assert banner.warning == "The beam misses the crystal"
+    assert parser.warnings == [
+        "Warning: angular resolution too big",
+        "The beam misses the crystal",
+        "* WARNING *",
+    ]
+    assert len(record) == 3
+
+
+def test_run_reports_progress(tmp_path, fake_java, crystal, beam, wedge):
+    events = []
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    sample.run(progress_callback=events.append)
+
+    assert [e.line_number for e in events] == list(range(1, len(events) + 1))
+    assert [e.angle for e in events if e.angle is not None][-1] == 90.0
+    assert events[-1].wedge == 1
+    assert {e.sample_id for e in events} == {"sample"}
+
+
+def test_failing_callback_stops_the_run(tmp_path, fake_java, crystal, beam, wedge):
+    def callback(event):
+        raise KeyboardInterrupt
+
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    with pytest.raises(KeyboardInterrupt):
+        sample.run(progress_callback=callback)
+    assert sample.metrics.status == "error"
+
+
+def test_progress_stream(tmp_path, fake_java, crystal, beam, wedge, monkeypatch):
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "0.2")
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    async def main():
+        stream = ProgressStream()
+        task = asyncio.create_task(sample.run_async(progress_callback=stream))
+        events = [event async for event in stream.until(task)]
+        return events, task.result()
+
+    events, summary = asyncio.run(main())
+
+    assert events[0].line.startswith("RADDOSE-3D")
+    assert events[-1].angle == 90.0
+    assert summary["Average DWD"].tolist() == [100.0]
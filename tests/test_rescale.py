@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.rescale import DoseRescaler, rescale_dose_state, rescale_factor
+from py_raddose_3d.schemas.input import RadDoseInput, Wedge
+
+
+@pytest.fixture
+def reference(crystal, beam) -> RadDoseInput:
+    return RadDoseInput(
+        crystal=crystal,
+        beam=beam,
+        wedge=[
+            Wedge(Wedge=(0.0, 90.0), ExposureTime=50.0),
+            Wedge(Wedge=(90.0, 180.0), ExposureTime=10.0),
+        ],
+    )
+
+
+def changed(rad_dose_input, flux=None, exposure_times=None, **crystal) -> RadDoseInput:
+    beam = rad_dose_input.beam
+    if flux is not None:
+        beam = beam.model_copy(update={"Flux": flux})
+    wedges = rad_dose_input.wedge
+    if exposure_times is not None:
+        wedges = [
+            wedge.model_copy(update={"ExposureTime": exposure_time})
+            for wedge, exposure_time in zip(wedges, exposure_times)
+        ]
+    return RadDoseInput(
+        crystal=rad_dose_input.crystal.model_copy(update=crystal),
+        beam=beam,
+        wedge=wedges,
+    )
+
+
+def test_rescale_factor(reference):
+    assert rescale_factor(reference, changed(reference, flux=4e12)) == 2.0
+    assert rescale_factor(
+        reference, changed(reference, flux=1e12, exposure_times=(150.0, 30.0))
+    ) == pytest.approx(1.5)
+
+
+@pytest.mark.parametrize(
+    "target",
+    [
+        {"exposure_times": (100.0, 10.0)},
+        {"Dimensions": "50 50 50"},
+        {"Subprogram": "MONTECARLO"},
+    ],
+)
+def test_rescale_factor_rejects_non_linear_changes(reference, target):
+    assert rescale_factor(reference, changed(reference, **target)) is None
+
+
+def test_monte_carlo_runs_are_not_rescaled(reference):
+    monte_carlo = changed(reference, Subprogram="MONTECARLO")
+
+    assert rescale_factor(monte_carlo, changed(monte_carlo, flux=4e12)) is None
+
+
+def test_rescale_dose_state(tmp_path):
+    csv_path = tmp_path / "DoseState.csv"
+    csv_path.write_text("0,0,0,1.5,1,1\n1,0,0,2.0,1,1\n")
+    output_path = tmp_path / "Rescaled.csv"
+
+    rescale_dose_state(str(csv_path), str(output_path), 3.0, chunksize=1)
+
+    rescaled = pd.read_csv(output_path, header=None)
+    assert rescaled[3].tolist() == [4.5, 6.0]
+    assert rescaled[[0, 1, 2, 4, 5]].values.tolist() == [
+        [0, 0, 0, 1, 1],
+        [1, 0, 0, 1, 1],
+    ]
+
+
+def test_rescaler_only_derives_matching_samples(
+    tmp_path, fake_java, crystal, beam, wedge, monkeypatch
+):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    rescaler = DoseRescaler()
+
+    def run(sample_id, crystal, flux):
+        brighter = beam.model_copy(update={"Flux": flux})
+        sample = RadDose3D(sample_id, crystal, brighter, wedge, str(tmp_path))
+        return sample, rescaler.run(sample)
+
+    run("reference", crystal, 2e12)
+    sample, summary = run("brighter", crystal, 6e12)
+    smaller = crystal.model_copy(update={"Dimensions": "50 50 50"})
+    _, other = run("smaller", smaller, 6e12)
+
+    assert summary["Average DWD"].tolist() == [300.0]
+    assert pd.read_csv(sample.prefix + "DoseState.csv", header=None)[3].tolist() == [
+        300.0,
+        600.0,
+        0.0,
+    ]
+    assert other["Average DWD"].tolist() == [300.0]
+    assert len(log.read_text().splitlines()) == 2
@@ -0,0 +1,99 @@
+import json
+import multiprocessing
+import threading
+
+import pytest
+
+from py_raddose_3d.resolution import AdaptiveResolution, ResolutionCache, geometry
+
+
+def put_entries(cache_path, worker, count):
+    cache = ResolutionCache(cache_path)
+    for i in range(count):
+        cache.put(f"{worker}-{i}", i / 10)
+
+
+def test_geometry_rounds_dimensions(crystal, beam):
+    similar = crystal.model_copy(update={"Dimensions": "101 104 100.4"})
+
+    assert geometry(crystal, beam) == geometry(similar, beam)
+    assert geometry(crystal, beam)["crystal"] == ["cuboid", [100, 100, 100]]
+
+
+def test_cache_round_trips(tmp_path):
+    cache = ResolutionCache(str(tmp_path / "nested" / "resolution.json"))
+
+    assert cache.get("key") is None
+    cache.put("key", 0.25)
+
+    assert ResolutionCache(cache.cache_path).get("key") == 0.25
+
+
+def test_concurrent_threads_keep_all_entries(tmp_path):
+    cache_path = str(tmp_path / "resolution.json")
+    threads = [
+        threading.Thread(target=put_entries, args=(cache_path, worker, 10))
+        for worker in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(cache_path) as fp:
+        assert len(json.load(fp)) == 40
+
+
+def test_concurrent_processes_keep_all_entries(tmp_path):
+    cache_path = str(tmp_path / "resolution.json")
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=put_entries, args=(cache_path, worker, 10))
+        for worker in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0] * 4
+    with open(cache_path) as fp:
+        assert len(json.load(fp)) == 40
+
+
+def test_select_uses_the_cache(tmp_path, fake_java, crystal, beam, wedge):
+    cache = ResolutionCache(str(tmp_path / "resolution.json"))
+
+    def select(sample_id):
+        return AdaptiveResolution(
+            crystal,
+            beam,
+            wedge,
+            growth=2,
+            cache=cache,
+            sample_id=sample_id,
+            output_directory=str(tmp_path),
+        ).select()
+
+    first = select("first")
+
+    assert first.converged
+    assert first.pixels_per_micron == pytest.approx(0.08)
+    assert [level.pixels_per_micron for level in first.levels] == pytest.approx(
+        [0.08, 0.16]
+    )
+    assert first.summary["Average DWD"].tolist() == [100.0]
+
+    cached = crystal.model_copy(update={"PixelsPerMicron": 0.5})
+    assert AdaptiveResolution(cached, beam, wedge, cache=cache).cache_key() == (
+        AdaptiveResolution(crystal, beam, wedge).cache_key()
+    )
+    cache.put(AdaptiveResolution(crystal, beam, wedge, growth=2).cache_key(), 0.3)
+    assert select("second").levels[0].pixels_per_micron == 0.3
+
+
+def test_rejects_invalid_ladders(crystal, beam, wedge):
+    with pytest.raises(ValueError, match="growth"):
+        AdaptiveResolution(crystal, beam, wedge, growth=1)
+    with pytest.raises(ValueError, match="max_levels"):
+        AdaptiveResolution(crystal, beam, wedge, max_levels=1)
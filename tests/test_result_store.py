@@ -0,0 +1,165 @@
+import threading
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.result_store import ResultStore, input_hash, summary_records
+from py_raddose_3d.schemas.input import RadDoseInput
+
+RECORDED_AT = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def store(tmp_path) -> ResultStore:
+    return ResultStore(str(tmp_path / "store"), format="csv")
+
+
+@pytest.fixture
+def rad_dose_input(crystal, beam, wedge) -> RadDoseInput:
+    return RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge])
+
+
+def records(rad_dose_input, sample_id, dose=1.0) -> pd.DataFrame:
+    summary = pd.DataFrame({"Wedge Number": [1], "Average DWD": [dose]})
+    return summary_records(sample_id, rad_dose_input, summary, RECORDED_AT)
+
+
+def test_summary_records_flatten_the_input(rad_dose_input):
+    summary = pd.DataFrame({"Wedge Number": [1], "Average DWD": [2.5]})
+    summary.attrs["metrics"] = {"mode": "pool", "phases": {"compute": 1.5}}
+
+    frame = summary_records("sample", rad_dose_input, summary, RECORDED_AT)
+
+    row = frame.iloc[0]
+    assert row["sample_id"] == "sample"
+    assert row["input_hash"] == input_hash(rad_dose_input)
+    assert row["recorded_at"] == RECORDED_AT.isoformat()
+    assert row["Beam.Flux"] == 2e12
+    assert row["Wedge.ExposureTime"] == 50.0
+    assert row["metrics.mode"] == "pool"
+    assert row["metrics.phases.compute"] == 1.5
+    assert row["Average DWD"] == 2.5
+
+
+def test_runs_are_appended(tmp_path, fake_java, store, crystal, beam, wedge):
+    sample = RadDose3D(
+        "sample", crystal, beam, wedge, str(tmp_path), result_store=store
+    )
+
+    sample.run()
+
+    result = store.query(sample_id="sample")
+    assert len(store) == 1
+    assert result["Average DWD"].tolist() == [100.0]
+    assert result["metrics.mode"].tolist() == ["process"]
+
+
+def test_query_filters_and_columns(store, rad_dose_input):
+    for i in range(3):
+        store.append_records(records(rad_dose_input, f"sample{i}", dose=i))
+
+    result = store.query(
+        filters=[("Average DWD", ">=", 1), ("Unknown", "==", 1)],
+        columns=["sample_id"],
+    )
+    assert result.empty
+    result = store.query(filters=[("Average DWD", ">=", 1)], columns=["sample_id"])
+    assert sorted(result["sample_id"]) == ["sample1", "sample2"]
+    assert result.columns.tolist() == ["sample_id"]
+    assert len(store.query(input_hash=input_hash(rad_dose_input))) == 3
+    with pytest.raises(ValueError, match="operator"):
+        store.query(filters=[("Average DWD", "~", 1)])
+    with pytest.raises(ValueError, match="sample_id"):
+        store.append_records(pd.DataFrame({"Average DWD": [1.0]}))
+
+
+def test_compact_merges_small_parts(store, rad_dose_input):
+    for i in range(5):
+        store.append_records(records(rad_dose_input, f"sample{i}", dose=i))
+    before = store.query().sort_values("sample_id", ignore_index=True)
+
+    assert store.compact(target_rows=3) == 5
+
+    pd.testing.assert_frame_equal(
+        store.query().sort_values("sample_id", ignore_index=True), before
+    )
+    assert store.query(sample_id="sample4")["Average DWD"].tolist() == [4]
+    assert len(store) == 5
+    assert store.compact(target_rows=3) == 0
+
+
+def test_appends_and_compactions_run_concurrently(store, rad_dose_input):
+    errors = []
+
+    def append(worker):
+        try:
+            for i in range(10):
+                store.append_records(records(rad_dose_input, f"{worker}-{i}"))
+        except Exception as e:
+            errors.append(e)
+
+    def compact():
+        try:
+            for _ in range(10):
+                store.compact(target_rows=1000)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=append, args=(w,)) for w in range(3)]
+    threads += [threading.Thread(target=compact) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    result = store.query()
+    assert len(result) == len(store) == 30
+    assert result["sample_id"].is_unique
+
+
+def test_compaction_holds_the_store_lock(store, rad_dose_input, monkeypatch):
+    for i in range(4):
+        store.append_records(records(rad_dose_input, f"sample{i}"))
+    reading = threading.Event()
+    resume = threading.Event()
+    read_part = store._read_part
+    errors = []
+
+    def blocking_read_part(file, columns):
+        reading.set()
+        resume.wait(5)
+        return read_part(file, columns)
+
+    def run(target):
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    monkeypatch.setattr(store, "_read_part", blocking_read_part)
+    first = threading.Thread(target=run, args=(store.compact,))
+    first.start()
+    assert reading.wait(5)
+    other = ResultStore(store.root, format="csv")
+    threads = [
+        threading.Thread(target=run, args=(other.compact,)),
+        threading.Thread(
+            target=run,
+            args=(lambda: other.append_records(records(rad_dose_input, "late")),),
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+    threads[0].join(0.5)
+    assert all(thread.is_alive() for thread in threads)
+    resume.set()
+    for thread in [first, *threads]:
+        thread.join()
+
+    assert errors == []
+    result = other.query()
+    assert sorted(result["sample_id"]) == ["late", *(f"sample{i}" for i in range(4))]
+    assert len(other) == 5
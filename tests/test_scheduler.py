@@ -0,0 +1,210 @@
+import asyncio
+import time
+
+import pytest
+
+from py_raddose_3d.cost import CostModel
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.scheduler import AsyncScheduler
+from py_raddose_3d.schemas.input import RadDoseInput
+
+
+class StubSample:
+    """
+    Stands in for RadDose3D: run_async records its start and blocks until the
+    test releases it
+    """
+
+    def __init__(self, sample_id, started, rad_dose_input=None):
+        self.sample_id = sample_id
+        self.started = started
+        self.rad_dose_input = rad_dose_input
+        self.release = asyncio.Event()
+        self.timeout = None
+
+    def _create_pydantic_model(self):
+        return self.rad_dose_input
+
+    async def run_async(self, timeout=None):
+        self.started.append(self.sample_id)
+        self.timeout = timeout
+        await self.release.wait()
+        return self.sample_id
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_invalid_concurrency():
+    with pytest.raises(ValueError, match="max_concurrency"):
+        AsyncScheduler(max_concurrency=0)
+
+
+def test_jobs_start_by_priority():
+    async def main():
+        scheduler = AsyncScheduler(max_concurrency=1)
+        started = []
+        samples = {name: StubSample(name, started) for name in ("first", "b", "c", "d")}
+        tasks = [
+            asyncio.create_task(scheduler.run(samples["first"])),
+            asyncio.create_task(scheduler.run(samples["b"], priority=2)),
+            asyncio.create_task(scheduler.run(samples["c"], priority=1)),
+            asyncio.create_task(scheduler.run(samples["d"], priority=1)),
+        ]
+        await settle()
+        assert (scheduler.in_flight, scheduler.queue_depth) == (1, 3)
+        for sample in samples.values():
+            sample.release.set()
+        results = await asyncio.gather(*tasks)
+        assert (scheduler.in_flight, scheduler.queue_depth) == (0, 0)
+        return started, results
+
+    started, results = asyncio.run(main())
+
+    assert started == ["first", "c", "d", "b"]
+    assert results == ["first", "b", "c", "d"]
+
+
+def test_cost_model_orders_and_times_jobs(crystal, beam, wedge):
+    def rad_dose_input(pixels_per_micron):
+        return RadDoseInput(
+            crystal=crystal.model_copy(update={"PixelsPerMicron": pixels_per_micron}),
+            beam=beam,
+            wedge=[wedge],
+        )
+
+    cost_model = CostModel()
+
+    async def main():
+        scheduler = AsyncScheduler(max_concurrency=1, cost_model=cost_model)
+        started = []
+        samples = [
+            StubSample("first", started, rad_dose_input(0.1)),
+            StubSample("fine", started, rad_dose_input(0.5)),
+            StubSample("coarse", started, rad_dose_input(0.2)),
+        ]
+        tasks = [asyncio.create_task(scheduler.run(sample)) for sample in samples]
+        await settle()
+        assert scheduler.memory_in_use_mb == pytest.approx(
+            cost_model.estimate(samples[0].rad_dose_input).memory_mb
+        )
+        for sample in samples:
+            sample.release.set()
+        await asyncio.gather(*tasks)
+        return started, samples
+
+    started, samples = asyncio.run(main())
+
+    assert started == ["first", "coarse", "fine"]
+    for sample in samples:
+        assert sample.timeout == cost_model.estimate(sample.rad_dose_input).timeout()
+
+
+def test_memory_limit_blocks_the_queue():
+    async def main():
+        scheduler = AsyncScheduler(max_concurrency=4, memory_limit_mb=1000)
+        started = []
+        samples = [StubSample(name, started) for name in ("a", "b", "c")]
+        tasks = [
+            asyncio.create_task(scheduler.run(samples[0], memory_mb=600)),
+            asyncio.create_task(scheduler.run(samples[1], memory_mb=600)),
+            asyncio.create_task(scheduler.run(samples[2], memory_mb=300)),
+        ]
+        await settle()
+        # c would fit, but does not overtake b
+        assert started == ["a"]
+        assert scheduler.memory_in_use_mb == 600
+        assert scheduler.queue_depth == 2
+        samples[0].release.set()
+        await settle()
+        assert started == ["a", "b", "c"]
+        assert scheduler.memory_in_use_mb == 900
+        for sample in samples:
+            sample.release.set()
+        await asyncio.gather(*tasks)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+
+    assert scheduler.memory_in_use_mb == 0
+
+
+def test_oversized_jobs_start_alone():
+    async def main():
+        scheduler = AsyncScheduler(max_concurrency=2, memory_limit_mb=100)
+        sample = StubSample("large", [])
+        task = asyncio.create_task(scheduler.run(sample, memory_mb=500))
+        await settle()
+        assert scheduler.in_flight == 1
+        sample.release.set()
+        return await task
+
+    assert asyncio.run(main()) == "large"
+
+
+def test_cancelled_jobs_leave_the_queue():
+    async def main():
+        scheduler = AsyncScheduler(max_concurrency=1)
+        started = []
+        samples = [StubSample(name, started) for name in ("a", "b", "c")]
+        tasks = [asyncio.create_task(scheduler.run(sample)) for sample in samples]
+        await settle()
+        tasks[1].cancel()
+        await settle()
+        assert scheduler.queue_depth == 1
+        for sample in samples:
+            sample.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return started, results
+
+    started, results = asyncio.run(main())
+
+    assert started == ["a", "c"]
+    assert isinstance(results[1], asyncio.CancelledError)
+
+
+def test_run_all(tmp_path, fake_java, crystal, beam, wedge):
+    samples = [
+        RadDose3D(f"sample-{i}", crystal, beam, wedge, str(tmp_path)) for i in range(3)
+    ]
+
+    summaries = asyncio.run(AsyncScheduler(max_concurrency=2).run_all(samples))
+
+    assert [summary["Average DWD"].tolist() for summary in summaries] == [[100.0]] * 3
+
+
+def test_timeouts_kill_the_run(tmp_path, fake_java, crystal, beam, wedge, monkeypatch):
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "30")
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+    scheduler = AsyncScheduler(max_concurrency=1, timeout=0.5)
+    start = time.monotonic()
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(scheduler.run(sample))
+
+    assert time.monotonic() - start < 10
+    assert scheduler.in_flight == 0
+
+
+def test_cancelling_a_running_job(
+    tmp_path, fake_java, crystal, beam, wedge, monkeypatch
+):
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "30")
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+    scheduler = AsyncScheduler(max_concurrency=1)
+
+    async def main():
+        task = asyncio.create_task(scheduler.run(sample))
+        await asyncio.sleep(0.5)
+        assert scheduler.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.monotonic()
+    asyncio.run(main())
+
+    assert time.monotonic() - start < 10
+    assert scheduler.in_flight == 0
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.singleflight import DirectoryLock, SingleFlight
+
+
+def test_directory_lock_times_out(tmp_path):
+    with DirectoryLock(str(tmp_path)):
+        with pytest.raises(TimeoutError):
+            DirectoryLock(str(tmp_path), timeout=0.2).acquire()
+    with DirectoryLock(str(tmp_path), timeout=0.2):
+        pass
+
+
+def test_directory_lock_excludes_other_processes(tmp_path):
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from py_raddose_3d.singleflight import DirectoryLock\n"
+            f"with DirectoryLock({str(tmp_path)!r}):\n"
+            "    print('locked', flush=True)\n"
+            "    sys.stdin.readline()\n",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        with pytest.raises(TimeoutError):
+            DirectoryLock(str(tmp_path), timeout=0.3, poll_interval=0.05).acquire()
+    finally:
+        holder.communicate("\n")
+    with DirectoryLock(str(tmp_path), timeout=5):
+        pass
+
+
+def test_cancelled_async_acquire_leaves_lock_free(tmp_path):
+    async def main():
+        holder = DirectoryLock(str(tmp_path))
+        holder.acquire()
+        waiter = asyncio.ensure_future(
+            DirectoryLock(str(tmp_path), poll_interval=0.01).acquire_async()
+        )
+        await asyncio.sleep(0.1)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        holder.release()
+        lock = DirectoryLock(str(tmp_path))
+        await asyncio.wait_for(lock.acquire_async(), 2)
+        lock.release()
+
+    asyncio.run(main())
+    with DirectoryLock(str(tmp_path), timeout=0.5):
+        pass
+
+
+def test_cancelled_async_run_leaves_sample_unlocked(
+    tmp_path, fake_java, crystal, beam, wedge
+):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path), lazy=True)
+    flight = SingleFlight()
+
+    async def main():
+        with DirectoryLock(sample.sample_directory):
+            task = asyncio.ensure_future(flight.run_async(sample))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        return await asyncio.wait_for(flight.run_async(sample), 30)
+
+    summary = asyncio.run(main())
+
+    assert summary["Average DWD"].tolist() == [100.0]
+    assert flight.in_flight == 0
+
+
+def test_concurrent_runs_share_one_process(
+    tmp_path, fake_java, crystal, beam, wedge, monkeypatch
+):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "0.5")
+    samples = [
+        RadDose3D(f"sample{i}", crystal, beam, wedge, str(tmp_path), lazy=True)
+        for i in range(3)
+    ]
+    flight = SingleFlight()
+    summaries = [None] * len(samples)
+
+    def run(i):
+        summaries[i] = flight.run(samples[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(samples))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(log.read_text().splitlines()) == 1
+    assert [s["Average DWD"].tolist() for s in summaries] == [[100.0]] * 3
+    for sample in samples:
+        assert (
+            tmp_path / sample.sample_id / f"{sample.sample_id}-Summary.csv"
+        ).exists()
+
+
+def test_concurrent_async_runs_share_one_process(
+    tmp_path, fake_java, crystal, beam, wedge, monkeypatch
+):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "0.5")
+    samples = [
+        RadDose3D(f"sample{i}", crystal, beam, wedge, str(tmp_path), lazy=True)
+        for i in range(3)
+    ]
+    flight = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(*(flight.run_async(s) for s in samples))
+
+    summaries = asyncio.run(main())
+
+    assert len(log.read_text().splitlines()) == 1
+    assert [s["Average DWD"].tolist() for s in summaries] == [[100.0]] * 3
+
+
+def test_directory_locks_are_dropped_when_unused(tmp_path):
+    directories = [os.path.realpath(tmp_path / str(i)) for i in range(100)]
+    for directory in directories:
+        with DirectoryLock(directory):
+            pass
+
+    held = DirectoryLock(directories[0])
+    assert set(DirectoryLock._thread_locks) & set(directories) == {held.directory}
+    assert DirectoryLock(directories[0])._thread_lock is held._thread_lock
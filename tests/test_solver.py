@@ -0,0 +1,77 @@
+import math
+
+import pytest
+
+from py_raddose_3d.solver import DoseTargetSolver
+
+
+@pytest.fixture
+def solver_kwargs(tmp_path, fake_java) -> dict:
+    return {"output_directory": str(tmp_path), "max_workers": 2}
+
+
+def test_proportional_parameters_are_extrapolated(solver_kwargs, crystal, beam, wedge):
+    solver = DoseTargetSolver(
+        crystal, beam, wedge, "Beam.Flux", use_rescaling=False, **solver_kwargs
+    )
+
+    result = solver.solve(30.0)
+
+    assert result.converged
+    assert result.value == pytest.approx(6e11)
+    assert [it.rescaled for it in result.history] == [False, False]
+    assert result.java_runs == 2
+    assert result.compute_time > 0
+
+
+def test_rescaling_saves_java_runs(solver_kwargs, crystal, beam, wedge):
+    result = DoseTargetSolver(crystal, beam, wedge, **solver_kwargs).solve(
+        30.0, initial=10.0
+    )
+
+    assert result.value == pytest.approx(15.0)
+    assert [it.value for it in result.history] == pytest.approx([10.0, 15.0])
+    assert result.java_runs == 1
+
+
+def test_non_linear_metrics_are_bracketed(solver_kwargs, crystal, beam, wedge):
+    solver = DoseTargetSolver(
+        crystal,
+        beam,
+        wedge,
+        metric=lambda summary: math.sqrt(summary["Average DWD"].iloc[-1]),
+        rtol=0.001,
+        **solver_kwargs,
+    )
+
+    result = solver.solve(17.0)
+
+    assert result.converged
+    assert result.value == pytest.approx(17.0**2 / 2, rel=0.002)
+    assert len(result.history) <= solver.max_evaluations
+
+
+def test_unreachable_targets_do_not_converge(solver_kwargs, crystal, beam, wedge):
+    solver = DoseTargetSolver(
+        crystal,
+        beam,
+        wedge,
+        "Wedge.AngularResolution",
+        max_evaluations=5,
+        **solver_kwargs,
+    )
+
+    result = solver.solve(30.0)
+
+    assert not result.converged
+    assert result.metric == 100.0
+    assert len(result.history) == 5
+
+
+def test_invalid_problems(crystal, beam, wedge):
+    with pytest.raises(ValueError, match="Beam and Wedge"):
+        DoseTargetSolver(crystal, beam, wedge, "Crystal.PixelsPerMicron")
+    with pytest.raises(ValueError, match="growth"):
+        DoseTargetSolver(crystal, beam, wedge, growth=1)
+    with pytest.raises(ValueError, match="positive"):
+        DoseTargetSolver(crystal, beam, wedge).solve(30.0, initial=0)
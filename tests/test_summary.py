@@ -0,0 +1,135 @@
+import math
+
+import pandas as pd
+import pytest
+
+from py_raddose_3d.job_queue import DONE, JobQueue, QueueWorker
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.rescale import DoseRescaler, rescale_summary
+from py_raddose_3d.schemas.input import RadDoseInput, Wedge
+from py_raddose_3d.solver import DoseTargetSolver
+from py_raddose_3d.summary import Summary
+
+
+@pytest.fixture
+def summary_csv(tmp_path) -> str:
+    csv_path = tmp_path / "Summary.csv"
+    csv_path.write_text(
+        "Wedge Number,Average DWD,Max Dose,Dose Contrast,Label\n"
+        "1,1.5,4,,a\n"
+        "2,3.0,8.5,2.0,b\n"
+    )
+    return str(csv_path)
+
+
+def test_read_csv_parses_numbers(summary_csv):
+    summary = Summary.read_csv(summary_csv)
+
+    assert summary.columns == [
+        "Wedge Number",
+        "Average DWD",
+        "Max Dose",
+        "Dose Contrast",
+        "Label",
+    ]
+    assert len(summary) == 2
+    assert summary["Wedge Number"] == [1, 2]
+    assert summary["Average DWD"] == [1.5, 3.0]
+    assert math.isnan(summary["Dose Contrast"][0])
+    assert summary.to_dict(orient="records")[1]["Label"] == "b"
+
+
+def test_to_csv_round_trips(summary_csv, tmp_path):
+    summary = Summary.read_csv(summary_csv)
+    summary.to_csv(str(tmp_path / "copy.csv"))
+
+    pd.testing.assert_frame_equal(
+        pd.read_csv(tmp_path / "copy.csv"), pd.read_csv(summary_csv)
+    )
+    pd.testing.assert_frame_equal(summary.to_pandas(), pd.read_csv(summary_csv))
+
+
+def test_copy_is_independent(summary_csv):
+    summary = Summary.read_csv(summary_csv)
+    summary.attrs["metrics"] = {"mode": "process"}
+    copy = summary.copy()
+    copy["Average DWD"] = [0, 0]
+    copy.attrs["metrics"] = None
+
+    assert summary["Average DWD"] == [1.5, 3.0]
+    assert summary.attrs["metrics"] == {"mode": "process"}
+
+
+@pytest.mark.parametrize("as_frame", [True, False])
+def test_rescale_summary_keeps_type(summary_csv, as_frame):
+    summary = Summary.read_csv(summary_csv).to_pandas()
+    summary = summary.drop(columns="Label")
+    if not as_frame:
+        summary = Summary(summary.to_dict(orient="list"))
+
+    rescaled = rescale_summary(summary, 2)
+
+    assert type(rescaled) is type(summary)
+    assert list(rescaled["Average DWD"]) == [3.0, 6.0]
+    assert list(rescaled["Max Dose"]) == [8, 17.0]
+    assert list(rescaled["Wedge Number"]) == [1, 2]
+
+
+def test_rescale_summary_rejects_unknown_columns(summary_csv):
+    with pytest.raises(ValueError, match="Label"):
+        rescale_summary(Summary.read_csv(summary_csv), 2)
+
+
+def test_run_returns_summary(tmp_path, fake_java, crystal, beam, wedge):
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path), as_frame=False)
+
+    summary = sample.run()
+
+    assert isinstance(summary, Summary)
+    assert summary["Average DWD"] == [100.0]
+    assert summary.attrs["metrics"]["sample_id"] == "sample"
+
+
+@pytest.mark.parametrize("as_frame", [True, False])
+def test_rescaler_returns_the_sample_type(
+    tmp_path, fake_java, crystal, beam, wedge, as_frame
+):
+    rescaler = DoseRescaler()
+    reference = RadDose3D("reference", crystal, beam, wedge, str(tmp_path))
+    rescaler.run(reference)
+    longer = Wedge(Wedge=(0.0, 90.0), ExposureTime=150.0, AngularResolution=1)
+    sample = RadDose3D(
+        "sample", crystal, beam, longer, str(tmp_path), as_frame=as_frame
+    )
+
+    summary = rescaler.run(sample)
+
+    assert isinstance(summary, pd.DataFrame if as_frame else Summary)
+    assert list(summary["Average DWD"]) == [300.0]
+    assert pd.read_csv(sample.prefix + "Summary.csv")["Average DWD"][0] == 300.0
+
+
+def test_solver_accepts_summaries(tmp_path, fake_java, crystal, beam, wedge):
+    solver = DoseTargetSolver(
+        crystal, beam, wedge, output_directory=str(tmp_path), as_frame=False
+    )
+
+    result = solver.solve(30.0)
+
+    assert result.converged
+    assert result.value == pytest.approx(15.0)
+    assert result.java_runs == 1
+
+
+def test_queue_completes_summaries(tmp_path, fake_java, crystal, beam, wedge):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    job_id = queue.enqueue(
+        RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge]),
+        "sample",
+        str(tmp_path),
+    )
+
+    QueueWorker(queue, "worker", as_frame=False).run(stop_when_empty=True)
+
+    assert queue.status(job_id) == DONE
+    assert queue.result(job_id)["Average DWD"].tolist() == [100.0]
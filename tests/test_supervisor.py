@@ -0,0 +1,138 @@
+import os
+import signal
+import time
+
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.supervisor import (
+    FATAL,
+    NOISE,
+    STDERR,
+    STDOUT,
+    WARNING,
+    OutputPattern,
+    RadDose3DError,
+    ResourceLimits,
+    Supervisor,
+)
+
+
+@pytest.mark.parametrize(
+    "line, stream, severity, reason",
+    [
+        ("Picked up JAVA_TOOL_OPTIONS: -Xss4m", STDERR, NOISE, None),
+        ("[0.012s][info ][cds] Mapped archive", STDERR, NOISE, None),
+        ("Server VM warning: Sharing is disabled", STDERR, WARNING, "jvm_warning"),
+        ("Error: Unable to access jarfile raddose3d.jar", STDERR, FATAL, "launch"),
+        ("java.lang.OutOfMemoryError: Java heap space", STDOUT, FATAL, "out_of_memory"),
+        ("line 3:4 mismatched input 'Flux' expecting", STDOUT, FATAL, "input_syntax"),
+        ('Exception in thread "main"', STDERR, FATAL, "exception"),
+        ("Something unexpected", STDERR, WARNING, "stderr"),
+        ("Exposing angle 0.00 deg", STDOUT, NOISE, None),
+    ],
+)
+def test_default_patterns(line, stream, severity, reason):
+    assert Supervisor().classify(line, stream) == (severity, reason)
+
+
+def test_patterns_are_searched_in_order():
+    supervisor = Supervisor(
+        [OutputPattern("harmless", NOISE, stream=STDERR)], unmatched_stderr=WARNING
+    )
+
+    assert supervisor.classify("a HARMLESS exception", STDERR) == (NOISE, None)
+    assert supervisor.classify("an exception", STDERR) == (WARNING, "stderr")
+
+
+def test_invalid_severities():
+    with pytest.raises(ValueError, match="severity"):
+        OutputPattern("boom", "error")
+    with pytest.raises(ValueError, match="severity"):
+        Supervisor(unmatched_stderr="error")
+
+
+def test_failures_carry_the_output():
+    supervision = Supervisor(max_lines=2, unmatched_stderr=FATAL).supervise("sample")
+    supervision.feed(b"WARNING: deprecated option\n", STDERR)
+    supervision.feed("", STDERR)
+    supervision.feed("Exception in thread main", STDERR)
+    supervision.feed("Something unexpected", STDERR)
+
+    with pytest.raises(RadDose3DError) as exc_info:
+        supervision.check(1)
+
+    error = exc_info.value
+    assert error.reason == "exception"
+    assert error.line == "Exception in thread main"
+    assert error.returncode == 1
+    assert error.stderr == "Exception in thread main\nSomething unexpected"
+    assert error.warnings == ["WARNING: deprecated option"]
+    assert error.to_dict()["reason"] == "exception"
+
+
+def test_exit_codes():
+    supervisor = Supervisor(limits=ResourceLimits(cpu_s=1))
+    supervisor.supervise("sample").check(0)
+
+    with pytest.raises(RadDose3DError, match="exit_code"):
+        supervisor.supervise("sample").check(3)
+    with pytest.raises(RadDose3DError, match="cpu_limit"):
+        supervisor.supervise("sample").check(-signal.SIGXCPU)
+
+
+@pytest.mark.parametrize(
+    "limits, reason",
+    [
+        (ResourceLimits(wall_clock_s=0), "wall_clock_limit"),
+        (ResourceLimits(cpu_s=0), "cpu_limit"),
+        (ResourceLimits(memory_mb=0.001), "memory_limit"),
+    ],
+)
+def test_resource_limits(limits, reason):
+    supervision = Supervisor(limits=limits).supervise("sample")
+    time.sleep(0.01)
+
+    supervision.poll(os.getpid())
+
+    assert supervision.failure.reason == reason
+
+
+def test_runs_are_supervised(tmp_path, fake_java, crystal, beam, wedge, monkeypatch):
+    monkeypatch.setenv("FAKE_JAVA_STDERR", "WARNING: deprecated option")
+    sample = RadDose3D("sample", crystal, beam, wedge, str(tmp_path))
+
+    assert sample.run()["Average DWD"].tolist() == [100.0]
+
+    monkeypatch.setenv("FAKE_JAVA_STDERR", "OpenJDK notice: unknown to the table")
+    summary = sample.run()
+    assert summary["Average DWD"].tolist() == [100.0]
+
+    monkeypatch.setenv("FAKE_JAVA_EXIT", "1")
+    with pytest.raises(RadDose3DError) as exc_info:
+        sample.run()
+    assert exc_info.value.reason == "exit_code"
+    assert exc_info.value.warnings == ["OpenJDK notice: unknown to the table"]
+
+    monkeypatch.delenv("FAKE_JAVA_EXIT")
+    monkeypatch.setenv("FAKE_JAVA_STDERR", "Exception in thread main")
+    with pytest.raises(RadDose3DError) as exc_info:
+        sample.run()
+    assert exc_info.value.reason == "exception"
+
+
+def test_runs_are_killed_at_the_wall_clock_limit(
+    tmp_path, fake_java, crystal, beam, wedge, monkeypatch
+):
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "30")
+    supervisor = Supervisor(limits=ResourceLimits(wall_clock_s=0.5), poll_interval=0.05)
+    sample = RadDose3D(
+        "sample", crystal, beam, wedge, str(tmp_path), supervisor=supervisor
+    )
+    start = time.monotonic()
+
+    with pytest.raises(RadDose3DError) as exc_info:
+        sample.run()
+
+    assert exc_info.value.reason == "wall_clock_limit"
+    assert time.monotonic() - start < 10
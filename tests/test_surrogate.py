@@ -0,0 +1,140 @@
+import math
+
+import numpy as np
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.schemas.input import RadDoseInput, Wedge
+from py_raddose_3d.summary import Summary
+from py_raddose_3d.surrogate import (
+    FAILED,
+    FEATURES,
+    RUN,
+    SURROGATE,
+    SurrogateModel,
+    feature_matrix,
+    input_parameters,
+    surrogate_features,
+)
+
+FLUXES = (1e11, 3e11, 1e12, 3e12, 1e13)
+EXPOSURE_TIMES = (1.0, 3.0, 10.0, 30.0, 100.0)
+
+
+def make_input(crystal, beam, flux, exposure_time) -> RadDoseInput:
+    return RadDoseInput(
+        crystal=crystal,
+        beam=beam.model_copy(update={"Flux": flux}),
+        wedge=[Wedge(Wedge=(0.0, 90.0), ExposureTime=exposure_time)],
+    )
+
+
+def fake_summary(flux, exposure_time) -> Summary:
+    # The dose of tests/fake_java.py
+    dose = exposure_time * flux / 1e12
+    return Summary({"Average DWD": [dose], "Max Dose": [4 * dose]})
+
+
+@pytest.fixture
+def model(crystal, beam) -> SurrogateModel:
+    model = SurrogateModel(min_records=10)
+    for flux in FLUXES:
+        for exposure_time in EXPOSURE_TIMES:
+            model.record(
+                make_input(crystal, beam, flux, exposure_time),
+                fake_summary(flux, exposure_time),
+                refit=False,
+            )
+    model.fit()
+    return model
+
+
+def test_features(crystal, beam, wedge):
+    rad_dose_input = RadDoseInput(crystal=crystal, beam=beam, wedge=[wedge, wedge])
+    parameters = input_parameters(rad_dose_input)
+    features = dict(zip(FEATURES, surrogate_features(parameters[0])))
+
+    assert len(parameters) == 2
+    assert features["log_flux"] == pytest.approx(math.log10(2e12))
+    assert features["log_exposure_time"] == pytest.approx(math.log10(50))
+    assert features["log_rotation"] == pytest.approx(math.log10(91))
+    assert features["log_beam_x"] == pytest.approx(math.log10(20))
+    assert features["solvent_fraction"] == 0.64
+
+    matrix, index = feature_matrix([rad_dose_input, rad_dose_input])
+    assert matrix.shape == (4, len(FEATURES))
+    assert index.tolist() == [0, 0, 1, 1]
+
+
+def test_unfitted_model_has_no_domain():
+    prediction = SurrogateModel().predict(np.zeros((3, len(FEATURES))))
+
+    assert not prediction.in_domain.any()
+    assert np.isnan(prediction.values["Average DWD"]).all()
+
+
+def test_predicts_within_the_domain(model, crystal, beam):
+    features, _ = feature_matrix([make_input(crystal, beam, 2e12, 20.0)])
+
+    prediction = model.predict(features)
+
+    assert model.fitted
+    assert prediction.in_domain.tolist() == [True]
+    assert prediction.values["Average DWD"][0] == pytest.approx(40.0, rel=1e-3)
+    assert prediction.values["Max Dose"][0] == pytest.approx(160.0, rel=1e-3)
+    assert prediction.uncertainty["Average DWD"][0] < 1e-3
+
+
+def test_detects_queries_outside_the_domain(model, crystal, beam):
+    features, _ = feature_matrix(
+        [
+            make_input(crystal, beam, 1e15, 20.0),
+            make_input(
+                crystal.model_copy(update={"SolventFraction": 0.3}), beam, 2e12, 20.0
+            ),
+        ]
+    )
+
+    assert model.predict(features).in_domain.tolist() == [False, False]
+
+
+def test_history_is_persisted(tmp_path, crystal, beam):
+    history_path = str(tmp_path / "history.jsonl")
+    model = SurrogateModel(history_path, min_records=1)
+    model.record(make_input(crystal, beam, 1e12, 1.0), fake_summary(1e12, 1.0))
+
+    assert len(SurrogateModel(history_path)) == 1
+
+
+def test_screen_runs_samples_outside_the_domain(
+    tmp_path, fake_java, model, crystal, beam
+):
+    def sample(sample_id, flux, exposure_time, output_directory=str(tmp_path)):
+        rad_dose_input = make_input(crystal, beam, flux, exposure_time)
+        return RadDose3D(
+            sample_id,
+            rad_dose_input.crystal,
+            rad_dose_input.beam,
+            rad_dose_input.wedge,
+            output_directory,
+            lazy=True,
+        )
+
+    records = len(model)
+    samples = [
+        sample("inside", 2e12, 20.0),
+        sample("outside", 2e13, 200.0),
+        sample("broken", 3e13, 300.0, str(tmp_path / "missing")),
+    ]
+
+    estimates = model.screen(samples, max_workers=2)
+
+    assert [e.source for e in estimates] == [SURROGATE, RUN, FAILED]
+    assert estimates[0].values["Average DWD"][0] == pytest.approx(40.0, rel=1e-3)
+    assert estimates[1].values["Average DWD"] == [4000.0]
+    assert estimates[1].summary is not None
+    assert isinstance(estimates[2].error, FileNotFoundError)
+    assert estimates[2].summary is None
+    assert estimates[2].values == {"Average DWD": [], "Max Dose": []}
+    # The successful run was learned from despite the failure
+    assert len(model) == records + 1
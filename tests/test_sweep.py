@@ -0,0 +1,72 @@
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.schemas.input import Wedge
+from py_raddose_3d.sweep import (
+    apply_parameters,
+    default_concurrency,
+    expand_grid,
+    parse_parameter,
+)
+
+
+def test_parse_parameter():
+    assert parse_parameter("Beam.Flux") == ("Beam", None, "Flux")
+    assert parse_parameter("Wedge[1].ExposureTime") == ("Wedge", 1, "ExposureTime")
+    for name in ("Flux", "Beam[0].Flux", "Beam.Fluxx"):
+        with pytest.raises(ValueError):
+            parse_parameter(name)
+
+
+def test_expand_grid():
+    points = expand_grid({"Beam.Flux": [1, 2], "Wedge.ExposureTime": (10, 20, 30)})
+
+    assert len(points) == 6
+    assert points[1] == {"Beam.Flux": 1, "Wedge.ExposureTime": 20}
+    with pytest.raises(ValueError):
+        expand_grid({"Beam.Unknown": [1]})
+
+
+def test_apply_parameters_validates_values(crystal, beam, wedge):
+    wedges = [wedge, Wedge(Wedge=(90.0, 180.0), ExposureTime=10.0)]
+
+    new_crystal, new_beam, new_wedges = apply_parameters(
+        crystal,
+        beam,
+        wedges,
+        {
+            "Crystal.Dimensions": (50, 50, 50),
+            "Beam.Flux": 3e12,
+            "Wedge[1].ExposureTime": 20.0,
+        },
+    )
+
+    assert new_crystal.Dimensions == "50.0 50.0 50.0"
+    assert new_beam.Flux == 3e12
+    assert [w.ExposureTime for w in new_wedges] == [50.0, 20.0]
+    assert beam.Flux == 2e12
+    with pytest.raises(ValueError):
+        apply_parameters(crystal, beam, wedge, {"Wedge[1].ExposureTime": 1.0})
+    with pytest.raises(ValueError):
+        apply_parameters(crystal, beam, wedge, {"Crystal.Type": "Sphere-ish"})
+
+
+def test_default_concurrency():
+    assert default_concurrency() >= 1
+    assert default_concurrency(memory_per_job_mb=1e12) == 1
+
+
+def test_sweep_runs_every_point(tmp_path, fake_java, crystal, beam, wedge):
+    result = RadDose3D.sweep(
+        crystal,
+        beam,
+        wedge,
+        {"Beam.Flux": [1e12, 2e12], "Wedge.ExposureTime": [10.0, 20.0]},
+        output_directory=str(tmp_path),
+        max_workers=2,
+    )
+
+    assert result.index.names == ["Beam.Flux", "Wedge.ExposureTime", "row"]
+    assert result.loc[(2e12, 20.0, 0), "Average DWD"] == 40.0
+    assert result["Average DWD"].tolist() == [10.0, 20.0, 20.0, 40.0]
+    assert (tmp_path / "sweep_0003").is_dir()
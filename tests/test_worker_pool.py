@@ -0,0 +1,208 @@
+import asyncio
+import time
+from os import path
+
+import pytest
+
+from py_raddose_3d.raddose3d import RadDose3D
+from py_raddose_3d.supervisor import RadDose3DError
+from py_raddose_3d.worker_pool import JVMWorkerPool, WorkerUnavailableError
+
+
+@pytest.fixture
+def pool(fake_java):
+    with JVMWorkerPool(size=1, startup_timeout=30) as pool:
+        yield pool
+
+
+def make_sample(tmp_path, crystal, beam, wedge, sample_id="sample", **kwargs):
+    return RadDose3D(sample_id, crystal, beam, wedge, str(tmp_path), **kwargs)
+
+
+def wait_for(condition, timeout=5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_runs_reuse_a_worker(tmp_path, pool, crystal, beam, wedge):
+    summaries = [
+        make_sample(tmp_path, crystal, beam, wedge, f"sample{i}", pool=pool).run()
+        for i in range(3)
+    ]
+
+    assert [s["Average DWD"].tolist() for s in summaries] == [[100.0]] * 3
+    assert [s.attrs["metrics"]["mode"] for s in summaries] == ["pool"] * 3
+    assert pool._workers == 1
+    assert pool._idle.get_nowait().jobs_completed == 3
+
+
+def test_workers_are_recycled(tmp_path, fake_java, crystal, beam, wedge):
+    with JVMWorkerPool(size=1, max_jobs_per_worker=2) as pool:
+        for i in range(2):
+            make_sample(tmp_path, crystal, beam, wedge, f"s{i}", pool=pool).run()
+        assert pool._workers == 0
+        make_sample(tmp_path, crystal, beam, wedge, "s2", pool=pool).run()
+        assert pool._workers == 1
+
+
+def test_unavailable_pool_falls_back_to_a_process(
+    tmp_path, fake_java, crystal, beam, wedge
+):
+    pool = JVMWorkerPool(size=1, java=str(tmp_path / "no-java"), max_start_failures=1)
+    sample = make_sample(tmp_path, crystal, beam, wedge, pool=pool)
+
+    summary = sample.run()
+
+    assert summary["Average DWD"].tolist() == [100.0]
+    assert summary.attrs["metrics"]["mode"] == "process"
+    assert not pool.available
+    with pytest.raises(WorkerUnavailableError):
+        pool.execute(sample.input_text_file_path, sample.prefix)
+
+
+def test_async_timeout_kills_the_worker(
+    tmp_path, pool, crystal, beam, wedge, monkeypatch
+):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "3")
+    sample = make_sample(tmp_path, crystal, beam, wedge, pool=pool)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError, match="sample"):
+        asyncio.run(sample.run_async(timeout=0.5))
+
+    assert time.monotonic() - start < 2.5
+    assert wait_for(lambda: pool._workers == 0)
+    # No one-shot java process was started after the timeout
+    assert len(log.read_text().splitlines()) == 1
+    assert sample.metrics.status == "error"
+
+
+def test_job_timeout_applies_to_sync_runs(
+    tmp_path, fake_java, crystal, beam, wedge, monkeypatch
+):
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "3")
+    with JVMWorkerPool(size=1, job_timeout=0.5) as pool:
+        sample = make_sample(tmp_path, crystal, beam, wedge, pool=pool)
+        with pytest.raises(TimeoutError):
+            sample.run()
+        assert pool._workers == 0
+        assert pool.available
+
+
+def test_cancellation_kills_the_worker(
+    tmp_path, pool, crystal, beam, wedge, monkeypatch
+):
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "1.5")
+    sample = make_sample(tmp_path, crystal, beam, wedge, pool=pool)
+
+    async def main():
+        task = asyncio.ensure_future(sample.run_async())
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    assert wait_for(lambda: pool._workers == 0)
+    time.sleep(1.5)
+    assert not path.exists(sample.prefix + "Summary.csv")
+    assert pool._running == {}
+
+
+def test_cancelling_a_job_waiting_for_a_worker(
+    tmp_path, pool, crystal, beam, wedge, monkeypatch
+):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    monkeypatch.setenv("FAKE_JAVA_SLEEP", "1")
+    busy = make_sample(tmp_path, crystal, beam, wedge, "busy", pool=pool)
+    waiting = make_sample(tmp_path, crystal, beam, wedge, "waiting", pool=pool)
+
+    async def main():
+        running = asyncio.ensure_future(busy.run_async())
+        await asyncio.sleep(0.3)
+        task = asyncio.ensure_future(waiting.run_async())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await running
+
+    summary = asyncio.run(main())
+
+    assert summary.attrs["metrics"]["mode"] == "pool"
+    assert wait_for(lambda: pool._running == {})
+    assert log.read_text().splitlines() == [busy.input_text_file_path]
+    assert pool._workers == 1
+
+
+def test_failed_jobs_are_not_retried(tmp_path, pool, crystal, beam, wedge, monkeypatch):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    monkeypatch.setenv("FAKE_JAVA_EXIT", "3")
+    sample = make_sample(tmp_path, crystal, beam, wedge, pool=pool)
+
+    with pytest.raises(RadDose3DError) as exc_info:
+        sample.run()
+
+    assert exc_info.value.reason == "exit_code"
+    assert exc_info.value.returncode == 3
+    assert sample.metrics.mode == "pool"
+    assert sample.metrics.status == "error"
+    assert len(log.read_text().splitlines()) == 1
+    assert pool._workers == 0
+    assert pool.available
+
+
+def test_workers_exiting_during_a_job_fall_back_to_a_process(
+    tmp_path, pool, crystal, beam, wedge, monkeypatch
+):
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_JAVA_LOG", str(log))
+    monkeypatch.setenv("FAKE_JAVA_UNGUARDED", "1")
+    sample = make_sample(tmp_path, crystal, beam, wedge, pool=pool)
+
+    summary = sample.run()
+
+    assert summary["Average DWD"].tolist() == [100.0]
+    assert summary.attrs["metrics"]["mode"] == "process"
+    assert len(log.read_text().splitlines()) == 2
+    assert pool._workers == 0
+
+
+def test_dead_idle_workers_are_replaced(tmp_path, pool, crystal, beam, wedge):
+    make_sample(tmp_path, crystal, beam, wedge, "first", pool=pool).run()
+    worker = pool._idle.get_nowait()
+    worker.process.kill()
+    worker.process.wait()
+    pool._idle.put(worker)
+
+    summary = make_sample(tmp_path, crystal, beam, wedge, "second", pool=pool).run()
+
+    assert summary.attrs["metrics"]["mode"] == "pool"
+    replacement = pool._idle.get_nowait()
+    assert replacement is not worker
+    assert replacement.jobs_completed == 1
+    assert pool._workers == 1
+
+
+def test_closed_pool_is_not_used(tmp_path, fake_java, crystal, beam, wedge):
+    pool = JVMWorkerPool(size=1)
+    make_sample(tmp_path, crystal, beam, wedge, "first", pool=pool).run()
+    worker = pool._idle.queue[0]
+
+    pool.close()
+    summary = make_sample(tmp_path, crystal, beam, wedge, "second", pool=pool).run()
+
+    assert not worker.is_alive()
+    assert pool._workers == 0
+    assert summary.attrs["metrics"]["mode"] == "process"
+    with pytest.raises(ValueError):
+        JVMWorkerPool(size=0)